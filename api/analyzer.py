@@ -1,11 +1,9 @@
-import os
-from openai import OpenAI
 from services.database import supabase
+from services import llm
 import json
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def run_retroactive_analysis():
     # 1. Prendi tutti gli articoli che non hanno ancora un 'tone'
@@ -27,7 +25,8 @@ def run_retroactive_analysis():
         """
         
         try:
-            response = client.chat.completions.create(
+            response = llm.chat(
+                "article_analysis",
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={ "type": "json_object" }
@@ -2,25 +2,22 @@
 api/chat.py - SPIZ AI v10
 FIXED:
 - Report genera testo strutturato vero (non JSON grezzo)
-- docx_path prodotto realmente via docx_builder.js
+- docx_path prodotto realmente via docx_builder.js (pool di worker persistenti)
 - Intent "quantitative" ora gestisce lista giornalisti correttamente
 - Fallback robusto se embedding fallisce
+- Memoria di sessione lato server (services/sessions.py) con riassunto progressivo
 """
 
 import os
 import re
 import json
-import subprocess
+import contextvars
 import tempfile
 from datetime import date, timedelta
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from services.database import supabase
-
-ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-_BUILDER_JS = os.path.join(os.path.dirname(__file__), "docx_builder.js")
+from services import sessions, docx_renderer, llm, metrics, analytics
 
 DB_COLS = (
     "id, testata, data, giornalista, occhiello, titolo, sottotitolo, "
@@ -66,7 +63,8 @@ def _date_range(context: str, message: str):
 
 def _semantic_search(from_date: str, to_date: str, user_message: str, limit: int = 200):
     try:
-        emb = ai.embeddings.create(
+        emb = llm.embed(
+            "semantic_query",
             model="text-embedding-3-small",
             input=user_message[:8000],
         ).data[0].embedding
@@ -86,6 +84,19 @@ def _semantic_search(from_date: str, to_date: str, user_message: str, limit: int
         return []
 
 
+def _load_refs(article_ids: list, limit: int = 10):
+    """Ricarica dal DB gli articoli già citati nella sessione (riferimenti strutturati)."""
+    ids = list(article_ids or [])[-limit:]
+    if not ids:
+        return []
+    try:
+        res = supabase.table("articles").select(DB_COLS).in_("id", ids).execute()
+        return res.data or []
+    except Exception as e:
+        print(f"[SPIZ] refs load error: {e}")
+        return []
+
+
 def _fallback_search(from_date: str, to_date: str, limit: int = 100):
     """Ricerca senza embedding quando pgvector non è disponibile."""
     try:
@@ -183,12 +194,15 @@ def _quick_answer(user_message: str, articles: list, stats: dict, history: list
     corpus_txt = "\n---\n".join(lines)
 
     messages = [{"role": "system", "content": f"{_QUICK_SYSTEM}\n\nCORPUS ({len(articles)} articoli):\n{corpus_txt}"}]
-    for msg in (history or [])[-10:]:
-        if msg.get("role") in ("user","assistant") and msg.get("content"):
+    history = history or []
+    memo    = [m for m in history[:1] if m.get("role") == "system"]   # memoria di sessione
+    for msg in memo + [m for m in history if m.get("role") != "system"][-10:]:
+        if msg.get("role") in ("user","assistant","system") and msg.get("content"):
             messages.append({"role": msg["role"], "content": msg["content"]})
     messages.append({"role": "user", "content": user_message})
 
-    resp = ai.chat.completions.create(
+    resp = llm.chat(
+        "quick_answer",
         model="gpt-4o",
         messages=messages,
         temperature=0.1,
@@ -209,8 +223,14 @@ def _quantitative_answer(user_message: str, articles: list, stats: dict) -> str:
         f"TOP GIORNALISTI: {', '.join(f'{k}({v})' for k,v in list(stats.get('giornalisti',{}).items())[:30])}\n"
         f"SENTIMENT: {', '.join(f'{k}: {v}%' for k,v in stats.get('sentiment',{}).items())}\n"
     )
+    if stats.get("ave_totale") is not None:
+        stats_txt += (
+            f"AVE TOTALE: {stats['ave_totale']}\n"
+            f"AVE PER CLIENTE (id): {', '.join(f'{k}({v})' for k,v in stats.get('ave_clienti',{}).items())}\n"
+        )
 
-    resp = ai.chat.completions.create(
+    resp = llm.chat(
+        "quantitative_answer",
         model="gpt-4o",
         messages=[
             {"role": "system", "content": (
@@ -247,7 +267,8 @@ def _map_batch(batch: list, idx: int):
             f"TITOLO: {a.get('titolo')}\nTESTO: {testo}"
         )
     try:
-        resp = ai.chat.completions.create(
+        resp = llm.chat(
+            "map_batch",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": _MAP_SYSTEM},
@@ -264,14 +285,17 @@ def _map_batch(batch: list, idx: int):
         print(f"[MAP] batch {idx} error: {e}")
         return idx, []
 
-def _map_articles_parallel(articles: list, batch_size: int = 5, max_workers: int = 4) -> list:
+def _map_articles_parallel(articles: list, batch_size: int = 5, max_workers: int = 4, on_batch=None) -> list:
     batches = [articles[i:i+batch_size] for i in range(0, len(articles), batch_size)]
     results = [None] * len(batches)
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = {ex.submit(_map_batch, b, i): i for i, b in enumerate(batches)}
-        for f in futures:
+        # copy_context: le chiamate nei thread finiscono nella traccia della richiesta
+        futures = {ex.submit(contextvars.copy_context().run, _map_batch, b, i): i for i, b in enumerate(batches)}
+        for done, f in enumerate(as_completed(futures), 1):
             idx, data = f.result()
             results[idx] = data
+            if on_batch:
+                on_batch(done, len(batches))
     out = []
     for r in results:
         if r:
@@ -309,7 +333,8 @@ def _reduce_to_report(user_message: str, extracted: list, stats: dict) -> str:
     if len(extracted_txt) > 15000:
         extracted_txt = extracted_txt[:15000] + "...]"
 
-    resp = ai.chat.completions.create(
+    resp = llm.chat(
+        "reduce",
         model="gpt-4o",
         messages=[
             {"role": "system", "content": _REPORT_SYSTEM},
@@ -329,28 +354,21 @@ def _reduce_to_report(user_message: str, extracted: list, stats: dict) -> str:
 # DOCX BUILDER
 # ══════════════════════════════════════════════════════════════════════
 
-def _build_docx(report_text: str, title: str = "Report SPIZ") -> str | None:
-    """Chiama docx_builder.js e restituisce il path del file .docx generato."""
-    if not os.path.exists(_BUILDER_JS):
-        print(f"[DOCX] builder non trovato: {_BUILDER_JS}")
-        return None
+def _build_docx(report_text: str, title: str = "Report SPIZ", stats: dict = None, extracted: list = None) -> str | None:
+    """Renderizza il report via pool di worker docx_builder.js e restituisce il path del .docx."""
     try:
         tmp = tempfile.NamedTemporaryFile(suffix=".docx", delete=False, prefix="spiz_report_")
         out_path = tmp.name
         tmp.close()
 
-        payload = json.dumps({"title": title, "content": report_text})
-        result = subprocess.run(
-            ["node", _BUILDER_JS, out_path],
-            input=payload,
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
-        if result.returncode != 0:
-            print(f"[DOCX] node error: {result.stderr}")
-            return None
-        if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+        payload = {
+            "topic":       title,
+            "date":        date.today().strftime("%d/%m/%Y"),
+            "report_text": report_text,
+            "stats":       stats or {},
+            "extracted":   extracted or [],
+        }
+        if docx_renderer.render(payload, out_path) and os.path.getsize(out_path) > 0:
             return out_path
         return None
     except Exception as e:
@@ -358,25 +376,103 @@ def _build_docx(report_text: str, title: str = "Report SPIZ") -> str | None:
         return None
 
 
+# ══════════════════════════════════════════════════════════════════════
+# MEMORIA DI SESSIONE
+# ══════════════════════════════════════════════════════════════════════
+
+_SUMMARY_SYSTEM = """Aggiorna il riassunto di una conversazione tra un utente e SPIZ, analista mediatico.
+Conserva: richieste dell'utente, clienti/temi/periodi discussi, conclusioni e dati numerici chiave.
+Ometti il testo integrale dei report. Italiano, stile telegrafico, nessuna emoji."""
+
+def _summarize_turns(prev_summary: str, turns: list, max_tokens: int) -> str:
+    dialog = "\n".join(f"{t['role'].upper()}: {t['content']}" for t in turns)
+    try:
+        resp = llm.chat(
+            "session_summary",
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": _SUMMARY_SYSTEM},
+                {"role": "user", "content": (
+                    f"RIASSUNTO PRECEDENTE:\n{prev_summary or '(nessuno)'}\n\n"
+                    f"NUOVI TURNI:\n{dialog}"
+                )},
+            ],
+            temperature=0.0,
+            max_tokens=max_tokens,
+        )
+        return resp.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"[SESSION] summary error: {e}")
+        return prev_summary
+
+
+def _remember(session_id: str, message: str, result: dict) -> dict:
+    """Registra il turno nella sessione e lancia la compattazione in background."""
+    if not session_id or "error" in result:
+        return result
+    try:
+        sessions.append_turn(session_id, "user", message)
+        sessions.append_turn(session_id, "assistant", result.get("response", ""), result.get("article_ids"))
+        sessions.compact_async(session_id, _summarize_turns)
+    except Exception as e:
+        print(f"[SESSION] write error: {e}")
+    result["session_id"] = session_id
+    return result
+
+
 # ══════════════════════════════════════════════════════════════════════
 # MAIN ENTRY POINT
 # ══════════════════════════════════════════════════════════════════════
 
-def ask_spiz(message: str, history: list = None, context: str = "general") -> dict:
+def ask_spiz(message: str, history: list = None, context: str = "general", session_id: str = None) -> dict:
     if not message or len(message.strip()) < 2:
         return {"error": "Messaggio troppo corto."}
 
+    refs = []
+    if session_id:
+        try:
+            if not sessions.has_turns(session_id) and history:
+                sessions.import_history(session_id, history)
+                sessions.compact(session_id, _summarize_turns)
+            history = sessions.build_history(session_id)
+            refs    = sessions.cited_articles(session_id)
+        except Exception as e:
+            print(f"[SESSION] read error: {e}")
+
+    result = _answer(message, history, context, refs)
+    return _remember(session_id, message, result)
+
+
+def is_async_report(message: str) -> bool:
+    """Report completi con DOCX: troppo lenti per la richiesta HTTP, vanno in coda (api/report_jobs.py)."""
+    return _detect_intent(message) == "report" and _wants_docx(message)
+
+
+def run_report(message: str, context: str = "general", session_id: str = None, progress=None) -> dict:
+    """
+    Esegue un report fuori dalla richiesta HTTP, sempre con il DOCX.
+    progress(stage, done, total) riceve: retrieved, mapped n/N, reducing, rendering.
+    """
+    result = _answer(message, None, context, [], progress=progress, force_report=True, force_docx=True)
+    return _remember(session_id, message, result)
+
+
+def _answer(message: str, history: list, context: str, refs: list, progress=None,
+            force_report: bool = False, force_docx: bool = False) -> dict:
+    progress = progress or (lambda stage, done=0, total=0: None)
+
     from_date, to_date = _date_range(context, message)
-    intent = _detect_intent(message)
-    wants_docx = _wants_docx(message)
+    intent = "report" if force_report else _detect_intent(message)
+    wants_docx = force_docx or _wants_docx(message)
 
     print(f"[SPIZ] intent={intent} from={from_date} to={to_date} docx={wants_docx}")
 
     # Ricerca semantica con fallback
-    filtered = _semantic_search(from_date, to_date, message, limit=200)
-    if not filtered:
-        print("[SPIZ] semantic vuota, uso fallback")
-        filtered = _fallback_search(from_date, to_date, limit=100)
+    with metrics.timed("retrieval"):
+        filtered = _semantic_search(from_date, to_date, message, limit=200)
+        if not filtered:
+            print("[SPIZ] semantic vuota, uso fallback")
+            filtered = _fallback_search(from_date, to_date, limit=100)
 
     if not filtered:
         return {
@@ -388,15 +484,21 @@ def ask_spiz(message: str, history: list = None, context: str = "general") -> di
         }
 
     stats = _stats(filtered)
+    progress("retrieved", len(filtered), len(filtered))
 
     # ── REPORT ──
     if intent == "report":
-        extracted   = _map_articles_parallel(filtered[:150])
+        extracted   = _map_articles_parallel(
+            filtered[:150], on_batch=lambda done, total: progress("mapped", done, total),
+        )
+        progress("reducing")
         report_text = _reduce_to_report(message, extracted, stats)
 
         docx_path = None
         if wants_docx:
-            docx_path = _build_docx(report_text)
+            progress("rendering")
+            with metrics.timed("docx_render"):
+                docx_path = _build_docx(report_text, stats=stats, extracted=extracted)
 
         return {
             "response":      report_text,
@@ -404,10 +506,17 @@ def ask_spiz(message: str, history: list = None, context: str = "general") -> di
             "docx_path":     docx_path,
             "articles_used": len(filtered),
             "total_period":  len(filtered),
+            "article_ids":   [a.get("id") for a in filtered[:150] if a.get("id")],
         }
 
     # ── QUANTITATIVO ──
     elif intent == "quantitative":
+        # Con lo snapshot analitico le statistiche coprono tutto il periodo, non solo gli articoli recuperati
+        if analytics.ready():
+            try:
+                stats = analytics.period_stats(from_date, to_date) or stats
+            except Exception as e:
+                print(f"[SPIZ] snapshot analitico non disponibile: {e}")
         response_text = _quantitative_answer(message, filtered, stats)
         return {
             "response":      response_text,
@@ -415,15 +524,20 @@ def ask_spiz(message: str, history: list = None, context: str = "general") -> di
             "docx_path":     None,
             "articles_used": len(filtered),
             "total_period":  len(filtered),
+            "article_ids":   [],
         }
 
     # ── QUICK ──
     else:
-        response_text = _quick_answer(message, filtered, stats, history)
+        # Gli articoli già citati in sessione vengono ricaricati per id e messi in testa al corpus
+        cited = [a for a in _load_refs(refs) if a.get("id") not in {f.get("id") for f in filtered[:30]}]
+        corpus = cited + filtered
+        response_text = _quick_answer(message, corpus, stats, history)
         return {
             "response":      response_text,
             "is_report":     False,
             "docx_path":     None,
             "articles_used": len(filtered),
             "total_period":  len(filtered),
+            "article_ids":   [a.get("id") for a in corpus[:30] if a.get("id")],
         }
\ No newline at end of file
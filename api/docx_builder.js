@@ -3,6 +3,10 @@
  * Riceve un JSON con report_text, stats, extracted, topic, date
  * Genera un .docx professionale
  * Uso: node docx_builder.js payload.json output.docx
+ *      node docx_builder.js --worker
+ *        worker persistente: una richiesta JSON per riga su stdin
+ *        {id, out_path, payload} | {id, ping: true}
+ *        e una risposta JSON per riga su stdout {id, ok, bytes?, error?}
  */
 
 const {
@@ -222,17 +226,8 @@ function buildArticlesTable(extracted) {
   ];
 }
 
-// ─── MAIN ────────────────────────────────────────────────────────────
-async function main() {
-  const payloadPath = process.argv[2];
-  const outPath     = process.argv[3];
-
-  if (!payloadPath || !outPath) {
-    console.error('Usage: node docx_builder.js payload.json output.docx');
-    process.exit(1);
-  }
-
-  const payload = JSON.parse(fs.readFileSync(payloadPath, 'utf8'));
+// ─── DOCUMENTO ───────────────────────────────────────────────────────
+async function buildDocument(payload) {
   const { report_text, stats, extracted, topic, date: reportDate } = payload;
 
   const s = stats || {};
@@ -324,7 +319,56 @@ async function main() {
     }]
   });
 
-  const buf = await Packer.toBuffer(doc);
+  return Packer.toBuffer(doc);
+}
+
+// ─── WORKER PERSISTENTE ──────────────────────────────────────────────
+function worker() {
+  const readline = require('readline');
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  const reply = obj => process.stdout.write(JSON.stringify(obj) + '\n');
+
+  rl.on('line', async line => {
+    if (!line.trim()) return;
+    let req;
+    try {
+      req = JSON.parse(line);
+    } catch (e) {
+      reply({ id: null, ok: false, error: 'JSON non valido: ' + e.message });
+      return;
+    }
+    if (req.ping) {
+      reply({ id: req.id, ok: true, pong: true });
+      return;
+    }
+    try {
+      const buf = await buildDocument(req.payload || {});
+      fs.writeFileSync(req.out_path, buf);
+      reply({ id: req.id, ok: true, bytes: buf.length });
+    } catch (e) {
+      reply({ id: req.id, ok: false, error: String(e && e.stack || e) });
+    }
+  });
+  rl.on('close', () => process.exit(0));
+}
+
+// ─── MAIN ────────────────────────────────────────────────────────────
+async function main() {
+  if (process.argv[2] === '--worker') {
+    worker();
+    return;
+  }
+
+  const payloadPath = process.argv[2];
+  const outPath     = process.argv[3];
+
+  if (!payloadPath || !outPath) {
+    console.error('Usage: node docx_builder.js payload.json output.docx | node docx_builder.js --worker');
+    process.exit(1);
+  }
+
+  const payload = JSON.parse(fs.readFileSync(payloadPath, 'utf8'));
+  const buf = await buildDocument(payload);
   fs.writeFileSync(outPath, buf);
   console.log('OK: ' + outPath);
 }
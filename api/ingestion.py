@@ -1,11 +1,7 @@
-import os
-import pandas as pd
 import hashlib
 import datetime
 from services.database import supabase
-from openai import OpenAI
-
-ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services import llm, mentions, rollups, http_cache
 
 def clean_text(s):
     return ' '.join(str(s).strip().lower().split())
@@ -21,6 +17,7 @@ def generate_content_hash(row: dict) -> str:
     return hashlib.sha256('|'.join(key_fields).encode('utf-8')).hexdigest()
 
 def parse_date(date_val) -> str:
+    import pandas as pd
     if pd.isna(date_val) or str(date_val).strip() == '':
         return datetime.date.today().isoformat()
     try:
@@ -29,6 +26,7 @@ def parse_date(date_val) -> str:
         return str(date_val)
 
 def parse_ave(value) -> float:
+    import pandas as pd
     if pd.isna(value) or str(value).strip() == '':
         return 0.0
     try:
@@ -37,6 +35,7 @@ def parse_ave(value) -> float:
         return 0.0
 
 def normalize_macrosettori(value) -> str:
+    import pandas as pd
     if pd.isna(value) or str(value).strip() == '':
         return ''
     tags = [t.strip() for t in str(value).replace(';', ',').split(',') if t.strip()]
@@ -51,7 +50,7 @@ def generate_embedding(text: str):
     try:
         if not text or len(text.strip()) == 0:
             text = "nessun contenuto"
-        resp = ai.embeddings.create(model="text-embedding-ada-002", input=text[:8000])
+        resp = llm.embed("ingestion_embedding", model="text-embedding-ada-002", input=text[:8000])
         return resp.data[0].embedding
     except Exception as e:
         print(f"Embedding error: {e}")
@@ -82,6 +81,7 @@ COLUMN_MAPPING = {
 }
 
 def process_csv(file_path: str) -> dict:
+    import pandas as pd   # caricato solo all'ingestion: l'avvio del server non lo paga
     try:
         try:
             df = pd.read_csv(file_path, sep=None, engine='python', encoding='utf-8')
@@ -127,11 +127,28 @@ def process_csv(file_path: str) -> dict:
                 seen_hashes[r['content_hash']] = r
         records_deduped = list(seen_hashes.values())
         dup_csv = len(records) - len(records_deduped)
+        # Articoli già presenti: la versione precedente esce dai rollup
+        try:
+            previous = rollups.snapshot(content_hashes=list(seen_hashes))
+        except Exception as e:
+            print(f"ERRORE ROLLUP (lettura precedenti): {e}")
+            previous = []
         result = supabase.table('articles').upsert(records_deduped, on_conflict='content_hash').execute()
         inserted_data = result.data or []
         inserted = len(inserted_data)
         skipped = len(records_deduped) - inserted
         new_ids = [r['id'] for r in inserted_data if r.get('id')]
+        try:
+            mention_rows = mentions.index_articles(inserted_data)
+        except Exception as e:
+            print(f"ERRORE INDICE CITAZIONI: {e}")
+            mention_rows = []
+        try:
+            rollups.apply(previous, -1)
+            rollups.apply(rollups.with_clients(inserted_data, mention_rows), +1)
+        except Exception as e:
+            print(f"ERRORE ROLLUP: {e}")
+        http_cache.bump("articles", "mentions")
         if new_ids:
             embed_articles(new_ids)
         return {'status': 'success', 'message': f"Elaborati {len(records)} articoli ({dup_csv} duplicati). Inseriti: {inserted}. Presenti: {skipped}. Embedding: {len(new_ids)}."}
@@ -4,13 +4,13 @@ Analizza un comunicato stampa e suggerisce i giornalisti più adatti.
 FIXED: firma pitch_advisor compatibile con main.py (message, client_id, history)
 """
 
-import os
 import re
 import json
-from openai import OpenAI
-from services.database import supabase
+from collections import Counter, defaultdict
+from services import llm, bulk, rollups, analytics
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SKIP_GIORNALISTI = {'', 'N.D.', 'N/D', 'Redazione', 'Autore non indicato'}
+TITOLI_BATCH     = 50    # giornalisti per lettura dei titoli (filtro in_)
 
 
 # ─── STEP 1: Analizza il comunicato ───────────────────────────────────────────
@@ -18,7 +18,8 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 def analizza_comunicato(testo: str) -> dict:
     """Estrae tema, settori, tono e keyword dal comunicato."""
     try:
-        response = client.chat.completions.create(
+        response = llm.chat(
+            "pitch_analysis",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": (
@@ -52,22 +53,32 @@ def analizza_comunicato(testo: str) -> dict:
 # ─── STEP 2: Carica giornalisti dal DB ────────────────────────────────────────
 
 def carica_giornalisti(giorni: int = 180) -> list:
-    """Carica tutti gli articoli recenti raggruppati per giornalista."""
+    """
+    Profili dei giornalisti attivi negli ultimi `giorni`. Con lo snapshot
+    analitico arrivano già completi (titoli e ultimi 3 articoli). Con i rollup
+    costruiti i profili hanno solo conteggi, testata e macrosettori
+    ("titoli" è None): i titoli si leggono poi con carica_titoli() solo per
+    i candidati che servono.
+    """
     try:
         from datetime import date, timedelta
         from_date = (date.today() - timedelta(days=giorni)).isoformat()
-
-        res = supabase.table("articles").select(
-            "giornalista, testata, titolo, macrosettori, tipologia_articolo, data"
-        ).gte("data", from_date).execute()
-
-        articles = res.data or []
-        SKIP = {'', 'N.D.', 'N/D', 'Redazione', 'Autore non indicato'}
-
+        if analytics.ready():
+            try:
+                return analytics.journalist_profiles(from_date, date.today().isoformat(), skip=SKIP_GIORNALISTI)
+            except Exception as e:
+                print(f"[PITCH] snapshot analitico non disponibile: {e}")
+        if rollups.is_ready():
+            return _profili_rollup(from_date, date.today().isoformat())
+
+        articles = bulk.iter_rows(
+            "articles", "id, giornalista, testata, titolo, macrosettori, tipologia_articolo, data",
+            where=lambda q: q.gte("data", from_date),
+        )
         giornalisti = {}
         for a in articles:
             g = (a.get('giornalista') or '').strip()
-            if not g or g in SKIP:
+            if not g or g in SKIP_GIORNALISTI:
                 continue
             if g not in giornalisti:
                 giornalisti[g] = {
@@ -86,6 +97,7 @@ def carica_giornalisti(giorni: int = 180) -> list:
 
         for g in giornalisti.values():
             g["macrosettori"] = list(g["macrosettori"])
+            g["n_articoli"] = len(g["articoli"])
 
         return list(giornalisti.values())
     except Exception as e:
@@ -93,6 +105,46 @@ def carica_giornalisti(giorni: int = 180) -> list:
         return []
 
 
+def _profili_rollup(from_date: str, to_date: str) -> list:
+    testate, macros = defaultdict(Counter), defaultdict(set)
+    for g, t, n, _ in rollups.totals("giornalista.testata", from_date, to_date):
+        testate[g][t] += n
+    for g, m, _, _ in rollups.totals("giornalista.macrosettore", from_date, to_date):
+        macros[g].add(m)
+    profili = []
+    for g, _, n, _ in rollups.totals("giornalista", from_date, to_date):
+        if g.strip() in SKIP_GIORNALISTI:
+            continue
+        profili.append({
+            "nome":         g,
+            "testata":      testate[g].most_common(1)[0][0] if testate[g] else 'N/D',
+            "n_articoli":   n,
+            "macrosettori": sorted(macros[g]),
+            "articoli":     None,
+            "titoli":       None,
+            "_from":        from_date,
+        })
+    return profili
+
+
+def carica_titoli(profili: list) -> None:
+    """Completa articoli e titoli dei profili costruiti dai rollup."""
+    todo = [p for p in profili if p.get("titoli") is None]
+    for i in range(0, len(todo), TITOLI_BATCH):
+        batch = {p["nome"]: p for p in todo[i:i + TITOLI_BATCH]}
+        for p in batch.values():
+            p["articoli"], p["titoli"] = [], []
+        from_date = min(p["_from"] for p in batch.values())
+        for a in bulk.iter_rows(
+            "articles", "id, giornalista, titolo, data",
+            where=lambda q: q.in_("giornalista", list(batch)).gte("data", from_date),
+        ):
+            p = batch.get(a.get("giornalista"))
+            if p:
+                p["articoli"].append(a)
+                p["titoli"].append(a.get("titolo", ""))
+
+
 # ─── STEP 3: Scoring affinità ─────────────────────────────────────────────────
 
 def calcola_score(giornalista: dict, analisi: dict) -> float:
@@ -110,21 +162,46 @@ def calcola_score(giornalista: dict, analisi: dict) -> float:
         if kw in titoli_text:
             score += 1.5
 
-    n_articoli = len(giornalista.get('articoli', []))
+    n_articoli = giornalista.get('n_articoli', len(giornalista.get('articoli') or []))
     score += min(n_articoli / 10, 2.0)
 
     return round(score, 2)
 
 
+def seleziona_top(giornalisti: list, analisi: dict, top_n: int) -> list:
+    """
+    I top_n (giornalista, score) con score > 0. Per i profili senza titoli
+    il contributo delle keyword (al più 1.5 per keyword) si calcola solo
+    per i candidati che, con quel massimo, possono ancora entrare nei top_n.
+    """
+    bonus_max = 1.5 * len(analisi.get('keywords', []))
+    massimo   = [(calcola_score(dict(g, titoli=[]), analisi) + bonus_max, g) for g in giornalisti]
+    candidati = [g for _, g in sorted(massimo, key=lambda x: -x[0])]
+    massimo   = {id(g): m for m, g in massimo}
+
+    scored = []
+    for i in range(0, len(candidati), TITOLI_BATCH):
+        soglia = sorted((s for _, s in scored), reverse=True)[top_n - 1] if len(scored) >= top_n else 0
+        batch  = [g for g in candidati[i:i + TITOLI_BATCH] if massimo[id(g)] > soglia]
+        if not batch:
+            break
+        carica_titoli(batch)
+        scored += [(g, calcola_score(g, analisi)) for g in batch]
+    scored = [(g, s) for g, s in scored if s > 0]
+    scored.sort(key=lambda x: (-x[1], -x[0]['n_articoli'], x[0]['nome']))
+    return scored[:top_n]
+
+
 # ─── STEP 4: Genera spiegazione con AI ────────────────────────────────────────
 
 def genera_spiegazione(giornalista: dict, analisi: dict, score: float) -> str:
     try:
         macrosettori = ', '.join(giornalista['macrosettori'][:5]) or 'vari settori'
-        n = len(giornalista['articoli'])
+        n = giornalista['n_articoli']
         titoli_sample = '; '.join(giornalista['titoli'][:3])
 
-        response = client.chat.completions.create(
+        response = llm.chat(
+            "pitch_explanation",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": (
@@ -146,7 +223,7 @@ def genera_spiegazione(giornalista: dict, analisi: dict, score: float) -> str:
         )
         return response.choices[0].message.content.strip()
     except Exception:
-        n = len(giornalista['articoli'])
+        n = giornalista['n_articoli']
         return f"Ha scritto {n} articoli su {', '.join(giornalista['macrosettori'][:2]) or 'temi affini'}."
 
 
@@ -174,10 +251,7 @@ def pitch_advisor(message: str, client_id: str = "", history: list = None, top_n
     if not giornalisti:
         return {"error": "Nessun giornalista nel database. Carica prima dei CSV."}
 
-    scored = [(g, calcola_score(g, analisi)) for g in giornalisti]
-    scored = [(g, s) for g, s in scored if s > 0]
-    scored.sort(key=lambda x: -x[1])
-    top = scored[:top_n]
+    top = seleziona_top(giornalisti, analisi, top_n)
 
     if not top:
         return {"error": "Nessun giornalista affine trovato. Arricchisci il database con più CSV."}
@@ -191,7 +265,7 @@ def pitch_advisor(message: str, client_id: str = "", history: list = None, top_n
             "nome":             g['nome'],
             "testata":          g['testata'],
             "score":            score,
-            "n_articoli":       len(g['articoli']),
+            "n_articoli":       g['n_articoli'],
             "macrosettori":     g['macrosettori'][:5],
             "spiegazione":      spiegazione,
             "articoli_recenti": [
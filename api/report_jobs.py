@@ -0,0 +1,196 @@
+"""
+api/report_jobs.py — Coda asincrona dei report
+I report completi (map su decine di batch + reduce da 8.000 token + DOCX)
+non stanno nei timeout del proxy: vengono accodati, eseguiti da un pool
+limitato di worker e interrogati via polling o stream di progresso.
+Lo stato vive nell'archivio locale e sopravvive al riavvio del processo:
+i job rimasti in sospeso vengono ripresi all'avvio.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services.local_store import connect, register_schema
+
+MAX_WORKERS   = int(os.getenv("SPIZ_REPORT_WORKERS", "2"))
+MAX_PENDING   = int(os.getenv("SPIZ_REPORT_MAX_PENDING", "20"))
+HEARTBEAT_SEC = 15
+STALE_SEC     = 90     # job "running" senza heartbeat da più di così: il worker è morto
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id            TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,            -- queued | running | done | error
+    stage         TEXT NOT NULL DEFAULT 'queued',
+    done          INTEGER NOT NULL DEFAULT 0,
+    total         INTEGER NOT NULL DEFAULT 0,
+    message       TEXT NOT NULL,
+    context       TEXT NOT NULL DEFAULT 'general',
+    session_id    TEXT,
+    response      TEXT,
+    docx_token    TEXT,
+    articles_used INTEGER NOT NULL DEFAULT 0,
+    error         TEXT,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    heartbeat     REAL
+);
+CREATE INDEX IF NOT EXISTS report_jobs_status ON report_jobs(status, created_at);
+""")
+
+_executor   = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="report-job")
+_running: set = set()
+_lock       = threading.Lock()
+_store_docx = None
+_started    = False
+
+_FIELDS = ("id", "status", "stage", "done", "total", "response", "docx_token",
+           "articles_used", "error", "created_at", "updated_at")
+
+
+# ══════════════════════════════════════════════════════════════════════
+# API
+# ══════════════════════════════════════════════════════════════════════
+
+def start(store_docx) -> None:
+    """Avvia heartbeat e ripresa dei job pendenti. store_docx(path) -> token."""
+    global _store_docx, _started
+    _store_docx = store_docx
+    if _started:
+        return
+    _started = True
+    threading.Thread(target=_heartbeat_loop, daemon=True).start()
+    resume_pending()
+
+
+def submit(message: str, context: str = "general", session_id: str = None) -> dict:
+    conn = connect()
+    pending = conn.execute(
+        "SELECT COUNT(*) FROM report_jobs WHERE status IN ('queued', 'running')"
+    ).fetchone()[0]
+    if pending >= MAX_PENDING:
+        return {"error": f"Troppi report in coda ({pending}). Riprova tra qualche minuto."}
+
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    conn.execute(
+        "INSERT INTO report_jobs (id, status, message, context, session_id, created_at, updated_at) "
+        "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+        (job_id, message, context or "general", session_id, now, now),
+    )
+    _enqueue(job_id)
+    return get(job_id)
+
+
+def get(job_id: str) -> dict | None:
+    row = connect().execute(
+        f"SELECT {', '.join(_FIELDS)} FROM report_jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    if job["status"] == "queued":
+        job["position"] = connect().execute(
+            "SELECT COUNT(*) FROM report_jobs WHERE status = 'queued' AND created_at < ?",
+            (job["created_at"],),
+        ).fetchone()[0]
+    return job
+
+
+def resume_pending() -> int:
+    """Rimette in coda i job queued e quelli running rimasti orfani (heartbeat scaduto)."""
+    conn   = connect()
+    cutoff = time.time() - STALE_SEC
+    rows = conn.execute(
+        "SELECT id FROM report_jobs WHERE status = 'queued' "
+        "OR (status = 'running' AND COALESCE(heartbeat, updated_at) < ?) ORDER BY created_at",
+        (cutoff,),
+    ).fetchall()
+    for r in rows:
+        conn.execute(
+            "UPDATE report_jobs SET status = 'queued', stage = 'queued', updated_at = ? WHERE id = ?",
+            (time.time(), r["id"]),
+        )
+        _enqueue(r["id"])
+    if rows:
+        print(f"[REPORT JOB] Ripresi {len(rows)} job pendenti")
+    return len(rows)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ESECUZIONE
+# ══════════════════════════════════════════════════════════════════════
+
+def _enqueue(job_id: str) -> None:
+    _executor.submit(_run, job_id)
+
+
+def _update(job_id: str, **fields) -> None:
+    fields["updated_at"] = time.time()
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    connect().execute(f"UPDATE report_jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _claim(job_id: str) -> dict | None:
+    """Passa il job a running solo se è ancora queued (un solo worker lo esegue)."""
+    conn = connect()
+    now  = time.time()
+    cur  = conn.execute(
+        "UPDATE report_jobs SET status = 'running', stage = 'retrieving', heartbeat = ?, updated_at = ? "
+        "WHERE id = ? AND status = 'queued'", (now, now, job_id),
+    )
+    if cur.rowcount != 1:
+        return None
+    return dict(conn.execute("SELECT message, context, session_id FROM report_jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def _run(job_id: str) -> None:
+    from api.chat import run_report
+
+    job = _claim(job_id)
+    if not job:
+        return
+    with _lock:
+        _running.add(job_id)
+    started = time.time()
+    try:
+        def progress(stage, done=0, total=0):
+            _update(job_id, stage=stage, done=done, total=total, heartbeat=time.time())
+
+        result = run_report(job["message"], job["context"], job["session_id"], progress=progress)
+        if "error" in result:
+            _update(job_id, status="error", stage="error", error=result["error"])
+            return
+
+        token = None
+        if result.get("docx_path") and _store_docx:
+            token = _store_docx(result["docx_path"])
+        _update(
+            job_id,
+            status="done", stage="done",
+            response=result.get("response", ""),
+            docx_token=token,
+            articles_used=result.get("articles_used", 0),
+        )
+        print(f"[REPORT JOB] {job_id} completato in {time.time() - started:.1f}s")
+    except Exception as e:
+        print(f"[REPORT JOB] {job_id} errore: {e}")
+        _update(job_id, status="error", stage="error", error=str(e))
+    finally:
+        with _lock:
+            _running.discard(job_id)
+
+
+def _heartbeat_loop() -> None:
+    while True:
+        time.sleep(HEARTBEAT_SEC)
+        with _lock:
+            ids = list(_running)
+        for job_id in ids:
+            try:
+                connect().execute("UPDATE report_jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+            except Exception as e:
+                print(f"[REPORT JOB] heartbeat error: {e}")
@@ -0,0 +1,145 @@
+"""
+bench/corpus.py — Corpus sintetico per i benchmark
+Articoli con testo "italianeggiante", testate, giornalisti, macrosettori,
+clienti con keyword, CSV per l'ingestion e feed RSS (con le pagine degli
+articoli) da servire in HTTP locale per il monitor.
+Tutto deterministico a parità di seed.
+"""
+
+import csv
+import os
+import random
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from services.fake_openai import fake_embedding
+
+WORDS = (
+    "governo mercato energia banca industria lavoro sindacato impresa crescita export "
+    "regione comune sanità scuola università ricerca innovazione digitale transizione "
+    "investimenti finanziamento bilancio utili ricavi azionisti consiglio amministrazione "
+    "accordo strategia piano sviluppo territorio infrastrutture trasporti porto ferrovia "
+    "ministro presidente direttore amministratore delegato intervista dichiarazione "
+    "sostenibilità ambiente clima rinnovabili gas elettricità prezzi inflazione tassi "
+    "europa italia milano roma torino napoli bologna firenze venezia genova"
+).split()
+
+TESTATE = [
+    "Corriere della Sera", "la Repubblica", "Il Sole 24 Ore", "La Stampa", "Il Messaggero",
+    "Il Giornale", "Avvenire", "Il Fatto Quotidiano", "Milano Finanza", "Italia Oggi",
+    "Il Resto del Carlino", "La Nazione", "Il Mattino", "Il Secolo XIX", "Il Gazzettino",
+]
+
+NOMI    = "Marco Giulia Luca Francesca Andrea Chiara Paolo Elena Stefano Sara Giorgio Anna".split()
+COGNOMI = "Rossi Bianchi Romano Colombo Ricci Marino Greco Bruno Gallo Conti Costa Fontana Moretti".split()
+
+MACROSETTORI = ["Energia", "Finanza", "Politica", "Industria", "Sanità", "Trasporti",
+                "Tecnologia", "Ambiente", "Lavoro", "Infrastrutture"]
+
+TONES = ["Positivo", "Neutro", "Negativo"]
+RISKS = ["Basso", "Medio", "Alto"]
+
+
+def _sentence(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def make_clients(n: int = 20, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    clients = []
+    for i in range(n):
+        name = f"Cliente{i:02d} {rnd.choice(['Spa', 'Group', 'Holding', 'Energia'])}"
+        kws  = [f"cliente{i:02d}"] + rnd.sample(WORDS, 2)
+        clients.append({"id": f"client-{i}", "name": name, "keywords": ", ".join(kws)})
+    return clients
+
+
+def make_articles(n: int, days: int = 365, seed: int = 1, embed_fraction: float = 1.0,
+                  clients: list = None, text_words: int = 250) -> list:
+    rnd     = random.Random(seed)
+    today   = date.today()
+    journos = [f"{rnd.choice(NOMI)} {rnd.choice(COGNOMI)}" for _ in range(max(20, n // 200))]
+    clients = clients or []
+    rows = []
+    for i in range(n):
+        body = " ".join(_sentence(rnd, rnd.randint(8, 20)) for _ in range(text_words // 14))
+        if clients and rnd.random() < 0.15:
+            body += f" Intervento di {rnd.choice(clients)['keywords'].split(',')[0]} sul tema."
+        titolo = _sentence(rnd, rnd.randint(5, 10))
+        row = {
+            "id":                 i + 1,
+            "titolo":             titolo,
+            "occhiello":          _sentence(rnd, 6),
+            "sottotitolo":        _sentence(rnd, 8),
+            "testata":            rnd.choice(TESTATE),
+            "data":               (today - timedelta(days=rnd.randint(0, days))).isoformat(),
+            "giornalista":        rnd.choice(journos) if rnd.random() > 0.1 else "Redazione",
+            "testo_completo":     body,
+            "macrosettori":       ", ".join(rnd.sample(MACROSETTORI, rnd.randint(1, 3))),
+            "tipologia_articolo": rnd.choice(["Articolo", "Intervista", "Editoriale"]),
+            "ave":                round(rnd.uniform(100, 20000), 2),
+            "tipo_fonte":         "Stampa",
+            "tone":               rnd.choice(TONES),
+            "dominant_topic":     rnd.choice(MACROSETTORI),
+            "reputational_risk":  rnd.choice(RISKS),
+            "political_risk":     "Basso",
+            "content_hash":       f"bench-{seed}-{i}",
+            "embedding":          None,
+        }
+        if rnd.random() < embed_fraction:
+            row["embedding"] = fake_embedding(f"{titolo} {body[:500]}")
+        rows.append(row)
+    return rows
+
+
+def write_csv(path: str, n: int, seed: int = 2) -> str:
+    """CSV nel formato atteso da api/ingestion.process_csv."""
+    rows = make_articles(n, seed=seed, embed_fraction=0.0)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["testata", "data_testata", "autore", "occhiello", "titolo", "sottotitolo",
+                    "testo", "macrosettori", "tipologia_articolo", "ave", "tipo_fonte"])
+        for r in rows:
+            d = date.fromisoformat(r["data"]).strftime("%d/%m/%Y")
+            w.writerow([r["testata"], d, r["giornalista"], r["occhiello"], r["titolo"],
+                        r["sottotitolo"], r["testo_completo"], r["macrosettori"],
+                        r["tipologia_articolo"], str(r["ave"]).replace(".", ","), r["tipo_fonte"]])
+    return path
+
+
+def write_feeds(directory: str, n_feeds: int, base_url: str, entries: int = 30,
+                clients: list = None, seed: int = 3) -> list:
+    """
+    Feed RSS e pagine degli articoli in `directory`, da servire in HTTP
+    su `base_url` (il fetcher del monitor scarica solo http/https), e
+    relative righe monitored_sources.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(directory, "a"), exist_ok=True)
+    sources = []
+    for f in range(n_feeds):
+        items = []
+        for e in range(entries):
+            title = _sentence(rnd, rnd.randint(6, 12))
+            if clients and rnd.random() < 0.2:
+                title += f" {rnd.choice(clients)['keywords'].split(',')[0]}"
+            body = " ".join(_sentence(rnd, 40) for _ in range(6))
+            if clients and rnd.random() < 0.05:
+                body += f" {rnd.choice(clients)['keywords'].split(',')[0]}"
+            with open(os.path.join(directory, "a", f"{f}_{e}.html"), "w", encoding="utf-8") as fh:
+                fh.write(f"<html><head><title>{escape(title)}</title></head><body>"
+                         f"<div class='article-body'><p>{escape(body)}</p></div></body></html>")
+            link = f"{base_url}/a/{f}_{e}.html"
+            items.append(
+                f"<item><title>{escape(title)}</title>"
+                f"<link>{link}</link>"
+                f"<guid>{link}</guid>"
+                f"<description>{escape(_sentence(rnd, 30))}</description></item>"
+            )
+        with open(os.path.join(directory, f"feed_{f}.xml"), "w", encoding="utf-8") as fh:
+            fh.write('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+                     f"<title>Feed {f}</title>{''.join(items)}</channel></rss>")
+        sources.append({"id": f"src-{f}", "name": f"Feed {f}", "url": f"{base_url}/feed_{f}.xml",
+                        "active": True, "type": "rss"})
+    return sources
@@ -0,0 +1,341 @@
+"""
+bench/run.py — Benchmark end-to-end dei percorsi caldi di SPIZ
+Gira interamente sugli stand-in locali (SPIZ_DB_BACKEND=memory,
+SPIZ_OPENAI_BACKEND=fake) con un corpus sintetico di dimensione
+configurabile, scrive i risultati in JSON e li confronta con una baseline.
+
+Uso:
+    python -m bench.run --articles 10000
+    python -m bench.run --articles 100000 --scenarios chat,dashboard
+    python -m bench.run --save-baseline          # aggiorna bench/baseline.json
+
+Esce con codice 1 se uno scenario fallisce o se una metrica peggiora
+oltre la tolleranza.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE    = os.path.join(BENCH_DIR, "baseline.json")
+
+SCENARIOS = ["ingestion", "embeddings", "chat", "dashboard", "pitch", "monitor"]
+
+# Metriche confrontate con la baseline: "lower" = più basso è meglio
+DIRECTION = {"p50_ms": "lower", "p95_ms": "lower", "total_s": "lower", "per_sec": "higher"}
+
+
+def _setup_env(workdir: str, llm_latency: str) -> None:
+    """Va fatto prima di importare i moduli dell'app: database e llm leggono l'env all'import."""
+    os.environ["SPIZ_DB_BACKEND"]     = "memory"
+    os.environ["SPIZ_OPENAI_BACKEND"] = "fake"
+    os.environ["SPIZ_LOCAL_DB"]       = os.path.join(workdir, "spiz_local.db")
+    os.environ["SPIZ_ARTIFACT_DIR"]   = os.path.join(workdir, "reports")
+    os.environ.setdefault("SPIZ_FAKE_LLM_CHAT", llm_latency)
+    os.environ.setdefault("SPIZ_FAKE_LLM_EMBED", "0" if llm_latency == "0" else "40:0.3")
+    os.environ.setdefault("SPIZ_FAKE_LLM_TOKENS_PER_SEC", "1000000" if llm_latency == "0" else "80")
+    os.environ.setdefault("SPIZ_FULLTEXT_HOST_DELAY", "0")   # feed e pagine da un solo host locale
+    os.environ.pop("SPIZ_FAKE_DB_PATH", None)
+
+
+def _summary(samples: list) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return {
+        "runs":   len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def _time(fn, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return _summary(samples)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# SCENARI
+# ══════════════════════════════════════════════════════════════════════
+
+def bench_ingestion(ctx: dict) -> dict:
+    from bench.corpus import write_csv
+    from api.ingestion import process_csv
+
+    path = write_csv(os.path.join(ctx["workdir"], "ingest.csv"), ctx["csv_rows"])
+    t0 = time.perf_counter()
+    res = process_csv(path)
+    elapsed = time.perf_counter() - t0
+    return {
+        "rows":    ctx["csv_rows"],
+        "status":  res.get("status"),
+        "total_s": round(elapsed, 3),
+        "per_sec": round(ctx["csv_rows"] / elapsed, 1) if elapsed else None,
+    }
+
+
+def bench_embeddings(ctx: dict) -> dict:
+    import generate_embeddings as ge
+    from services.database import supabase
+
+    articles = supabase.store.tables.get("articles", [])
+    pending  = [r for r in articles if not r.get("embedding")]
+    todo     = min(len(pending), ctx["backfill"])
+    # gli articoli oltre --backfill escono dalla tabella per la durata dello scenario
+    parked = {id(r) for r in pending[todo:]}
+    supabase.store.tables["articles"] = [r for r in articles if id(r) not in parked]
+    ge.SLEEP_BETWEEN_BATCHES = 0
+    ge.SLEEP_BETWEEN_ARTICLES = 0
+    t0 = time.perf_counter()
+    ge.main()
+    elapsed = time.perf_counter() - t0
+    supabase.store.tables["articles"].extend(pending[todo:])
+    return {
+        "articles": todo,
+        "total_s":  round(elapsed, 3),
+        "per_sec":  round(todo / elapsed, 1) if elapsed else None,
+    }
+
+
+CHAT_PROMPTS = {
+    "quick":        "Cosa scrivono i giornali sull'energia?",
+    "quantitative": "Quanti articoli sono usciti questo mese per testata?",
+    "report":       "Fammi un report sulla transizione energetica degli ultimi 3 mesi",
+}
+
+
+def bench_chat(ctx: dict) -> dict:
+    from api.chat import ask_spiz
+
+    out = {}
+    for kind, prompt in CHAT_PROMPTS.items():
+        runs = ctx["runs"] if kind != "report" else max(1, ctx["runs"] // 3)
+        out[kind] = _time(lambda: ask_spiz(prompt, history=[], context="general"), runs)
+    return out
+
+
+def bench_dashboard(ctx: dict) -> dict:
+    import main
+
+    today  = date.today()
+    since  = (today - timedelta(days=30)).isoformat()
+    calls = {
+        "dashboard_stats": lambda: main.dashboard_stats(),
+        "today_stats":     lambda: main.today_stats(),
+        "today_mentions":  lambda: main.today_mentions(),
+        "top_giornalisti": lambda: main.top_giornalisti(period="30days", limit=20),
+        "client_articles": lambda: main.get_client_articles("client-0", since, today.isoformat()),
+        "articles":        lambda: main.get_articles(from_date=since, to_date=None, testata=None, limit=50),
+        "journalists":     lambda: main.get_journalists(from_date=since, to_date=None),
+    }
+    return {name: _time(lambda: asyncio.run(call()), ctx["runs"]) for name, call in calls.items()}
+
+
+def bench_pitch(ctx: dict) -> dict:
+    from api.pitch import pitch_advisor
+
+    comunicato = (
+        "Cliente00 Spa annuncia un piano di investimenti da 200 milioni per la transizione "
+        "energetica: nuovi impianti rinnovabili in Lombardia e accordi con le università "
+        "per la ricerca su idrogeno e accumuli."
+    )
+    return _time(lambda: pitch_advisor(message=comunicato), ctx["runs"])
+
+
+def _serve(directory: str):
+    """Server HTTP locale (thread) per i feed del monitor: (server, url base)."""
+    import functools
+    import threading
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    class Quiet(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Quiet, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True, name="bench-http").start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_monitor(ctx: dict) -> dict:
+    from bench.corpus import write_feeds
+    from services.database import supabase
+    from services import monitor
+
+    directory = os.path.join(ctx["workdir"], "feeds")
+    os.makedirs(directory, exist_ok=True)
+    server, base_url = _serve(directory)
+    try:
+        sources = write_feeds(directory, ctx["feeds"], base_url, clients=ctx["clients"])
+        supabase.store.tables["monitored_sources"] = []
+        supabase.store.seed("monitored_sources", sources)
+        t0 = time.perf_counter()
+        res, per_source = monitor.scan(monitor.load_sources(), monitor.load_clients())
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+    errors = [r["error"] for r in per_source if r["error"]]
+    if per_source and len(errors) == len(per_source):
+        raise RuntimeError(f"tutte le {len(errors)} sorgenti in errore (es. {errors[0]})")
+    if res.get("status") != "ok":
+        raise RuntimeError(res.get("message") or "scansione fallita")
+    return {
+        "feeds":   ctx["feeds"],
+        "found":   res.get("found"),
+        "errors":  len(errors),
+        "total_s": round(elapsed, 3),
+        "per_sec": round(ctx["feeds"] / elapsed, 1) if elapsed else None,
+    }
+
+
+BENCHES = {
+    "ingestion":  bench_ingestion,
+    "embeddings": bench_embeddings,
+    "chat":       bench_chat,
+    "dashboard":  bench_dashboard,
+    "pitch":      bench_pitch,
+    "monitor":    bench_monitor,
+}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# BASELINE
+# ══════════════════════════════════════════════════════════════════════
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            out.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and k in DIRECTION:
+            out[key] = v
+    return out
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metriche peggiorate oltre la tolleranza rispetto alla baseline."""
+    if baseline.get("config", {}).get("articles") != results["config"]["articles"]:
+        print("[BENCH] ⚠️ baseline generata con un corpus di dimensione diversa")
+    cur, base = _flatten(results["scenarios"]), _flatten(baseline.get("scenarios", {}))
+    regressions = []
+    for key, old in base.items():
+        new = cur.get(key)
+        if new is None or not old:
+            continue
+        if DIRECTION[key.rsplit(".", 1)[1]] == "lower":
+            change = (new - old) / old
+        else:
+            change = (old - new) / old
+        if change > tolerance:
+            regressions.append({"metric": key, "baseline": old, "current": new, "worse_by": round(change, 3)})
+    return regressions
+
+
+# ══════════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════════
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark SPIZ su stand-in locali")
+    ap.add_argument("--articles", type=int, default=10_000, help="articoli nel corpus (10k–1M)")
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--embed-fraction", type=float, default=0.9)
+    ap.add_argument("--clients", type=int, default=20)
+    ap.add_argument("--csv-rows", type=int, default=2_000)
+    ap.add_argument("--backfill", type=int, default=500)
+    ap.add_argument("--feeds", type=int, default=20)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--llm-latency", default="0", help="latenza fake LLM 'mediana_ms:sigma', 0 = nessuna")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="spiz_bench_")
+    _setup_env(workdir, args.llm_latency)
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+    from bench.corpus import make_articles, make_clients
+    from services.database import supabase
+
+    t0 = time.perf_counter()
+    clients = make_clients(args.clients, seed=args.seed)
+    supabase.store.seed("clients", clients)
+    supabase.store.seed("articles", make_articles(args.articles, days=args.days, seed=args.seed,
+                                            embed_fraction=args.embed_fraction, clients=clients))
+    print(f"[BENCH] corpus: {args.articles} articoli, {args.clients} clienti "
+          f"in {time.perf_counter() - t0:.1f}s (workdir {workdir})")
+
+    ctx = {
+        "workdir": workdir, "clients": clients, "runs": args.runs,
+        "csv_rows": args.csv_rows, "backfill": args.backfill, "feeds": args.feeds,
+    }
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host":       {"python": platform.python_version(), "machine": platform.machine()},
+        "config":     {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "save_baseline")},
+        "scenarios":  {},
+    }
+    for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        if name not in BENCHES:
+            print(f"[BENCH] scenario sconosciuto: {name}")
+            continue
+        print(f"[BENCH] ▶ {name}")
+        try:
+            results["scenarios"][name] = BENCHES[name](ctx)
+        except Exception as e:
+            print(f"[BENCH] ❌ {name}: {e}")
+            results["scenarios"][name] = {"error": f"{type(e).__name__}: {e}"}
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"[BENCH] risultati: {out}")
+
+    failed = [n for n, r in results["scenarios"].items() if "error" in r]
+    if failed:
+        print(f"[BENCH] ❌ scenari falliti: {', '.join(failed)}")
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"[BENCH] baseline aggiornata: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("[BENCH] nessuna baseline: usa --save-baseline per crearla")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print(f"[BENCH] 🔻 {r['metric']}: {r['baseline']} → {r['current']} (+{r['worse_by']:.0%})")
+    if regressions:
+        return 1
+    print(f"[BENCH] ✅ nessuna regressione oltre il {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,14 @@
-import os
 import time
-from openai import OpenAI
 from services.database import supabase
+from services import llm
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Configurazione
 BATCH_SIZE = 50
 SLEEP_BETWEEN_BATCHES = 2
+SLEEP_BETWEEN_ARTICLES = 0.5
 MODEL = "text-embedding-ada-002"
 
 def get_articles_without_embedding(limit=BATCH_SIZE):
@@ -40,7 +39,8 @@ def generate_embedding(text):
         text = "nessun contenuto"
     try:
         # Nuova sintassi per openai>=1.0.0
-        response = client.embeddings.create(
+        response = llm.embed(
+            "embedding_backfill",
             model=MODEL,
             input=text[:8000]
         )
@@ -81,7 +81,7 @@ def main():
             else:
                 print(f"  ❌ ID {art['id']} embedding non generato")
 
-            time.sleep(0.5)
+            time.sleep(SLEEP_BETWEEN_ARTICLES)
 
         total_processed += len(articles)
         print(f"⏳ Pausa di {SLEEP_BETWEEN_BATCHES} secondi...")
@@ -1,12 +1,14 @@
+import time
+_BOOT_T0 = time.perf_counter()
+
 import os
 import shutil
-import uvicorn
 import json
-import uuid
-import time
+import re
+import asyncio
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date, timedelta
@@ -15,55 +17,94 @@ from collections import Counter
 try:
     from api.ingestion import process_csv
     from services.database import supabase
-    from api.chat import ask_spiz
+    from api.chat import ask_spiz, is_async_report
     from api.pitch import pitch_advisor
+    from api import report_jobs
+    from services import artifacts, metrics, keyword_matcher, mentions, pagination, bulk, stats, rollups, trends, http_cache, repository, db, analytics, scheduler, poller, sessions
 except ImportError as e:
     print(f"❌ ERRORE IMPORTAZIONE CORE: {e}")
 
-run_monitoring = None
-try:
-    from services.monitor import run_monitoring
-    from apscheduler.schedulers.background import BackgroundScheduler
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(run_monitoring, 'cron', hour=6, minute=0)
-    scheduler.start()
-    print("✅ Scheduler monitoraggio avviato (ogni giorno alle 06:00)")
-except Exception as e:
-    print(f"⚠️ Scheduler non avviato: {e}")
+# Avvio a freddo (deploy autoscale): pandas, bs4/feedparser, openai e
+# apscheduler si caricano al primo uso o nello startup, non all'import.
+_startup_profile = {"import": time.perf_counter() - _BOOT_T0}
+metrics.describe("spiz_startup_seconds", "Durata dell'avvio per fase (import, servizi in background)")
 
 app = FastAPI(title="SPIZ Intelligence")
+app.add_middleware(http_cache.CompressionMiddleware)
+
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    """ETag dai watermark dei dati sugli endpoint JSON (304 se invariati); le scritture li aggiornano."""
+    path = request.url.path
+    if request.method != "GET":
+        response = await call_next(request)
+        names    = http_cache.written_by(request.method, path)
+        if names and response.status_code < 400:
+            await asyncio.to_thread(http_cache.bump, *names)
+        return response
+
+    etag = await asyncio.to_thread(http_cache.json_etag, path, request.url.query)
+    if not etag:
+        return await call_next(request)
+    if http_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = dict(response.headers)
+    if not http_cache.is_error_body(body):
+        headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(content=body, status_code=200, headers=headers)
 
 os.makedirs("data/raw", exist_ok=True)
 os.makedirs("web", exist_ok=True)
 
-# ── STORAGE TEMPORANEO DOCX ───────────────────────────────────────────
-_DOCX_STORE: dict = {}
-
+# ── ARCHIVIO REPORT (services/artifacts.py) ────────────────────────────
 def _store_docx(path: str) -> str | None:
     if not path or not os.path.exists(path):
         return None
-    token = str(uuid.uuid4())
-    _DOCX_STORE[token] = {"path": path, "expires": time.time() + 3600}
-    return token
-
-def _cleanup_expired_docx():
-    now = time.time()
-    expired = [k for k, v in _DOCX_STORE.items() if now > v["expires"]]
-    for k in expired:
+    filename = f"report_spiz_{date.today().isoformat()}.docx"
+    return artifacts.put(path, filename=filename)
+
+
+@app.on_event("startup")
+def _start_background_services():
+    for name, start, failed in (
+        ("sweeper",   artifacts.start_sweeper,                          "Pulizia report non avviata"),
+        ("jobs",      lambda: report_jobs.start(store_docx=_store_docx), "Coda report non avviata"),
+        ("analytics", analytics.start_refresher,                        "Snapshot analitico non avviato"),
+        ("scheduler", scheduler.start,                                  "Scheduler non avviato"),
+    ):
+        t0 = time.perf_counter()
         try:
-            p = _DOCX_STORE[k]["path"]
-            if os.path.exists(p):
-                os.remove(p)
-        except Exception:
-            pass
-        del _DOCX_STORE[k]
+            start()
+        except Exception as e:
+            print(f"⚠️ {failed}: {e}")
+        _startup_profile[name] = time.perf_counter() - t0
+    _startup_profile["total"] = time.perf_counter() - _BOOT_T0
+    for phase, seconds in _startup_profile.items():
+        metrics.observe("spiz_startup_seconds", seconds, {"phase": phase})
+    print("[STARTUP] " + " · ".join(f"{k} {v * 1000:.0f}ms" for k, v in _startup_profile.items()))
+
+
+@app.on_event("shutdown")
+def _stop_background_services():
+    scheduler.release()
 
 
 # ── MODELLI ────────────────────────────────────────────────────────────
 class ChatRequest(BaseModel):
-    message: str
-    context: Optional[str] = "general"
-    history: Optional[list] = []
+    message:    str
+    context:    Optional[str] = "general"
+    history:    Optional[list] = []
+    session_id: Optional[str] = None
+
+class ReportJobRequest(BaseModel):
+    message:    str
+    context:    Optional[str] = "general"
+    session_id: Optional[str] = None
 
 class ArticleUpdateSimple(BaseModel):
     titolo:             Optional[str]   = None
@@ -102,10 +143,15 @@ class SourceModel(BaseModel):
 # NAVIGAZIONE
 # ══════════════════════════════════════════════════════════════════════
 
+def _page(request: Request, path: str) -> Response:
+    status, body, headers = http_cache.static_page(path, request.headers)
+    return Response(content=body, status_code=status, headers=headers, media_type="text/html")
+
+
 @app.get("/")
-async def index():
+async def index(request: Request):
     if os.path.exists("web/index.html"):
-        return FileResponse("web/index.html")
+        return _page(request, "web/index.html")
     return {"status": "ok"}
 
 @app.get("/health")
@@ -116,21 +162,25 @@ async def health_check():
 async def healthcheck():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/chat")
-async def chat_page():
-    return FileResponse("web/chat.html")
+async def chat_page(request: Request):
+    return _page(request, "web/chat.html")
 
 @app.get("/clients")
-async def clients_page():
-    return FileResponse("web/clienti.html")
+async def clients_page(request: Request):
+    return _page(request, "web/clienti.html")
 
 @app.get("/monitor")
-async def monitor_page():
-    return FileResponse("web/monitor.html")
+async def monitor_page(request: Request):
+    return _page(request, "web/monitor.html")
 
 @app.get("/pitch")
-async def pitch_page():
-    return FileResponse("web/pitch.html")
+async def pitch_page(request: Request):
+    return _page(request, "web/pitch.html")
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -160,19 +210,40 @@ async def upload_multiple(files: List[UploadFile] = File(...)):
 
 @app.post("/api/chat")
 async def chat_endpoint(req: ChatRequest):
+    if req.session_id and not sessions.valid_id(req.session_id):
+        return {"success": False, "error": "session_id non valido."}
+    # Report completi con DOCX: vanno in coda, il client segue il job
+    if is_async_report(req.message):
+        job = report_jobs.submit(req.message, req.context or "general", req.session_id)
+        if "error" in job:
+            return {"success": False, "error": job["error"]}
+        return {
+            "success":    True,
+            "queued":     True,
+            "job_id":     job["id"],
+            "response":   "",
+            "is_report":  True,
+            "session_id": req.session_id,
+        }
+
+    trace = metrics.start_trace()
     try:
         result = ask_spiz(
             message=req.message,
             history=req.history or [],
             context=req.context or "general",
+            session_id=req.session_id,
         )
     except Exception as e:
+        metrics.end_trace(trace)
         return {"success": False, "error": str(e)}
+    timing = metrics.end_trace(trace)
+    metrics.observe("spiz_chat_seconds", timing.get("total_ms", 0) / 1000,
+                    {"intent": "report" if result.get("is_report") else "answer"})
 
     if "error" in result:
-        return {"success": False, "error": result["error"]}
+        return {"success": False, "error": result["error"], "timing": timing}
 
-    _cleanup_expired_docx()
     docx_token = _store_docx(result.get("docx_path"))
 
     return {
@@ -183,24 +254,110 @@ async def chat_endpoint(req: ChatRequest):
         "total_period":  result.get("total_period", 0),
         "has_docx":      docx_token is not None,
         "docx_token":    docx_token,
+        "session_id":    result.get("session_id"),
+        "timing":        timing,
     }
 
 
+@app.post("/api/report-jobs")
+async def create_report_job(req: ReportJobRequest):
+    if not req.message or len(req.message.strip()) < 2:
+        return {"success": False, "error": "Messaggio troppo corto."}
+    if req.session_id and not sessions.valid_id(req.session_id):
+        return {"success": False, "error": "session_id non valido."}
+    job = report_jobs.submit(req.message, req.context or "general", req.session_id)
+    if "error" in job:
+        return {"success": False, "error": job["error"]}
+    return {"success": True, "job": job}
+
+
+@app.get("/api/report-jobs/{job_id}")
+async def get_report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return {"success": True, "job": job}
+
+
+@app.get("/api/report-jobs/{job_id}/events")
+async def report_job_events(job_id: str):
+    """Stream SSE del progresso: un evento a ogni cambio di stage/avanzamento."""
+    if not report_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Job non trovato")
+
+    async def _events():
+        last = None
+        while True:
+            job = report_jobs.get(job_id)
+            if not job:
+                return
+            key = (job["status"], job["stage"], job["done"], job["total"])
+            if key != last:
+                last = key
+                yield f"event: progress\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job["status"] in ("done", "error"):
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_RANGE_CHUNK = 64 * 1024
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
 @app.get("/api/download-report/{token}")
-async def download_report(token: str):
-    entry = _DOCX_STORE.get(token)
+async def download_report(token: str, request: Request):
+    entry = artifacts.get(token)
     if not entry:
         raise HTTPException(status_code=404, detail="File non trovato o scaduto")
-    if time.time() > entry["expires"]:
-        del _DOCX_STORE[token]
+    if entry["expired"]:
+        artifacts.delete(token)
         raise HTTPException(status_code=410, detail="File scaduto")
     path = entry["path"]
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File non trovato sul disco")
-    return FileResponse(
-        path=path,
-        filename=os.path.basename(path),
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+
+    size    = os.path.getsize(path)
+    headers = {
+        "Accept-Ranges":       "bytes",
+        "Content-Disposition": f'attachment; filename="{entry["filename"]}"',
+    }
+    rng = request.headers.get("range", "")
+    m   = re.match(r"bytes=(\d*)-(\d*)$", rng.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return FileResponse(path=path, filename=entry["filename"], media_type=entry["media_type"], headers=headers)
+
+    if m.group(1):
+        start = int(m.group(1))
+        end   = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        # bytes=-N: ultimi N byte
+        start = max(0, size - int(m.group(2)))
+        end   = size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    headers["Content-Range"]  = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(path, start, end - start + 1),
+        status_code=206,
+        media_type=entry["media_type"],
+        headers=headers,
     )
 
 
@@ -211,19 +368,7 @@ async def download_report(token: str):
 @app.get("/api/dashboard-stats")
 async def dashboard_stats():
     try:
-        today     = date.today().isoformat()
-        week_ago  = (date.today() - timedelta(days=7)).isoformat()
-        month_ago = (date.today() - timedelta(days=30)).isoformat()
-        total     = supabase.table("articles").select("id", count="exact").execute()
-        oggi      = supabase.table("articles").select("id", count="exact").eq("data", today).execute()
-        settimana = supabase.table("articles").select("id", count="exact").gte("data", week_ago).execute()
-        mese      = supabase.table("articles").select("id", count="exact").gte("data", month_ago).execute()
-        return {
-            "totale":    total.count or 0,
-            "oggi":      oggi.count or 0,
-            "settimana": settimana.count or 0,
-            "mese":      mese.count or 0,
-        }
+        return await asyncio.to_thread(stats.dashboard_counts)
     except Exception as e:
         return {"totale": 0, "oggi": 0, "settimana": 0, "mese": 0, "error": str(e)}
 
@@ -243,31 +388,93 @@ async def last_upload():
 async def today_stats():
     """Restituisce statistiche articoli di oggi incluso lista giornalisti e testate."""
     try:
-        today    = date.today().isoformat()
-        res      = supabase.table("articles").select(
-            "testata, tone, macrosettori, giornalista"
-        ).eq("data", today).execute()
-        articles = res.data or []
-
-        testate_counter     = Counter(a.get("testata","") for a in articles if a.get("testata"))
-        giornalisti_counter = Counter(
-            a.get("giornalista","") for a in articles
-            if a.get("giornalista") and a["giornalista"].lower() not in ("redazione","n.d.","n/d","")
-        )
-        tones    = Counter(a.get("tone","") for a in articles if a.get("tone"))
-        tone_tot = sum(tones.values()) or 1
+        today = date.today().isoformat()
+        g     = await asyncio.to_thread(stats.grouped_counts, today, today,
+                                        dims=("testata", "giornalista", "tone"), limit=50)
+        giornalisti = [
+            (k, v) for k, v in g["giornalista"]
+            if k.lower() not in ("redazione","n.d.","n/d","")
+        ]
+        tone_tot = sum(v for _, v in g["tone"]) or 1
 
         return {
-            "total_today": len(articles),
-            "totale":      len(articles),
-            "testate":     [{"name": k, "count": v} for k,v in testate_counter.most_common(10)],
-            "giornalisti": [{"nome": k, "articoli": v} for k,v in giornalisti_counter.most_common(20)],
-            "sentiment":   {k: round(v/tone_tot*100) for k,v in tones.items() if k},
+            "total_today": g["total"],
+            "totale":      g["total"],
+            "testate":     [{"name": k, "count": v} for k,v in g["testata"][:10]],
+            "giornalisti": [{"nome": k, "articoli": v} for k,v in giornalisti[:20]],
+            "sentiment":   {k: round(v/tone_tot*100) for k,v in g["tone"] if k},
         }
     except Exception as e:
         return {"total_today": 0, "totale": 0, "testate": [], "giornalisti": [], "sentiment": {}, "error": str(e)}
 
 
+@app.get("/api/trends")
+async def get_trends(
+    dimension: str = Query("all"),
+    key:       Optional[str] = Query(None),
+    bucket:    str = Query("day"),
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date:   Optional[str] = Query(None, alias="to"),
+    format:    str = Query("columns"),
+):
+    """
+    Serie di volume, AVE, tone e rischio reputazionale per giorno/settimana/mese
+    di un cliente (dimension=client&key=<id>), una testata, un topic o di tutto
+    l'archivio. Default: ultimi 365 giorni. format=rows per una riga per bucket.
+    """
+    try:
+        to_date   = to_date or date.today().isoformat()
+        from_date = from_date or (date.fromisoformat(to_date) - timedelta(days=365)).isoformat()
+        series = await asyncio.to_thread(trends.trends, dimension, key, from_date, to_date, bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "rows":
+        return dict({k: v for k, v in series.items() if k not in ("buckets", "volume", "ave", "tone", "risk")},
+                    rows=trends.to_rows(series))
+    return series
+
+
+@app.get("/api/analytics/matrix")
+async def get_analytics_matrix(
+    rows:      str = Query("giornalista"),
+    cols:      str = Query("macrosettore"),
+    measure:   str = Query("n"),
+    limit:     int = Query(50, ge=1, le=500),
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date:   Optional[str] = Query(None, alias="to"),
+):
+    """
+    Tabella incrociata dallo snapshot DuckDB (services/analytics.py), es.
+    rows=testata&cols=month&measure=ave. Default: ultimi 365 giorni.
+    """
+    if not await asyncio.to_thread(analytics.ready):
+        raise HTTPException(status_code=503, detail="Snapshot analitico non disponibile")
+    try:
+        to_date   = to_date or date.today().isoformat()
+        from_date = from_date or (date.fromisoformat(to_date) - timedelta(days=365)).isoformat()
+        return await asyncio.to_thread(analytics.matrix, rows, cols, from_date, to_date, measure, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _today_counts(clients: list, today: str) -> Counter:
+    # Clienti con indice allineato: conteggi da article_client_mentions
+    ready  = mentions.ready_clients(clients)
+    counts = mentions.counts_for_day(today) if ready else Counter()
+
+    # Gli altri (indice in costruzione): scansione degli articoli di oggi
+    pending = {str(c["id"]) for c in clients if c["id"] not in ready}
+    if pending:
+        arts_res = supabase.table("articles").select(
+            "id, titolo, occhiello, testo_completo"
+        ).eq("data", today).execute()
+        matcher = keyword_matcher.get_matcher(clients)
+        for a in arts_res.data or []:
+            hits = matcher.matching_clients(a.get("titolo"), a.get("occhiello"), a.get("testo_completo"))
+            counts.update(str(cid) for cid in hits if str(cid) in pending)
+    return counts
+
+
 @app.get("/api/today-mentions")
 async def today_mentions():
     """Citazioni di oggi per cliente — restituisce lista clienti con conteggio."""
@@ -275,40 +482,21 @@ async def today_mentions():
         today = date.today().isoformat()
 
         # Carica tutti i clienti
-        clients_res = supabase.table("clients").select("*").execute()
-        clients     = clients_res.data or []
-
-        # Carica tutti gli articoli di oggi
-        arts_res = supabase.table("articles").select(
-            "id, titolo, testata, giornalista, tone, dominant_topic, testo_completo, occhiello"
-        ).eq("data", today).execute()
-        articles = arts_res.data or []
+        clients = await repository.list_clients()
+        counts  = await asyncio.to_thread(_today_counts, clients, today)
 
         result = []
         for cl in clients:
-            keywords = [k.strip().lower() for k in (cl.get("keywords") or "").split(",") if k.strip()]
-            if not keywords:
-                count = 0
-            else:
-                count = sum(
-                    1 for a in articles
-                    if any(
-                        kw in (a.get("testo_completo") or "").lower() or
-                        kw in (a.get("titolo") or "").lower() or
-                        kw in (a.get("occhiello") or "").lower()
-                        for kw in keywords
-                    )
-                )
             result.append({
                 "id":       cl["id"],
                 "name":     cl.get("name",""),
                 "keywords": cl.get("keywords",""),
-                "today":    count,
+                "today":    counts.get(str(cl["id"]), 0),
             })
 
         return result
     except Exception as e:
-        return []
+        return {"error": str(e)}
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -337,32 +525,27 @@ async def top_giornalisti(
             from_date = (today - timedelta(days=days)).isoformat()
         to_date = today.isoformat()
 
-        res = supabase.table("articles").select(
-            "giornalista, testata, data"
-        ).gte("data", from_date).lte("data", to_date).execute()
-
-        articles = res.data or []
         SKIP = {"", "N.D.", "N/D", "Redazione", "Autore non indicato", "redazione"}
-        counter = Counter(
-            a.get("giornalista","") for a in articles
-            if a.get("giornalista") and a["giornalista"] not in SKIP
-        )
+        g    = await asyncio.to_thread(stats.grouped_counts, from_date, to_date,
+                                       dims=("giornalista",), limit=limit + len(SKIP))
 
         return [
             {"nome": nome, "articoli": count}
-            for nome, count in counter.most_common(limit)
-        ]
+            for nome, count in g["giornalista"] if nome not in SKIP
+        ][:limit]
     except Exception as e:
-        return []
+        return {"error": str(e)}
 
 
 @app.get("/api/giornalista-articoli")
 async def giornalista_articoli(
+    response: Response,
     nome:   str = Query(...),
     period: str = Query("30days"),
     limit:  int = Query(100),
+    cursor: Optional[str] = Query(None),
 ):
-    """Restituisce gli articoli di un giornalista nel periodo."""
+    """Restituisce gli articoli di un giornalista nel periodo. Pagina successiva: header X-Next-Cursor."""
     try:
         today = date.today()
         days_map = {"today": 0, "7days": 7, "30days": 30, "6months": 180, "year": 365}
@@ -373,19 +556,20 @@ async def giornalista_articoli(
             from_date = (today - timedelta(days=days)).isoformat()
         to_date = today.isoformat()
 
-        res = (supabase.table("articles")
-               .select("id, titolo, testata, data, giornalista, tone, dominant_topic")
-               .eq("giornalista", nome)
-               .gte("data", from_date)
-               .lte("data", to_date)
-               .order("data", desc=True)
-               .limit(limit)
-               .execute())
-
-        articles = res.data or []
+        limit = pagination.clamp_limit(limit)
+        query = (supabase.table("articles")
+                 .select("id, titolo, testata, data, giornalista, tone, dominant_topic")
+                 .eq("giornalista", nome)
+                 .gte("data", from_date)
+                 .lte("data", to_date))
+        res = await pagination.apply_cursor(query, cursor).limit(limit + 1).run()
+
+        articles, next_cursor = pagination.page(res.data or [], limit)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return articles
     except Exception as e:
-        return []
+        return {"error": str(e)}
 
 
 # ══════════════════════════════════════════════════════════════════════
@@ -395,17 +579,18 @@ async def giornalista_articoli(
 @app.get("/api/debug-articles")
 async def debug_articles():
     try:
-        res       = supabase.table("articles").select("id, titolo, data, testata, giornalista").order("data", desc=True).limit(5).execute()
-        clients   = supabase.table("clients").select("id, name, keywords, semantic_topic").execute()
-        total     = supabase.table("articles").select("id", count="exact").execute()
-        today     = date.today().isoformat()
-        oggi      = supabase.table("articles").select("id").eq("data", today).execute().data or []
-        last      = supabase.table("articles").select("data").order("data", desc=True).limit(1).execute()
-        last_date = last.data[0]["data"] if last.data else None
+        today = date.today().isoformat()
+        res, clients, total, oggi = await db.gather(
+            supabase.table("articles").select("id, titolo, data, testata, giornalista").order("data", desc=True).limit(5),
+            supabase.table("clients").select("id, name, keywords, semantic_topic"),
+            supabase.table("articles").select("id", count="exact").limit(1),
+            supabase.table("articles").select("id", count="exact").eq("data", today).limit(1),
+        )
+        last_date = res.data[0]["data"] if res.data else None
         return {
             "ultimi_articoli": res.data,
             "totale_articoli": total.count,
-            "articoli_oggi":   len(oggi),
+            "articoli_oggi":   oggi.count,
             "ultima_data":     last_date,
             "clienti":         clients.data,
         }
@@ -417,42 +602,74 @@ async def debug_articles():
 # ARTICOLI
 # ══════════════════════════════════════════════════════════════════════
 
+ARTICLE_SUMMARY_FIELDS = (
+    "id, testata, data, giornalista, occhiello, titolo, sottotitolo, "
+    "macrosettori, tipologia_articolo, tone, dominant_topic, "
+    "reputational_risk, political_risk, ave, tipo_fonte"
+)
+
+def _scan_client_articles(client_data: dict, from_date: str, to_date: str) -> list:
+    period   = bulk.iter_rows(
+        "articles", ARTICLE_SUMMARY_FIELDS + ", testo_completo",
+        where=lambda q: q.gte("data", from_date).lte("data", to_date),
+    )
+    matcher  = keyword_matcher.KeywordMatcher([client_data])   # solo le keyword di questo cliente
+    filtered = [
+        a for a in period
+        if client_data["id"] in matcher.matching_clients(
+            a.get("titolo"), a.get("occhiello"), a.get("testo_completo"))
+    ]
+    for a in filtered:
+        a.pop("testo_completo", None)
+    return filtered
+
+
 @app.get("/api/client-articles")
-async def get_client_articles(client_id: str, from_date: str, to_date: str):
+async def get_client_articles(
+    client_id: str,
+    from_date: str,
+    to_date:   str,
+    limit:     int           = 100,
+    cursor:    Optional[str] = None,
+):
+    """Articoli del cliente a pagine (cursore su data, id); il testo completo è su /api/article/{id}."""
     try:
-        client_res = supabase.table("clients").select("*").eq("id", client_id).execute()
-        if not client_res.data:
+        client_data = await repository.get_client(client_id)
+        if not client_data:
             raise HTTPException(status_code=404, detail="Cliente non trovato")
 
-        client_data = client_res.data[0]
-        keywords    = [k.strip().lower() for k in (client_data.get("keywords") or "").split(",") if k.strip()]
-
-        articles_res = supabase.table("articles").select(
-            "id, testata, data, giornalista, occhiello, titolo, sottotitolo, "
-            "testo_completo, macrosettori, tipologia_articolo, tone, "
-            "dominant_topic, reputational_risk, political_risk, ave, tipo_fonte"
-        ).gte("data", from_date).lte("data", to_date).order("data", desc=True).execute()
-
-        all_articles = articles_res.data or []
-
-        # Filtra per keyword cliente se presenti
-        if keywords:
-            filtered = [
-                a for a in all_articles
-                if any(
-                    kw in (a.get("testo_completo") or "").lower() or
-                    kw in (a.get("titolo") or "").lower() or
-                    kw in (a.get("occhiello") or "").lower()
-                    for kw in keywords
-                )
-            ]
-        else:
-            filtered = all_articles
+        keywords    = keyword_matcher.parse_keywords(client_data.get("keywords") or "")
+        limit       = pagination.clamp_limit(limit)
+
+        # Nessuna keyword: tutti gli articoli del periodo, paginati sul database
+        if not keywords:
+            articles, next_cursor, total = await repository.articles_page(
+                ARTICLE_SUMMARY_FIELDS, limit, cursor, from_date=from_date, to_date=to_date, count=True)
+            return {"client": client_data, "articles": articles, "total": total,
+                    "next_cursor": next_cursor}
+
+        # Indice pronto: pagina di id e conteggio in parallelo, poi solo i campi di sintesi
+        if client_data["id"] in await asyncio.to_thread(mentions.ready_clients, [client_data]):
+            (ids, next_cursor), total = await asyncio.gather(
+                asyncio.to_thread(mentions.client_article_page, client_id, from_date, to_date, limit, cursor),
+                asyncio.to_thread(mentions.client_article_count, client_id, from_date, to_date),
+            )
+            return {
+                "client":      client_data,
+                "articles":    await repository.articles_by_ids(ids, ARTICLE_SUMMARY_FIELDS),
+                "total":       total,
+                "next_cursor": next_cursor,
+            }
+
+        # Indice in costruzione: scansione del periodo, poi la pagina richiesta
+        filtered = await asyncio.to_thread(_scan_client_articles, client_data, from_date, to_date)
+        articles, next_cursor = pagination.page_in_memory(filtered, limit, cursor)
 
         return {
-            "client":   client_data,
-            "articles": filtered,
-            "total":    len(filtered),
+            "client":      client_data,
+            "articles":    articles,
+            "total":       len(filtered),
+            "next_cursor": next_cursor,
         }
     except HTTPException:
         raise
@@ -466,16 +683,15 @@ async def get_articles(
     to_date:   Optional[str] = None,
     testata:   Optional[str] = None,
     limit:     int           = 50,
+    cursor:    Optional[str] = None,
 ):
     try:
-        query = supabase.table("articles").select(
-            "id, titolo, testata, data, occhiello, giornalista, tone, dominant_topic, macrosettori"
+        limit = pagination.clamp_limit(limit)
+        articles, next_cursor, _ = await repository.articles_page(
+            "id, titolo, testata, data, occhiello, giornalista, tone, dominant_topic, macrosettori",
+            limit, cursor, from_date=from_date, to_date=to_date, testata=testata,
         )
-        if from_date: query = query.gte("data", from_date)
-        if to_date:   query = query.lte("data", to_date)
-        if testata:   query = query.eq("testata", testata)
-        res = query.order("data", desc=True).limit(limit).execute()
-        return {"articles": res.data or [], "total": len(res.data or [])}
+        return {"articles": articles, "total": len(articles), "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -483,25 +699,60 @@ async def get_articles(
 @app.get("/api/article/{article_id}")
 async def get_article(article_id: str):
     try:
-        res = supabase.table("articles").select("*").eq("id", article_id).execute()
-        if not res.data:
+        article = await repository.get_article(article_id)
+        if not article:
             raise HTTPException(status_code=404, detail="Articolo non trovato")
-        return res.data[0]
+        return article
     except HTTPException:
         raise
     except Exception as e:
         return {"error": str(e)}
 
 
+def _rollup_snapshot(article_id: str) -> list:
+    try:
+        return rollups.snapshot([article_id])
+    except Exception as e:
+        print(f"[ROLLUP] snapshot articolo {article_id}: {e}")
+        return []
+
+
+def _after_article_update(article_id: str, before: list, update_data: dict) -> None:
+    """Indice delle citazioni, rollup e snapshot analitico dopo la modifica di un articolo."""
+    if {"titolo", "occhiello", "testo_completo", "data"} & update_data.keys():
+        try:
+            mentions.reindex_article(article_id)
+        except Exception as e:
+            print(f"[MENTIONS] reindex articolo {article_id}: {e}")
+    if before:
+        try:
+            rollups.apply(before, -1)
+            rollups.apply(rollups.snapshot([article_id]), +1)
+        except Exception as e:
+            print(f"[ROLLUP] articolo {article_id}: {e}")
+    analytics.mark_dirty(*[b.get("data") for b in before], update_data.get("data"))
+
+
+def _after_article_delete(article_id: str, before: list) -> None:
+    if before:
+        try:
+            rollups.apply(before, -1)
+        except Exception as e:
+            print(f"[ROLLUP] articolo {article_id}: {e}")
+    analytics.mark_dirty(*[b.get("data") for b in before])
+
+
 @app.put("/api/article/{article_id}")
 async def update_article(article_id: str, data: ArticleUpdateSimple):
     try:
         update_data = {k: v for k, v in data.dict().items() if v is not None}
         if not update_data:
             raise HTTPException(status_code=400, detail="Nessun campo da aggiornare")
-        res = supabase.table("articles").update(update_data).eq("id", article_id).execute()
-        if res.data:
-            return res.data[0]
+        before = await asyncio.to_thread(_rollup_snapshot, article_id)
+        updated = await repository.update_article(article_id, update_data)
+        await asyncio.to_thread(_after_article_update, article_id, before, update_data)
+        if updated:
+            return updated[0]
         return {"success": True}
     except HTTPException:
         raise
@@ -512,7 +763,9 @@ async def update_article(article_id: str, data: ArticleUpdateSimple):
 @app.delete("/api/article/{article_id}")
 async def delete_article(article_id: str):
     try:
-        supabase.table("articles").delete().eq("id", article_id).execute()
+        before = await asyncio.to_thread(_rollup_snapshot, article_id)
+        await repository.delete_article(article_id)
+        await asyncio.to_thread(_after_article_delete, article_id, before)
         return {"success": True}
     except Exception as e:
         return {"error": str(e)}
@@ -525,8 +778,7 @@ async def delete_article(article_id: str):
 @app.get("/api/clients")
 async def get_clients():
     try:
-        res = supabase.table("clients").select("*").execute()
-        return {"clients": res.data or []}
+        return {"clients": await repository.list_clients()}
     except Exception as e:
         return {"error": str(e)}
 
@@ -534,7 +786,7 @@ async def get_clients():
 @app.post("/api/clients")
 async def create_client(data: ClientModel):
     try:
-        res = supabase.table("clients").insert({
+        created = await repository.create_client({
             "name": data.name,
             "keywords": data.keywords,
             "web_keywords": data.web_keywords,
@@ -543,8 +795,11 @@ async def create_client(data: ClientModel):
             "website": data.website,
             "contact": data.contact,
             "semantic_topic": data.semantic_topic,
-        }).execute()
-        return {"success": True, "client": res.data}
+        })
+        keyword_matcher.invalidate()
+        for c in created:
+            mentions.reindex_async(c["id"])
+        return {"success": True, "client": created}
     except Exception as e:
         return {"error": str(e)}
 
@@ -553,8 +808,11 @@ async def create_client(data: ClientModel):
 async def update_client(client_id: str, data: ClientModel):
     try:
         update_data = {k: v for k, v in data.dict().items() if v is not None}
-        res = supabase.table("clients").update(update_data).eq("id", client_id).execute()
-        return {"success": True, "client": res.data}
+        updated = await repository.update_client(client_id, update_data)
+        keyword_matcher.invalidate()
+        if "keywords" in update_data:
+            mentions.reindex_async(client_id)
+        return {"success": True, "client": updated}
     except Exception as e:
         return {"error": str(e)}
 
@@ -562,7 +820,9 @@ async def update_client(client_id: str, data: ClientModel):
 @app.delete("/api/clients/{client_id}")
 async def delete_client(client_id: str):
     try:
-        supabase.table("clients").delete().eq("id", client_id).execute()
+        await repository.delete_client(client_id)
+        keyword_matcher.invalidate()
+        await asyncio.to_thread(mentions.forget_client, client_id)
         return {"success": True}
     except Exception as e:
         return {"error": str(e)}
@@ -575,8 +835,7 @@ async def delete_client(client_id: str):
 @app.get("/api/monitored-sources")
 async def get_sources():
     try:
-        res = supabase.table("monitored_sources").select("*").order("name").execute()
-        return {"sources": res.data or []}
+        return {"sources": await repository.list_sources()}
     except Exception as e:
         return {"error": str(e)}
 
@@ -584,10 +843,10 @@ async def get_sources():
 @app.post("/api/monitored-sources")
 async def create_source(data: SourceModel):
     try:
-        res = supabase.table("monitored_sources").insert({
+        created = await repository.create_source({
             "name": data.name, "url": data.url, "active": data.active,
-        }).execute()
-        return {"success": True, "source": res.data}
+        })
+        return {"success": True, "source": created}
     except Exception as e:
         return {"error": str(e)}
 
@@ -595,7 +854,7 @@ async def create_source(data: SourceModel):
 @app.delete("/api/monitored-sources/{source_id}")
 async def delete_source(source_id: str):
     try:
-        supabase.table("monitored_sources").delete().eq("id", source_id).execute()
+        await repository.delete_source(source_id)
         return {"success": True}
     except Exception as e:
         return {"error": str(e)}
@@ -604,8 +863,25 @@ async def delete_source(source_id: str):
 @app.patch("/api/monitored-sources/{source_id}/toggle")
 async def toggle_source(source_id: str, active: bool = Query(...)):
     try:
-        res = supabase.table("monitored_sources").update({"active": active}).eq("id", source_id).execute()
-        return {"success": True, "source": res.data}
+        return {"success": True, "source": await repository.set_source_active(source_id, active)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/api/monitored-sources/{source_id}/boost")
+async def boost_source(source_id: str, minutes: int = Query(poller.BOOST_MINUTES, ge=1, le=24 * 60)):
+    """Controlla subito la sorgente e poi alla frequenza massima per `minutes` minuti."""
+    try:
+        return {"success": True, "poll": await asyncio.to_thread(poller.boost, source_id, minutes)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/monitored-sources/polling")
+async def get_source_polling():
+    """Intervallo, prossimo controllo e voci nuove all'ora di ogni sorgente attiva."""
+    try:
+        return {"sources": await asyncio.to_thread(poller.status)}
     except Exception as e:
         return {"error": str(e)}
 
@@ -617,8 +893,7 @@ async def toggle_source(source_id: str, active: bool = Query(...)):
 @app.get("/api/monitor-meta")
 async def get_monitor_meta():
     try:
-        res = supabase.table("monitor_meta").select("*").execute()
-        return {"meta": res.data or []}
+        return {"meta": await repository.get_monitor_meta()}
     except Exception as e:
         return {"error": str(e)}
 
@@ -626,20 +901,34 @@ async def get_monitor_meta():
 @app.post("/api/monitor-meta")
 async def upsert_monitor_meta(data: dict):
     try:
-        supabase.table("monitor_meta").upsert(data).execute()
+        await repository.upsert_monitor_meta(data)
         return {"success": True}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/api/scheduler")
+async def get_scheduler():
+    """Leader corrente di questo processo e ultime esecuzioni dei job pianificati."""
+    try:
+        return dict(scheduler.status(), runs=await asyncio.to_thread(scheduler.recent_runs))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+WEB_MENTION_SUMMARY_FIELDS = (
+    "id, client_id, source_name, source_url, title, url, published_at, summary, "
+    "matched_client, matched_keywords, tone, reputational_risk"
+)
+
 @app.get("/api/web-mentions")
-async def get_web_mentions(client_id: Optional[str] = None, limit: int = 50):
+async def get_web_mentions(client_id: Optional[str] = None, risk: Optional[str] = None,
+                           limit: int = 50, cursor: Optional[str] = None):
     try:
-        query = supabase.table("web_mentions").select("*").order("published_at", desc=True)
-        if client_id:
-            query = query.eq("client_id", client_id)
-        res = query.limit(limit).execute()
-        return {"mentions": res.data or [], "total": len(res.data or [])}
+        limit = pagination.clamp_limit(limit)
+        rows, next_cursor = await repository.web_mentions_page(
+            WEB_MENTION_SUMMARY_FIELDS, limit, cursor, client_id=client_id, risk=risk)
+        return {"mentions": rows, "total": len(rows), "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -651,18 +940,12 @@ async def get_web_mentions(client_id: Optional[str] = None, limit: int = 50):
 @app.get("/api/journalists")
 async def get_journalists(from_date: Optional[str] = None, to_date: Optional[str] = None):
     try:
-        query = supabase.table("articles").select("id, giornalista, testata, titolo, data")
-        if from_date: query = query.gte("data", from_date)
-        if to_date:   query = query.lte("data", to_date)
-        res      = query.execute()
-        articles = res.data or []
-        counter  = Counter(
-            a.get("giornalista","") for a in articles
-            if a.get("giornalista") and a["giornalista"].lower() not in ("redazione","")
-        )
+        g = await asyncio.to_thread(stats.grouped_counts, from_date or "1900-01-01", to_date or "2999-12-31",
+                                    dims=("giornalista",), limit=52)
+        journalists = [(n, c) for n, c in g["giornalista"] if n.lower() not in ("redazione","")]
         return {
-            "journalists":    [{"name": n, "count": c} for n, c in counter.most_common(50)],
-            "total_articles": len(articles),
+            "journalists":    [{"name": n, "count": c} for n, c in journalists[:50]],
+            "total_articles": g["total"],
         }
     except Exception as e:
         return {"error": str(e)}
@@ -694,4 +977,5 @@ async def pitch_endpoint(
 # ══════════════════════════════════════════════════════════════════════
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
\ No newline at end of file
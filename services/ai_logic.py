@@ -1,11 +1,8 @@
-import os
 import re
 from datetime import date, timedelta
 from collections import Counter
-from openai import OpenAI
 from services.database import supabase
-
-ai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services import llm, bulk, rollups
 
 COLS = (
     "id, testata, data, giornalista, occhiello, titolo, sottotitolo, "
@@ -69,14 +66,11 @@ def get_dates(context, message):
 
 def load_all(from_date, to_date):
     try:
-        res = (supabase.table("articles")
-               .select(COLS)
-               .gte("data", from_date)
-               .lte("data", to_date)
-               .order("data", desc=True)
-               .limit(1000)
-               .execute())
-        return res.data or []
+        return bulk.fetch_all(
+            "articles", COLS,
+            where=lambda q: q.gte("data", from_date).lte("data", to_date),
+            order=[("data", True), ("id", True)],
+        )
     except Exception as e:
         print("load_all error: " + str(e))
         return []
@@ -85,7 +79,8 @@ def load_all(from_date, to_date):
 def semantic_search(query, from_date=None, to_date=None, top_k=25):
     """Cerca articoli semanticamente simili alla query."""
     try:
-        resp = ai.embeddings.create(
+        resp = llm.embed(
+            "semantic_query",
             model="text-embedding-ada-002",
             input=query[:8000]
         )
@@ -166,12 +161,29 @@ def fmt_stats(articles):
         d = a.get("data","")
         if d and len(d) >= 7:
             monthly[d[:7]] += 1
-    tone_tot = sum(tones.values()) or 1
     dates = [a.get("data","") for a in articles if a.get("data")]
+    return _fmt_counters(len(dates), dates, testate, settori, topics, tones, monthly)
+
+
+def fmt_stats_rollup(from_date, to_date):
+    """Come fmt_stats, ma dai rollup giornalieri: non legge gli articoli."""
+    days = [(str(r["day"]), int(r["n"])) for r in rollups.series("all", from_date, to_date)]
+    if not days:
+        return "Nessun articolo."
+    monthly = Counter()
+    for d, n in days:
+        monthly[d[:7]] += n
+    by = lambda kind: Counter({k: n for k, _, n, _ in rollups.totals(kind, from_date, to_date, limit=10)})
+    return _fmt_counters(sum(n for _, n in days), [d for d, _ in days],
+                         by("testata"), by("macrosettore"), by("topic"), by("tone"), monthly)
+
+
+def _fmt_counters(total, dates, testate, settori, topics, tones, monthly):
+    tone_tot = sum(tones.values()) or 1
     def top(c, n=10):
         return ", ".join(k + "(" + str(v) + ")" for k,v in c.most_common(n) if k)
     return (
-        "TOTALE: " + str(len(articles)) + " articoli\n"
+        "TOTALE: " + str(total) + " articoli\n"
         "PERIODO: " + (min(dates) if dates else "?") + " -> " + (max(dates) if dates else "?") + "\n"
         "TESTATE: " + top(testate) + "\n"
         "MACROSETTORI: " + top(settori) + "\n"
@@ -188,9 +200,14 @@ def ask_spiz(message, history=None, context="general"):
     from_date, to_date = get_dates(context, message)
     journalist = extract_targets(message)
 
-    # Stats sul corpus completo del periodo
-    all_articles = load_all(from_date, to_date)
-    print("SPIZ loaded=" + str(len(all_articles)) + " from=" + from_date + " to=" + to_date)
+    # Stats sul corpus completo del periodo: dai rollup se costruiti
+    if rollups.is_ready():
+        stats = fmt_stats_rollup(from_date, to_date)
+        all_articles = None
+    else:
+        all_articles = load_all(from_date, to_date)
+        stats = fmt_stats(all_articles)
+        print("SPIZ loaded=" + str(len(all_articles)) + " from=" + from_date + " to=" + to_date)
 
     # Arricchisci query corte per embedding migliori
     search_query = message
@@ -209,9 +226,14 @@ def ask_spiz(message, history=None, context="general"):
 
     # Fallback se semantica non trova nulla (embedding non ancora generati)
     if not filtered:
+        if all_articles is None:
+            all_articles = bulk.fetch_all(
+                "articles", COLS,
+                where=lambda q: q.gte("data", from_date).lte("data", to_date),
+                order=[("data", True), ("id", True)], limit=50,
+            )
         filtered = all_articles[:50]
 
-    stats = fmt_stats(all_articles)
     corpus = fmt_corpus(filtered)
 
     system = (
@@ -237,7 +259,8 @@ def ask_spiz(message, history=None, context="general"):
     max_tok = 8000 if is_report else 2000
 
     try:
-        resp = ai.chat.completions.create(
+        resp = llm.chat(
+            "legacy_answer",
             model="gpt-4o",
             messages=messages,
             temperature=0.1,
@@ -247,7 +270,8 @@ def ask_spiz(message, history=None, context="general"):
     except Exception as e1:
         print("gpt-4o error: " + str(e1))
         try:
-            resp = ai.chat.completions.create(
+            resp = llm.chat(
+                "legacy_answer_fallback",
                 model="gpt-4o-mini",
                 messages=messages,
                 temperature=0.1,
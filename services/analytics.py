@@ -0,0 +1,489 @@
+"""
+services/analytics.py — Snapshot analitico in DuckDB su file Parquet
+Una copia colonnare degli articoli (campi di classificazione, titolo e
+AVE, senza testo né embedding) e dell'indice delle citazioni, in file
+Parquet partizionati per mese sotto data/analytics/. DuckDB li interroga
+dentro il processo: aggregazioni sull'intero archivio (tone per testata
+per mese, matrici giornalista × macrosettore, AVE per cliente) in pochi
+millisecondi e senza carico sul database principale.
+
+Il refresh è incrementale: articoli con id oltre l'ultimo sincronizzato,
+mesi segnati come modificati (mark_dirty) o con conteggi diversi dal
+database; una ricostruzione completa ogni FULL_REFRESH_HOURS copre le
+modifiche fatte fuori dall'app. Senza il pacchetto duckdb (dipendenza
+opzionale) o con SPIZ_ANALYTICS=0 il modulo resta spento e chi lo usa
+ripiega sui rollup o sul database.
+
+    python -m services.analytics --rebuild
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timezone
+
+from services.database import supabase
+from services import bulk, http_cache
+
+# duckdb si importa alla prima connessione: l'avvio del server non lo paga
+ROOT               = os.getenv("SPIZ_ANALYTICS_DIR", "data/analytics")
+ENABLED            = importlib.util.find_spec("duckdb") is not None and os.getenv("SPIZ_ANALYTICS", "1") != "0"
+REFRESH_SECONDS    = int(os.getenv("SPIZ_ANALYTICS_REFRESH", "60"))
+FULL_REFRESH_HOURS = float(os.getenv("SPIZ_ANALYTICS_FULL_HOURS", "24"))
+STATE_FILE         = os.path.join(ROOT, "state.json")
+
+ARTICLE_COLUMNS = {
+    "id": "BIGINT", "data": "DATE", "testata": "VARCHAR", "giornalista": "VARCHAR",
+    "titolo": "VARCHAR", "tone": "VARCHAR", "reputational_risk": "VARCHAR",
+    "dominant_topic": "VARCHAR", "macrosettori": "VARCHAR", "tipologia_articolo": "VARCHAR",
+    "tipo_fonte": "VARCHAR", "ave": "DOUBLE",
+}
+MENTION_COLUMNS = {"article_id": "BIGINT", "client_id": "VARCHAR", "data": "DATE"}
+SOURCES = {"articles": ARTICLE_COLUMNS, "mentions": MENTION_COLUMNS}
+
+# dimensioni interrogabili → espressione SQL
+DIMENSIONS = {
+    "testata":      "a.testata",
+    "giornalista":  "a.giornalista",
+    "tone":         "a.tone",
+    "risk":         "a.reputational_risk",
+    "topic":        "a.dominant_topic",
+    "tipologia":    "a.tipologia_articolo",
+    "macrosettore": "a.macrosettore",
+    "month":        "a.month",
+    "day":          "CAST(a.data AS VARCHAR)",
+    "client":       "c.client_id",
+}
+
+_lock     = threading.RLock()   # stato e scrittura delle partizioni (refresh, rebuild, mark_dirty)
+_con_lock = threading.Lock()    # connessione e viste: le letture non aspettano un refresh in corso
+_state    = {"loaded": False}
+_con      = {"con": None, "views": False}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# STATO E FILE
+# ══════════════════════════════════════════════════════════════════════
+
+def _load_state() -> dict:
+    if not _state["loaded"]:
+        try:
+            with open(STATE_FILE, encoding="utf-8") as f:
+                _state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        _state["loaded"] = True
+    return _state
+
+
+def _save_state() -> None:
+    os.makedirs(ROOT, exist_ok=True)
+    data = {k: v for k, v in _state.items() if k != "loaded"}
+    tmp  = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, STATE_FILE)
+
+
+def _partition(kind: str, month: str) -> str:
+    return os.path.join(ROOT, kind, f"month={month}", "data.parquet")
+
+
+def _sql_path(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _months_on_disk(kind: str) -> set:
+    base = os.path.join(ROOT, kind)
+    if not os.path.isdir(base):
+        return set()
+    return {d.split("=", 1)[1] for d in os.listdir(base)
+            if d.startswith("month=") and os.path.exists(os.path.join(base, d, "data.parquet"))}
+
+
+def _connection():
+    con = _con["con"]
+    if con is None:
+        with _con_lock:
+            if _con["con"] is None:
+                import duckdb
+                _con["con"] = duckdb.connect()
+            con = _con["con"]
+    return con
+
+
+def _refresh_views() -> None:
+    con = _connection()
+    with _con_lock:
+        _create_views(con)
+    _con["views"] = True
+
+
+def _create_views(con) -> None:
+    for kind in SOURCES:
+        if _months_on_disk(kind):
+            glob = os.path.join(ROOT, kind, "*", "data.parquet")
+            con.execute(f"CREATE OR REPLACE VIEW {kind} AS SELECT * FROM read_parquet({_sql_path(glob)}, "
+                        f"hive_partitioning = true, hive_types = {{'month': VARCHAR}})")
+        else:
+            cols = ", ".join(f"CAST(NULL AS {t}) AS {c}" for c, t in SOURCES[kind].items())
+            con.execute(f"CREATE OR REPLACE VIEW {kind} AS SELECT {cols}, CAST(NULL AS VARCHAR) AS month WHERE false")
+
+
+def _clean(kind: str, row: dict) -> dict:
+    out = {c: row.get(c) for c in SOURCES[kind]}
+    out["data"] = str(out["data"])[:10] if out.get("data") else None
+    if kind == "articles":
+        try:
+            out["ave"] = float(out.get("ave") or 0)
+        except (TypeError, ValueError):
+            out["ave"] = 0.0
+    else:
+        out["client_id"] = str(out["client_id"])
+    return out
+
+
+def _write_partition(kind: str, month: str, rows: list, merge: bool = False) -> None:
+    """Scrive (o, con merge, aggiorna per id) la partizione di un mese, in modo atomico."""
+    path = _partition(kind, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not rows and not merge:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    cols   = SOURCES[kind]
+    struct = "{" + ", ".join(f"'{c}': '{t}'" for c, t in cols.items()) + "}"
+    src    = path + ".jsonl"
+    with open(src, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(_clean(kind, r), ensure_ascii=False) + "\n")
+    new = f"SELECT * FROM read_json({_sql_path(src)}, format = 'newline_delimited', columns = {struct})"
+    if merge and os.path.exists(path):
+        old = (f"SELECT {', '.join(cols)} FROM read_parquet({_sql_path(path)}) "
+               f"WHERE id NOT IN (SELECT id FROM ({new}))")
+        new = f"{old} UNION ALL {new}"
+    con = _connection().cursor()
+    try:
+        con.execute(f"COPY ({new} ORDER BY data) TO {_sql_path(path + '.tmp')} (FORMAT PARQUET)")
+    finally:
+        con.close()
+    os.replace(path + ".tmp", path)
+    os.remove(src)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# REFRESH
+# ══════════════════════════════════════════════════════════════════════
+
+def _by_month(rows) -> dict:
+    out = defaultdict(list)
+    for r in rows:
+        if r.get("data"):
+            out[str(r["data"])[:7]].append(r)
+    return out
+
+
+def _month_range(month: str) -> tuple:
+    y, m = int(month[:4]), int(month[5:7])
+    end = date(y + (m == 12), m % 12 + 1, 1)
+    return f"{month}-01", (date.fromordinal(end.toordinal() - 1)).isoformat()
+
+
+def _reload_months(months: set) -> None:
+    cols = ", ".join(ARTICLE_COLUMNS)
+    for month in sorted(months):
+        start, end = _month_range(month)
+        rows = bulk.fetch_all("articles", cols, where=lambda q: q.gte("data", start).lte("data", end))
+        _write_partition("articles", month, rows)
+
+
+def _db_month_counts() -> dict:
+    """{mese: articoli} dal database, un conteggio per mese in parallelo."""
+    months = sorted(_months_on_disk("articles"))
+    queries = []
+    for month in months:
+        start, end = _month_range(month)
+        queries.append(supabase.table("articles").select("id", count="exact").gte("data", start).lte("data", end).limit(1))
+    results = [f.result() for f in [q.submit() for q in queries]]
+    return {m: r.count or 0 for m, r in zip(months, results)}
+
+
+def _snapshot_month_counts() -> dict:
+    con = _connection().cursor()
+    try:
+        return dict(con.execute("SELECT month, count(*) FROM articles GROUP BY month").fetchall())
+    finally:
+        con.close()
+
+
+def rebuild() -> int:
+    """Ricostruisce tutto lo snapshot."""
+    if not ENABLED:
+        print("[ANALYTICS] duckdb non installato o SPIZ_ANALYTICS=0")
+        return 0
+    t0 = time.perf_counter()
+    with _lock:
+        state = _load_state()
+        marks = http_cache.watermarks() or {}
+        articles = bulk.fetch_all("articles", ", ".join(ARTICLE_COLUMNS))
+        months   = _by_month(articles)
+        for stale in _months_on_disk("articles") - set(months):
+            _write_partition("articles", stale, [])
+        for month, rows in months.items():
+            _write_partition("articles", month, rows)
+        _rewrite_mentions()
+        state.update(
+            max_id=max((int(a["id"]) for a in articles), default=0),
+            watermarks=marks, dirty=[],
+            full_at=datetime.now(timezone.utc).isoformat(),
+        )
+        _save_state()
+        _refresh_views()
+    http_cache.bump("analytics")
+    print(f"[ANALYTICS] snapshot ricostruito: {len(articles)} articoli in {len(months)} mesi "
+          f"in {time.perf_counter() - t0:.1f}s")
+    return len(articles)
+
+
+def _rewrite_mentions() -> None:
+    rows = bulk.fetch_all("article_client_mentions", "article_id, client_id, data",
+                          order=[("article_id", False), ("client_id", False)])
+    months = _by_month(rows)
+    for stale in _months_on_disk("mentions") - set(months):
+        _write_partition("mentions", stale, [])
+    for month, part in months.items():
+        _write_partition("mentions", month, part)
+
+
+def refresh() -> dict:
+    """Aggiornamento incrementale; ricostruzione completa se mai fatta o scaduta."""
+    if not ENABLED:
+        return {"enabled": False}
+    with _lock:
+        state = _load_state()
+        full_at = state.get("full_at")
+        if not full_at or (datetime.now(timezone.utc) - datetime.fromisoformat(full_at)).total_seconds() > FULL_REFRESH_HOURS * 3600:
+            return {"rebuilt": rebuild()}
+        if not _con["views"]:
+            _refresh_views()
+
+        marks = http_cache.watermarks() or {}
+        old   = state.get("watermarks") or {}
+        dirty = set(state.get("dirty") or [])
+        if marks and marks.get("articles") == old.get("articles") and marks.get("mentions") == old.get("mentions") and not dirty:
+            return {"changed": False}
+
+        # nuovi articoli: per id, uniti alle partizioni del loro mese
+        max_id = int(state.get("max_id") or 0)
+        new = bulk.fetch_all("articles", ", ".join(ARTICLE_COLUMNS), where=lambda q: q.gt("id", max_id))
+        for month, rows in _by_month(new).items():
+            if month not in dirty:
+                _write_partition("articles", month, rows, merge=True)
+        _refresh_views()
+
+        # mesi modificati o con conteggi diversi dal database: riletti interi
+        if marks.get("articles") != old.get("articles"):
+            snap = _snapshot_month_counts()
+            dirty |= {m for m, n in _db_month_counts().items() if snap.get(m, 0) != n}
+        _reload_months(dirty)
+
+        if marks.get("mentions") != old.get("mentions") or new:
+            _rewrite_mentions()
+
+        state.update(max_id=max([max_id] + [int(a["id"]) for a in new]), watermarks=marks, dirty=[])
+        _save_state()
+        _refresh_views()
+    http_cache.bump("analytics")
+    return {"changed": True, "new": len(new), "reloaded_months": sorted(dirty)}
+
+
+def mark_dirty(*days) -> None:
+    """Mesi da rileggere al prossimo refresh (modifiche e cancellazioni di articoli)."""
+    if not ENABLED:
+        return
+    with _lock:
+        state = _load_state()
+        state["dirty"] = sorted(set(state.get("dirty") or []) | {str(d)[:7] for d in days if d})
+        _save_state()
+
+
+def start_refresher() -> None:
+    """Refresh in background ogni REFRESH_SECONDS."""
+    if not ENABLED:
+        print("[ANALYTICS] disattivato (duckdb non installato o SPIZ_ANALYTICS=0)")
+        return
+
+    def _loop():
+        while True:
+            try:
+                refresh()
+            except Exception as e:
+                print(f"[ANALYTICS] refresh fallito: {e}")
+            time.sleep(REFRESH_SECONDS)
+
+    threading.Thread(target=_loop, daemon=True, name="analytics-refresh").start()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# INTERROGAZIONI
+# ══════════════════════════════════════════════════════════════════════
+
+def ready() -> bool:
+    """True se lo snapshot è stato costruito e le viste sono pronte."""
+    if not ENABLED:
+        return False
+    state = _load_state()
+    if not state.get("full_at") or not _months_on_disk("articles"):
+        return False
+    if not _con["views"]:
+        _refresh_views()
+    return True
+
+
+def _query(sql: str, params: list = None) -> list:
+    con = _connection().cursor()
+    try:
+        return con.execute(sql, params or []).fetchall()
+    finally:
+        con.close()
+
+
+def _source(dims) -> str:
+    src = "articles"
+    if "macrosettore" in dims:
+        src = ("(SELECT *, trim(unnest(string_split(coalesce(macrosettori, ''), ','))) AS macrosettore "
+               "FROM articles)")
+    sql = f"FROM {src} a"
+    if "client" in dims:
+        sql += " JOIN mentions c ON c.article_id = a.id"
+    return sql
+
+
+def _period(from_date: str, to_date: str) -> tuple:
+    # il filtro sul mese fa saltare le partizioni fuori dal periodo
+    return ("a.data BETWEEN CAST(? AS DATE) AND CAST(? AS DATE) AND a.month BETWEEN ? AND ?",
+            [from_date, to_date, from_date[:7], to_date[:7]])
+
+
+def dashboard_counts(today: date) -> dict:
+    row = _query(
+        "SELECT count(*), count(*) FILTER (WHERE data = ?), "
+        "count(*) FILTER (WHERE data >= ? - INTERVAL 7 DAY), "
+        "count(*) FILTER (WHERE data >= ? - INTERVAL 30 DAY) FROM articles",
+        [today, today, today],
+    )[0]
+    return dict(zip(("totale", "oggi", "settimana", "mese"), (int(v or 0) for v in row)))
+
+
+def grouped_counts(from_date: str, to_date: str, dims, limit: int) -> dict:
+    """Stesso formato di services.stats.grouped_counts."""
+    where, params = _period(from_date, to_date)
+    out = {"total": int(_query(f"SELECT count(*) FROM articles a WHERE {where}", params)[0][0])}
+    for d in dims:
+        expr = DIMENSIONS["day" if d == "day" else d]
+        if d == "day":
+            rows = _query(f"SELECT {expr}, count(*) {_source([d])} WHERE {where} GROUP BY 1 ORDER BY 1", params)
+        else:
+            rows = _query(
+                f"SELECT {expr} AS k, count(*) AS n {_source([d])} WHERE {where} AND coalesce({expr}, '') <> '' "
+                f"GROUP BY 1 ORDER BY n DESC, k LIMIT ?", params + [limit])
+        out[d] = [(k, int(n)) for k, n in rows]
+    return out
+
+
+def matrix(row_dim: str, col_dim: str, from_date: str, to_date: str,
+           measure: str = "n", limit: int = 50) -> dict:
+    """
+    Tabella incrociata fra due dimensioni (es. giornalista × macrosettore,
+    testata × month con misura tone): {"rows", "cols", "values"}; measure è
+    "n" (articoli) o "ave" (somma AVE). Le righe sono le `limit` più frequenti.
+    """
+    if row_dim not in DIMENSIONS or col_dim not in DIMENSIONS:
+        raise ValueError(f"dimensioni ammesse: {', '.join(DIMENSIONS)}")
+    if measure not in ("n", "ave"):
+        raise ValueError("measure ammesse: n, ave")
+    r, c    = DIMENSIONS[row_dim], DIMENSIONS[col_dim]
+    value   = "count(*)" if measure == "n" else "round(sum(a.ave), 2)"
+    where, params = _period(from_date, to_date)
+    rows = _query(
+        f"WITH base AS (SELECT {r} AS r, {c} AS c, {value} AS v {_source([row_dim, col_dim])} "
+        f"WHERE {where} AND coalesce({r}, '') <> '' AND coalesce({c}, '') <> '' GROUP BY 1, 2), "
+        f"top AS (SELECT r FROM base GROUP BY r ORDER BY sum(v) DESC, r LIMIT ?) "
+        f"SELECT base.r, base.c, base.v FROM base JOIN top USING (r)",
+        params + [limit],
+    )
+    totals = defaultdict(float)
+    for rk, _, v in rows:
+        totals[rk] += v
+    row_keys = sorted(totals, key=lambda k: (-totals[k], k))
+    col_keys = sorted({ck for _, ck, _ in rows})
+    ri, ci   = {k: i for i, k in enumerate(row_keys)}, {k: i for i, k in enumerate(col_keys)}
+    values   = [[0] * len(col_keys) for _ in row_keys]
+    for rk, ck, v in rows:
+        values[ri[rk]][ci[ck]] = v
+    return {"row_dim": row_dim, "col_dim": col_dim, "measure": measure,
+            "rows": row_keys, "cols": col_keys, "values": values}
+
+
+def period_stats(from_date: str, to_date: str) -> dict:
+    """Statistiche del periodo per l'intent quantitativo della chat (stesso formato di chat._stats, più AVE)."""
+    g = grouped_counts(from_date, to_date, ("testata", "giornalista", "tone"), 50)
+    if not g["total"]:
+        return {}
+    where, params = _period(from_date, to_date)
+    first, last, ave = _query(f"SELECT min(a.data), max(a.data), sum(a.ave) FROM articles a WHERE {where}", params)[0]
+    tone_tot = sum(n for _, n in g["tone"]) or 1
+    ave_clienti = _query(
+        f"SELECT c.client_id, round(sum(a.ave), 2) {_source(['client'])} WHERE {where} "
+        f"GROUP BY 1 ORDER BY 2 DESC LIMIT 20", params)
+    return {
+        "totale":      g["total"],
+        "periodo_da":  str(first or ""),
+        "periodo_a":   str(last or ""),
+        "testate":     dict(g["testata"][:20]),
+        "giornalisti": dict(g["giornalista"][:50]),
+        "sentiment":   {k: round(n / tone_tot * 100) for k, n in g["tone"]},
+        "ave_totale":  round(ave or 0, 2),
+        "ave_clienti": {str(k): float(v) for k, v in ave_clienti},
+    }
+
+
+def journalist_profiles(from_date: str, to_date: str, skip=()) -> list:
+    """Profili per il Pitch Advisor: conteggi, testata prevalente, macrosettori, titoli e ultimi articoli."""
+    where, params = _period(from_date, to_date)
+    rows = _query(
+        f"SELECT trim(a.giornalista), count(*), mode(a.testata), "
+        f"list_filter(list_distinct(list_transform(flatten(list(string_split(coalesce(a.macrosettori, ''), ','))), "
+        f"x -> trim(x))), x -> x <> ''), "
+        f"list(coalesce(a.titolo, '') ORDER BY a.data DESC), "
+        f"list(struct_pack(titolo := coalesce(a.titolo, ''), data := CAST(a.data AS VARCHAR)) ORDER BY a.data DESC)[1:3] "
+        f"FROM articles a WHERE {where} AND coalesce(trim(a.giornalista), '') NOT IN (SELECT unnest(?)) "
+        f"GROUP BY 1",
+        params + [list(skip)],
+    )
+    return [{
+        "nome":         g,
+        "testata":      testata or "N/D",
+        "n_articoli":   int(n),
+        "macrosettori": sorted(macros or []),
+        "titoli":       titoli or [],
+        "articoli":     [dict(a) for a in recenti or []],
+    } for g, n, testata, macros, titoli, recenti in rows]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Snapshot analitico DuckDB di SPIZ")
+    ap.add_argument("--rebuild", action="store_true", help="ricostruisce tutto lo snapshot")
+    ap.add_argument("--refresh", action="store_true", help="aggiornamento incrementale")
+    args = ap.parse_args()
+    if args.rebuild:
+        rebuild()
+    elif args.refresh:
+        print(refresh())
+    else:
+        ap.print_help()
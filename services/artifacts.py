@@ -0,0 +1,145 @@
+"""
+services/artifacts.py — Archivio condiviso dei report generati
+Sostituisce il dict _DOCX_STORE di main.py: metadati nell'archivio SQLite
+locale, file in una directory gestita. Ogni worker uvicorn sullo stesso
+host vede gli stessi token, un thread di pulizia elimina i file scaduti
+e un tetto di dimensione espelle i meno usati.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from services.local_store import connect, register_schema
+
+ARTIFACT_DIR = os.getenv("SPIZ_ARTIFACT_DIR", "data/reports")
+TTL_SEC      = int(os.getenv("SPIZ_ARTIFACT_TTL", "3600"))
+MAX_BYTES    = int(os.getenv("SPIZ_ARTIFACT_MAX_MB", "500")) * 1024 * 1024
+SWEEP_SEC    = 300
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS artifacts (
+    token       TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    media_type  TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_expires ON artifacts(expires_at);
+CREATE INDEX IF NOT EXISTS artifacts_access ON artifacts(last_access);
+""")
+
+_sweeper_started = False
+
+
+def put(src_path: str, filename: str = None, media_type: str = DOCX_MEDIA_TYPE, ttl: int = TTL_SEC) -> str | None:
+    """Sposta il file nella directory gestita e restituisce il token di download."""
+    if not src_path or not os.path.exists(src_path):
+        return None
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    token = str(uuid.uuid4())
+    ext   = os.path.splitext(src_path)[1]
+    dest  = os.path.join(ARTIFACT_DIR, token + ext)
+    shutil.move(src_path, dest)
+
+    now = time.time()
+    connect().execute(
+        "INSERT INTO artifacts (token, path, filename, media_type, size, created_at, expires_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (token, dest, filename or os.path.basename(src_path), media_type,
+         os.path.getsize(dest), now, now + ttl, now),
+    )
+    evict_to_cap()
+    return token
+
+
+def get(token: str) -> dict | None:
+    """Metadati del token (con 'expired': bool) oppure None se sconosciuto."""
+    conn = connect()
+    row  = conn.execute("SELECT * FROM artifacts WHERE token = ?", (token,)).fetchone()
+    if not row:
+        return None
+    entry = dict(row)
+    entry["expired"] = time.time() > entry["expires_at"]
+    if not entry["expired"]:
+        conn.execute("UPDATE artifacts SET last_access = ? WHERE token = ?", (time.time(), token))
+    return entry
+
+
+def delete(token: str) -> None:
+    conn = connect()
+    row  = conn.execute("SELECT path FROM artifacts WHERE token = ?", (token,)).fetchone()
+    conn.execute("DELETE FROM artifacts WHERE token = ?", (token,))
+    if row:
+        _remove_file(row["path"])
+
+
+def sweep() -> int:
+    """Elimina artefatti scaduti e file orfani nella directory gestita."""
+    conn    = connect()
+    now     = time.time()
+    expired = conn.execute("SELECT token FROM artifacts WHERE expires_at < ?", (now,)).fetchall()
+    for r in expired:
+        delete(r["token"])
+
+    if os.path.isdir(ARTIFACT_DIR):
+        known = {r["path"] for r in conn.execute("SELECT path FROM artifacts")}
+        for name in os.listdir(ARTIFACT_DIR):
+            path = os.path.join(ARTIFACT_DIR, name)
+            try:
+                if path not in known and now - os.path.getmtime(path) > TTL_SEC:
+                    _remove_file(path)
+            except OSError:
+                pass
+    return len(expired)
+
+
+def evict_to_cap(max_bytes: int = MAX_BYTES) -> int:
+    """Espelle i meno usati di recente finché la directory sta sotto il tetto."""
+    conn  = connect()
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    evicted = 0
+    for r in conn.execute("SELECT token, size FROM artifacts ORDER BY last_access").fetchall():
+        if total <= max_bytes:
+            break
+        delete(r["token"])
+        total   -= r["size"]
+        evicted += 1
+    print(f"[ARTIFACTS] Espulsi {evicted} file per tetto dimensione")
+    return evicted
+
+
+def start_sweeper(interval: int = SWEEP_SEC) -> None:
+    global _sweeper_started
+    if _sweeper_started:
+        return
+    _sweeper_started = True
+
+    def _loop():
+        while True:
+            try:
+                n = sweep()
+                if n:
+                    print(f"[ARTIFACTS] Rimossi {n} report scaduti")
+            except Exception as e:
+                print(f"[ARTIFACTS] sweep error: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=_loop, daemon=True).start()
+
+
+def _remove_file(path: str) -> None:
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"[ARTIFACTS] impossibile rimuovere {path}: {e}")
@@ -0,0 +1,70 @@
+"""
+services/bulk.py — Lettura a pagine di range ampi da Supabase
+Una singola .execute() su un range non limitato viene troncata da
+PostgREST al suo max-rows (1000 di default) senza alcun errore: le
+statistiche finivano calcolate su un campione. iter_rows() conta le
+righe, le legge a pagine di Range con al più WORKERS richieste in volo
+sul client asincrono (services/db.py) e le restituisce in ordine come
+generatore: in memoria restano al più WORKERS pagine alla volta.
+
+    rows = bulk.iter_rows("articles", "giornalista, testata, data",
+                          where=lambda q: q.gte("data", from_date))
+"""
+
+import os
+from collections import deque
+
+from services.database import supabase
+
+PAGE_SIZE = int(os.getenv("SPIZ_BULK_PAGE_SIZE", "1000"))   # ≤ max-rows di PostgREST
+WORKERS   = int(os.getenv("SPIZ_BULK_WORKERS", "4"))
+
+
+def _query(table: str, columns: str, where, order: list, count: str = None):
+    q = supabase.table(table).select(columns, count=count) if count else supabase.table(table).select(columns)
+    if where:
+        q = where(q)
+    for col, desc in order:
+        q = q.order(col, desc=desc)
+    return q
+
+
+def count_rows(table: str, where=None, column: str = "id") -> int:
+    res = _query(table, column, where, [], count="exact").limit(1).execute()
+    return res.count or 0
+
+
+def iter_rows(table: str, columns: str, where=None, order=None,
+              page_size: int = PAGE_SIZE, workers: int = WORKERS, limit: int = None):
+    """
+    Tutte le righe di `table` che soddisfano `where` (funzione query → query),
+    ordinate per `order` (lista di (colonna, desc); default id crescente, che
+    rende stabile la paginazione). `limit` ferma la lettura prima.
+    """
+    order = order or [("id", False)]
+    total = count_rows(table, where, column=order[0][0])
+    if limit is not None:
+        total = min(total, limit)
+    if not total:
+        return
+
+    def fetch(offset: int):
+        end = min(offset + page_size, total) - 1
+        return _query(table, columns, where, order).range(offset, end).submit()
+
+    offsets  = iter(range(0, total, page_size))
+    inflight = deque()
+    for off in offsets:
+        inflight.append(fetch(off))
+        if len(inflight) >= max(1, workers):
+            break
+    while inflight:
+        page = inflight.popleft().result().data or []
+        nxt  = next(offsets, None)
+        if nxt is not None:
+            inflight.append(fetch(nxt))
+        yield from page
+
+
+def fetch_all(table: str, columns: str, where=None, order=None, **kw) -> list:
+    return list(iter_rows(table, columns, where=where, order=order, **kw))
@@ -1,11 +1,12 @@
-import os
-from supabase import create_client
 from dotenv import load_dotenv
 
 load_dotenv()
 
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+# Client dati condiviso: stesse chiamate del client supabase, su trasporto
+# asincrono con pool, timeout e retry (services/db.py).
+# SPIZ_DB_BACKEND=memory usa il doppione in-process (services/fake_supabase.py)
+from services.db import client as supabase
 
 def upsert_article(data):
     # On_conflict usa l'hash per evitare doppioni se ricarichi lo stesso file
-    return supabase.table("articles").upsert(data, on_conflict="content_hash").execute()
\ No newline at end of file
+    return supabase.table("articles").upsert(data, on_conflict="content_hash").execute()
@@ -0,0 +1,400 @@
+"""
+services/db.py — Accesso ai dati: trasporto asincrono con pool
+Stesse chiamate del client supabase (table().select().eq()...execute(),
+rpc()), ma eseguite su un unico client httpx asincrono verso PostgREST:
+connessioni keep-alive in pool, HTTP/2 se è installato h2, timeout per
+chiamata e retry con backoff esponenziale e jitter sugli errori
+transitori. Le query girano su un event loop dedicato, quindi:
+
+    res = db.table("articles").select("id").eq("data", d).execute()      # da codice sincrono
+    res = await db.table("articles").select("id").eq("data", d).run()    # da codice async
+    a, b = db.execute_all(q1, q2)                                        # query indipendenti in parallelo
+    fut = q.submit()                                                     # concurrent.futures.Future
+
+Con SPIZ_DB_BACKEND=memory le query vanno al doppione in-process
+(services/fake_supabase.py) invece che a Supabase.
+"""
+
+import asyncio
+import concurrent.futures
+import importlib.util
+import json
+import os
+import random
+import threading
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKEND         = os.getenv("SPIZ_DB_BACKEND", "supabase").lower()
+TIMEOUT         = float(os.getenv("SPIZ_DB_TIMEOUT", "15"))          # secondi per chiamata
+CONNECT_TIMEOUT = float(os.getenv("SPIZ_DB_CONNECT_TIMEOUT", "5"))
+POOL_SIZE       = int(os.getenv("SPIZ_DB_POOL_SIZE", "20"))          # connessioni aperte al massimo
+KEEPALIVE       = int(os.getenv("SPIZ_DB_KEEPALIVE", "10"))          # connessioni tenute vive
+RETRIES         = int(os.getenv("SPIZ_DB_RETRIES", "3"))
+BACKOFF_BASE    = 0.2
+BACKOFF_MAX     = 4.0
+RETRY_STATUS    = {408, 429, 500, 502, 503, 504}
+
+
+class APIError(Exception):
+    def __init__(self, message: str, status: int = None, code: str = None):
+        super().__init__(message)
+        self.status, self.code = status, code
+
+
+# ══════════════════════════════════════════════════════════════════════
+# EVENT LOOP DEDICATO
+# ══════════════════════════════════════════════════════════════════════
+
+_loop_lock   = threading.Lock()
+_loop_holder = {"loop": None}
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    with _loop_lock:
+        loop = _loop_holder["loop"]
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="db-loop").start()
+            _loop_holder["loop"] = loop
+        return loop
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """Esegue una coroutine sul loop del database; restituisce un Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _loop())
+
+
+def run_sync(coro):
+    loop = _loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("execute() sincrono chiamato dal loop del database: usare await .run()")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# QUERY
+# ══════════════════════════════════════════════════════════════════════
+
+class Query:
+    """Costruttore di query con le stesse chiamate del client supabase."""
+
+    def __init__(self, client: "Client", table: str):
+        self.client  = client
+        self.table   = table
+        self.calls   = []        # (metodo, args, kwargs) nell'ordine di chiamata
+        self.timeout = None
+
+    def _add(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+        return self
+
+    # operazioni
+    def select(self, columns: str = "*", count: str = None):
+        return self._add("select", columns, count=count)
+
+    def insert(self, rows):
+        return self._add("insert", rows)
+
+    def upsert(self, rows, on_conflict: str = None, ignore_duplicates: bool = False):
+        return self._add("upsert", rows, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+
+    def update(self, values: dict):
+        return self._add("update", values)
+
+    def delete(self):
+        return self._add("delete")
+
+    # filtri e modificatori
+    def eq(self, col, v):            return self._add("eq", col, v)
+    def neq(self, col, v):           return self._add("neq", col, v)
+    def gt(self, col, v):            return self._add("gt", col, v)
+    def gte(self, col, v):           return self._add("gte", col, v)
+    def lt(self, col, v):            return self._add("lt", col, v)
+    def lte(self, col, v):           return self._add("lte", col, v)
+    def in_(self, col, values):      return self._add("in_", col, list(values))
+    def is_(self, col, v):           return self._add("is_", col, v)
+    def ilike(self, col, pattern):   return self._add("ilike", col, pattern)
+    def or_(self, filters: str):     return self._add("or_", filters)
+    def order(self, col, desc: bool = False): return self._add("order", col, desc=desc)
+    def limit(self, n: int):         return self._add("limit", n)
+    def range(self, start: int, end: int): return self._add("range", start, end)
+
+    def with_timeout(self, seconds: float):
+        """Timeout di questa sola chiamata (default SPIZ_DB_TIMEOUT)."""
+        self.timeout = seconds
+        return self
+
+    @property
+    def verb(self) -> str:
+        return next((c[0] for c in self.calls if c[0] in ("select", "insert", "upsert", "update", "delete")), "select")
+
+    async def _execute(self):
+        return await self.client.backend.execute(self)
+
+    async def run(self):
+        """Versione async di execute()."""
+        return await _on_db_loop(self._execute())
+
+    def submit(self) -> concurrent.futures.Future:
+        return submit(self._execute())
+
+    def execute(self):
+        return run_sync(self._execute())
+
+
+class Rpc:
+    def __init__(self, client: "Client", name: str, params: dict, idempotent: bool = True):
+        self.client, self.name, self.params = client, name, params or {}
+        self.idempotent = idempotent
+        self.timeout    = None
+
+    def with_timeout(self, seconds: float):
+        self.timeout = seconds
+        return self
+
+    async def _execute(self):
+        return await self.client.backend.rpc(self)
+
+    async def run(self):
+        return await _on_db_loop(self._execute())
+
+    def submit(self) -> concurrent.futures.Future:
+        return submit(self._execute())
+
+    def execute(self):
+        return run_sync(self._execute())
+
+
+async def _on_db_loop(coro):
+    loop = _loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def execute_all(*queries) -> list:
+    """Esegue query indipendenti in parallelo; risultati nello stesso ordine."""
+    futures = [q.submit() for q in queries]
+    return [f.result() for f in futures]
+
+
+async def gather(*queries) -> list:
+    return list(await asyncio.gather(*(q.run() for q in queries)))
+
+
+# ══════════════════════════════════════════════════════════════════════
+# BACKEND HTTP (PostgREST)
+# ══════════════════════════════════════════════════════════════════════
+
+def _raw(v) -> str:
+    return "null" if v is None else str(v).lower() if isinstance(v, bool) else str(v)
+
+
+def _quote(v) -> str:
+    """Valore dentro una lista in.(...): tra virgolette se contiene caratteri riservati."""
+    s = _raw(v)
+    if any(ch in s for ch in ',()"\\:') or s != s.strip():
+        s = '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return s
+
+
+class HttpBackend:
+    def __init__(self, url: str, key: str):
+        self.base    = url.rstrip("/") + "/rest/v1"
+        self.headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self._http   = None
+
+    def _client(self):
+        # creato al primo uso, dentro il loop dedicato che poi lo usa sempre
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                base_url=self.base,
+                headers=self.headers,
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=KEEPALIVE),
+            )
+        return self._http
+
+    def _request(self, q: Query) -> tuple:
+        params, headers, body = [], {}, None
+        method, prefer = "GET", []
+        order, limit, offset, count = [], None, None, None
+        for name, args, kw in q.calls:
+            if name == "select":
+                params.append(("select", "".join(args[0].split())))
+                count = kw.get("count")
+            elif name == "insert":
+                method, body = "POST", args[0]
+                prefer.append("return=representation")
+            elif name == "upsert":
+                method, body = "POST", args[0]
+                prefer += ["resolution=" + ("ignore" if kw.get("ignore_duplicates") else "merge") + "-duplicates",
+                           "return=representation"]
+                if kw.get("on_conflict"):
+                    params.append(("on_conflict", kw["on_conflict"]))
+            elif name == "update":
+                method, body = "PATCH", args[0]
+                prefer.append("return=representation")
+            elif name == "delete":
+                method = "DELETE"
+                prefer.append("return=representation")
+            elif name in ("eq", "neq", "gt", "gte", "lt", "lte", "ilike"):
+                params.append((args[0], f"{name}.{_raw(args[1])}"))
+            elif name == "is_":
+                params.append((args[0], f"is.{'null' if args[1] in (None, 'null') else str(args[1]).lower()}"))
+            elif name == "in_":
+                params.append((args[0], "in.(" + ",".join(_quote(v) for v in args[1]) + ")"))
+            elif name == "or_":
+                params.append(("or", f"({args[0]})"))
+            elif name == "order":
+                order.append(f"{args[0]}.{'desc' if kw.get('desc') else 'asc'}")
+            elif name == "limit":
+                limit = args[0]
+            elif name == "range":
+                offset, limit = args[0], args[1] - args[0] + 1
+        if order:
+            params.append(("order", ",".join(order)))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset:
+            params.append(("offset", str(offset)))
+        if count:
+            prefer.append(f"count={count}")
+        if prefer:
+            headers["Prefer"] = ",".join(prefer)
+        return method, f"/{q.table}", params, headers, body
+
+    async def _send(self, method, path, params, headers, body, timeout, idempotent: bool):
+        import httpx
+        attempt = 0
+        while True:
+            try:
+                res = await self._client().request(
+                    method, path, params=params, headers=headers,
+                    content=None if body is None else json.dumps(body, default=str),
+                    timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+                )
+                if res.status_code not in RETRY_STATUS or not idempotent or attempt >= RETRIES:
+                    return res
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # la richiesta non è partita: si può sempre ripetere
+                if attempt >= RETRIES:
+                    raise
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if not idempotent or attempt >= RETRIES:
+                    raise
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+            attempt += 1
+
+    @staticmethod
+    def _raise_for(res):
+        if res.status_code < 400:
+            return
+        try:
+            err = res.json()
+            msg = err.get("message") or res.text
+            raise APIError(f"{msg} ({err.get('code')})", status=res.status_code, code=err.get("code"))
+        except ValueError:
+            raise APIError(res.text or f"HTTP {res.status_code}", status=res.status_code)
+
+    async def execute(self, q: Query):
+        method, path, params, headers, body = self._request(q)
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        # gli insert senza on_conflict non si ripetono: il primo tentativo potrebbe essere andato a buon fine
+        idempotent = q.verb != "insert"
+        res = await self._send(method, path, params, headers, body, q.timeout, idempotent)
+        self._raise_for(res)
+        count = None
+        rng   = res.headers.get("content-range", "")
+        if "/" in rng and rng.rsplit("/", 1)[1] != "*":
+            count = int(rng.rsplit("/", 1)[1])
+        return SimpleNamespace(data=res.json() if res.content else [], count=count)
+
+    async def rpc(self, r: Rpc):
+        res = await self._send("POST", f"/rpc/{r.name}", [], {"Content-Type": "application/json"},
+                               r.params, r.timeout, idempotent=r.idempotent)
+        self._raise_for(res)
+        return SimpleNamespace(data=res.json() if res.content else None, count=None)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# BACKEND IN MEMORIA
+# ══════════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Riproduce le chiamate sul doppione in-process, in un thread per non bloccare il loop."""
+
+    def __init__(self, path: str = None):
+        from services.fake_supabase import FakeSupabase
+        self.store = FakeSupabase(path=path)
+
+    def _run(self, q: Query):
+        target = self.store.table(q.table)
+        for name, args, kw in q.calls:
+            target = getattr(target, name)(*args, **kw)
+        try:
+            return target.execute()
+        except Exception as e:
+            raise APIError(str(e)) from e
+
+    def _rpc(self, r: Rpc):
+        try:
+            return self.store.rpc(r.name, r.params).execute()
+        except Exception as e:
+            raise APIError(str(e)) from e
+
+    async def execute(self, q: Query):
+        return await asyncio.to_thread(self._run, q)
+
+    async def rpc(self, r: Rpc):
+        return await asyncio.to_thread(self._rpc, r)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# CLIENT
+# ══════════════════════════════════════════════════════════════════════
+
+class Client:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+    def from_(self, name: str) -> Query:
+        return self.table(name)
+
+    def rpc(self, name: str, params: dict = None, idempotent: bool = True) -> Rpc:
+        """idempotent=False per le funzioni che scrivono in modo incrementale: niente retry dopo l'invio."""
+        return Rpc(self, name, params, idempotent)
+
+    @property
+    def store(self):
+        """Il doppione in memoria (solo con SPIZ_DB_BACKEND=memory), per seed e benchmark."""
+        return getattr(self.backend, "store", None)
+
+
+def _make_client() -> Client:
+    if BACKEND == "memory":
+        return Client(MemoryBackend(path=os.getenv("SPIZ_FAKE_DB_PATH")))
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL e SUPABASE_KEY non impostate")
+    return Client(HttpBackend(url, key))
+
+
+client = _make_client()
+table  = client.table
+rpc    = client.rpc
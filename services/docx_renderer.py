@@ -0,0 +1,278 @@
+"""
+services/docx_renderer.py — Pool persistente di worker DOCX
+Invece di lanciare `node api/docx_builder.js` per ogni report, tiene vivi
+alcuni processi Node in modalità --worker (JSON per riga su stdin/stdout):
+startup di Node e require('docx') si pagano una volta sola.
+Il pool ha un tetto di concorrenza, timeout per job, health check sui
+worker inattivi e riavvio automatico se un processo muore.
+Se Node o il modulo docx mancano si usa un renderer Python minimale.
+"""
+
+import atexit
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+BUILDER_JS   = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api", "docx_builder.js")
+POOL_SIZE    = int(os.getenv("SPIZ_DOCX_WORKERS", "2"))
+JOB_TIMEOUT  = float(os.getenv("SPIZ_DOCX_TIMEOUT", "30"))
+ACQUIRE_WAIT = 60      # attesa massima di un worker libero
+PING_AFTER   = 60      # health check se il worker è fermo da più di così
+PING_TIMEOUT = 5
+
+
+# ══════════════════════════════════════════════════════════════════════
+# WORKER NODE
+# ══════════════════════════════════════════════════════════════════════
+
+class _NodeWorker:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            ["node", BUILDER_JS, "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=os.path.dirname(os.path.dirname(BUILDER_JS)),
+        )
+        self.lines     = queue.Queue()
+        self.last_used = time.time()
+        self.seq       = 0
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    def _read_stdout(self):
+        for line in self.proc.stdout:
+            self.lines.put(line)
+        self.lines.put(None)   # EOF: processo terminato
+
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            print(f"[DOCX] node: {line.rstrip()}")
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def call(self, request: dict, timeout: float) -> dict:
+        self.seq += 1
+        request["id"] = self.seq
+        self.proc.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self.proc.stdin.flush()
+        deadline = time.time() + timeout
+        while True:
+            line = self.lines.get(timeout=max(0.01, deadline - time.time()))
+            if line is None:
+                raise RuntimeError("worker node terminato")
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                continue
+            if reply.get("id") == self.seq:
+                self.last_used = time.time()
+                return reply
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class DocxRenderPool:
+    def __init__(self, size: int = POOL_SIZE):
+        self.size    = max(1, size)
+        self.idle    = queue.Queue()
+        self.spawned = 0
+        self.lock    = threading.Lock()
+
+    def _acquire(self) -> _NodeWorker:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.spawned < self.size:
+                self.spawned += 1
+                try:
+                    return _NodeWorker()
+                except Exception:
+                    self.spawned -= 1
+                    raise
+        return self.idle.get(timeout=ACQUIRE_WAIT)
+
+    def _release(self, worker: _NodeWorker, healthy: bool):
+        if healthy and worker.alive():
+            self.idle.put(worker)
+            return
+        worker.kill()
+        with self.lock:
+            self.spawned -= 1
+
+    def _healthy(self, worker: _NodeWorker) -> bool:
+        if not worker.alive():
+            return False
+        if time.time() - worker.last_used < PING_AFTER:
+            return True
+        try:
+            return bool(worker.call({"ping": True}, PING_TIMEOUT).get("pong"))
+        except Exception:
+            return False
+
+    def render(self, payload: dict, out_path: str, timeout: float = JOB_TIMEOUT) -> bool:
+        # Un tentativo di riserva se il worker era morto o non rispondeva al ping
+        for attempt in range(2):
+            worker = self._acquire()
+            if not self._healthy(worker):
+                self._release(worker, healthy=False)
+                continue
+            try:
+                reply = worker.call({"out_path": out_path, "payload": payload}, timeout)
+            except Exception as e:
+                print(f"[DOCX] worker fallito ({e}), riavvio")
+                self._release(worker, healthy=False)
+                if isinstance(e, queue.Empty):
+                    return False   # timeout del job: non ritentare
+                continue
+            self._release(worker, healthy=True)
+            if not reply.get("ok"):
+                print(f"[DOCX] render error: {reply.get('error')}")
+                return False
+            return True
+        return False
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+# ══════════════════════════════════════════════════════════════════════
+# FALLBACK PYTHON
+# ══════════════════════════════════════════════════════════════════════
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+
+def _run(text: str, bold: bool = False, size: int = 22, color: str = "1A1A1A") -> str:
+    props = f'<w:rFonts w:ascii="Arial" w:hAnsi="Arial"/>{"<w:b/>" if bold else ""}<w:color w:val="{color}"/><w:sz w:val="{size}"/>'
+    return f'<w:r><w:rPr>{props}</w:rPr><w:t xml:space="preserve">{escape(text)}</w:t></w:r>'
+
+
+def _para(runs: str, indent: int = 0) -> str:
+    ppr = f'<w:pPr><w:ind w:left="{indent}"/></w:pPr>' if indent else ""
+    return f"<w:p>{ppr}{runs}</w:p>"
+
+
+def _inline(line: str) -> str:
+    parts = line.split("**")
+    return "".join(_run(p, bold=(i % 2 == 1)) for i, p in enumerate(parts) if p)
+
+
+def render_python(payload: dict, out_path: str) -> bool:
+    """Versione essenziale del documento (titolo, scheda corpus, testo) senza Node."""
+    stats = payload.get("stats") or {}
+    body  = [
+        _para(_run((payload.get("topic") or "REPORT").upper(), bold=True, size=48, color="1F3A6E")),
+        _para(_run(f"Analisi mediatica — SPIZ AI  |  {payload.get('date', '')}", color="555555")),
+    ]
+    if stats:
+        sentiment = " | ".join(f"{k}: {v}%" for k, v in (stats.get("sentiment") or {}).items()) or "N/D"
+        for label, value in (
+            ("Articoli letti", str(stats.get("totale", 0))),
+            ("Periodo", f"{stats.get('periodo_da', '')} → {stats.get('periodo_a', '')}"),
+            ("Testate", ", ".join(list(stats.get("testate") or {})[:12]) or "N/D"),
+            ("Sentiment", sentiment),
+        ):
+            body.append(_para(_run(f"{label}: ", bold=True, color="1F3A6E") + _run(value)))
+
+    for raw in (payload.get("report_text") or "").split("\n"):
+        line = raw.strip()
+        if not line:
+            body.append("<w:p/>")
+        elif line.startswith("### "):
+            body.append(_para(_run(line[4:], bold=True, size=25, color="1F3A6E")))
+        elif line.startswith("## "):
+            body.append(_para(_run(line[3:], bold=True, size=30, color="1F3A6E")))
+        elif line.startswith(("- ", "• ")):
+            body.append(_para(_run("• ", bold=True, color="1F3A6E") + _inline(line[2:]), indent=480))
+        else:
+            body.append(_para(_inline(line)))
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+        '<w:pgMar w:top="1134" w:right="1134" w:bottom="1134" w:left="1134"/></w:sectPr></w:body></w:document>'
+    )
+    try:
+        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("[Content_Types].xml", _CONTENT_TYPES)
+            z.writestr("_rels/.rels", _RELS)
+            z.writestr("word/document.xml", document)
+        return True
+    except Exception as e:
+        print(f"[DOCX] fallback python error: {e}")
+        return False
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ENTRY POINT
+# ══════════════════════════════════════════════════════════════════════
+
+_pool      = None
+_pool_lock = threading.Lock()
+
+
+def _node_available() -> bool:
+    root = os.path.dirname(os.path.dirname(BUILDER_JS))
+    return (
+        shutil.which("node") is not None
+        and os.path.exists(BUILDER_JS)
+        and os.path.isdir(os.path.join(root, "node_modules", "docx"))
+    )
+
+
+def get_pool() -> DocxRenderPool | None:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not _node_available():
+                    print("[DOCX] node/docx non disponibili: uso il renderer python")
+                    _pool = False
+                else:
+                    _pool = DocxRenderPool()
+                    atexit.register(_pool.close)
+    return _pool or None
+
+
+def render(payload: dict, out_path: str) -> bool:
+    pool = get_pool()
+    if pool:
+        try:
+            if pool.render(payload, out_path):
+                return True
+        except Exception as e:
+            print(f"[DOCX] pool error: {e}")
+        print("[DOCX] ripiego sul renderer python")
+    return render_python(payload, out_path)
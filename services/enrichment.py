@@ -0,0 +1,210 @@
+"""
+services/enrichment.py — Tono e rischio reputazionale delle menzioni web
+Il monitor salva le menzioni con tone e reputational_risk vuoti; questa
+fase le classifica a lotti: ogni richiesta a gpt-4o-mini porta BATCH_SIZE
+menzioni (titolo, testata, sommario e l'inizio del testo completo, riletto
+dalla cache di services/fulltext.py) e riceve un JSON con una voce per
+menzione. Le richieste partono in parallelo (al più CONCURRENCY) entro un
+budget per giro (MAX_PER_RUN menzioni, BUDGET_USD di costo stimato), le
+più recenti per prime; i risultati si scrivono con un UPDATE per coppia
+(tono, rischio), non uno per riga.
+
+Il ciclo gira sul leader di services/scheduler.py: si sveglia subito
+quando il monitor inserisce menzioni nuove (notify) e comunque ogni
+TICK_SECONDS, così le menzioni a rischio Alto compaiono pochi secondi dopo
+la cattura. Per le menzioni salvate prima di questa fase (tono 'Neutral'
+e rischio 'None' fissi):
+
+    python -m services.enrichment --legacy
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.database import supabase
+from services import llm, metrics, http_cache, fulltext, scheduler
+
+MODEL        = os.getenv("SPIZ_ENRICH_MODEL", "gpt-4o-mini")
+BATCH_SIZE   = int(os.getenv("SPIZ_ENRICH_BATCH", "20"))          # menzioni per richiesta
+CONCURRENCY  = int(os.getenv("SPIZ_ENRICH_CONCURRENCY", "4"))     # richieste in parallelo
+MAX_PER_RUN  = int(os.getenv("SPIZ_ENRICH_MAX_PER_RUN", "400"))
+BUDGET_USD   = float(os.getenv("SPIZ_ENRICH_BUDGET_USD", "0.05"))  # costo stimato massimo per giro
+TICK_SECONDS = 60
+ITEM_CHARS   = 1200     # testo per menzione nel prompt
+MAX_ATTEMPTS = 3        # lotti falliti o voci mancanti prima di lasciar perdere (fino al riavvio)
+
+TONES = ("Positivo", "Neutro", "Negativo")
+RISKS = ("Basso", "Medio", "Alto")
+LEGACY = {"tone": "Neutral", "reputational_risk": "None"}   # valori fissi del vecchio monitor
+
+SYSTEM_PROMPT = f"""Sei un analista di reputazione di MAIM Public Diplomacy & Media Relations.
+Ricevi menzioni web numerate [n] di clienti dell'agenzia. Per ognuna valuta
+il tono verso il cliente citato e il rischio reputazionale per quel cliente.
+Rispondi SOLO con un JSON: {{"mentions": [{{"n": <numero>, "tone": <{"|".join(TONES)}>,
+"reputational_risk": <{"|".join(RISKS)}>}}]}}, una voce per ogni menzione ricevuta.
+Rischio Alto solo per indagini, crisi, incidenti, accuse o attacchi diretti al cliente."""
+
+metrics.describe("spiz_enrich_mentions_total", "Menzioni web classificate per rischio")
+
+_wake     = threading.Event()
+_lock     = threading.Lock()
+_attempts: dict = {}    # id menzione → tentativi falliti
+
+
+# ══════════════════════════════════════════════════════════════════════
+# LOTTI
+# ══════════════════════════════════════════════════════════════════════
+
+def pending(limit: int = MAX_PER_RUN, legacy: bool = False) -> list:
+    """Menzioni ancora da classificare, le più recenti per prime."""
+    q = supabase.table("web_mentions").select(
+        "id, source_name, title, url, summary, full_text, matched_client")
+    q = q.eq("tone", LEGACY["tone"]).eq("reputational_risk", LEGACY["reputational_risk"]) if legacy \
+        else q.is_("tone", "null")
+    rows = q.order("id", desc=True).limit(limit + len(_attempts)).execute().data or []
+    with _lock:
+        rows = [r for r in rows if _attempts.get(r["id"], 0) < MAX_ATTEMPTS]
+    return rows[:limit]
+
+
+def _item_text(i: int, m: dict) -> str:
+    body = (m.get("full_text") or "").strip() or fulltext.text(m.get("url") or "")
+    text = " ".join(f"{m.get('summary') or ''} {body}".split())[:ITEM_CHARS]
+    return (f"[{i}] CLIENTE: {m.get('matched_client') or ''}\n"
+            f"TESTATA: {m.get('source_name') or ''}\n"
+            f"TITOLO: {m.get('title') or ''}\n"
+            f"TESTO: {text}")
+
+
+def classify_batch(batch: list) -> tuple:
+    """({id: {tone, reputational_risk}}, costo stimato) per un lotto di menzioni."""
+    user = "\n\n".join(_item_text(i, m) for i, m in enumerate(batch, 1))
+    resp = llm.chat(
+        "mention_enrichment",
+        model=MODEL,
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user}],
+        response_format={"type": "json_object"},
+        temperature=0,
+        max_tokens=40 * len(batch) + 50,
+    )
+    usage = getattr(resp, "usage", None)
+    cost  = llm.estimate_cost(MODEL, getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
+    out = {}
+    for item in json.loads(resp.choices[0].message.content).get("mentions") or []:
+        try:
+            m = batch[int(item.get("n")) - 1]
+        except (TypeError, ValueError, IndexError):
+            continue
+        tone, risk = item.get("tone"), item.get("reputational_risk")
+        if tone in TONES and risk in RISKS:
+            out[m["id"]] = {"tone": tone, "reputational_risk": risk}
+    return out, cost
+
+
+def _write(results: dict) -> int:
+    """Un UPDATE per coppia (tono, rischio) invece di uno per menzione."""
+    groups: dict = {}
+    for mention_id, values in results.items():
+        groups.setdefault((values["tone"], values["reputational_risk"]), []).append(mention_id)
+    written = 0
+    for (tone, risk), ids in groups.items():
+        for i in range(0, len(ids), 200):
+            chunk = ids[i:i + 200]
+            supabase.table("web_mentions").update({"tone": tone, "reputational_risk": risk}).in_("id", chunk).execute()
+            written += len(chunk)
+    return written
+
+
+# ══════════════════════════════════════════════════════════════════════
+# GIRO
+# ══════════════════════════════════════════════════════════════════════
+
+def run(legacy: bool = False, max_mentions: int = MAX_PER_RUN, budget_usd: float = BUDGET_USD) -> dict:
+    """Classifica le menzioni in attesa entro il budget; restituisce conteggi e costo stimato."""
+    rows = pending(max_mentions, legacy=legacy)
+    if not rows:
+        return {"pending": 0, "classified": 0, "cost_usd": 0.0}
+    t0 = time.perf_counter()
+    batches = [rows[i:i + BATCH_SIZE] for i in range(0, len(rows), BATCH_SIZE)]
+    results, spent, failed = {}, 0.0, 0
+    queue = iter(batches)
+
+    # ogni thread prende il lotto successivo solo se il budget non è esaurito
+    def worker():
+        nonlocal spent, failed
+        while True:
+            with _lock:
+                if spent >= budget_usd:
+                    return
+                batch = next(queue, None)
+            if batch is None:
+                return
+            try:
+                out, cost, ok = *classify_batch(batch), True
+            except Exception as e:
+                print(f"[ENRICH] lotto di {len(batch)} fallito: {e}")
+                out, cost, ok = {}, 0.0, False
+            with _lock:
+                spent  += cost
+                failed += not ok
+                results.update(out)
+                for m in batch:
+                    if m["id"] not in out:
+                        _attempts[m["id"]] = _attempts.get(m["id"], 0) + 1
+
+    with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(batches)), thread_name_prefix="enrich") as pool:
+        for _ in range(min(CONCURRENCY, len(batches))):
+            pool.submit(worker)
+
+    written = _write(results) if results else 0
+    if written:
+        http_cache.bump("web_mentions")
+    with _lock:
+        for mention_id in results:
+            _attempts.pop(mention_id, None)
+    by_id = {m["id"]: m for m in rows}
+    high  = [by_id[i] for i, v in results.items() if v["reputational_risk"] == "Alto"]
+    for v in results.values():
+        metrics.inc("spiz_enrich_mentions_total", 1, {"risk": v["reputational_risk"]})
+    for m in high:
+        print(f"[ENRICH] RISCHIO ALTO — {m.get('matched_client')}: {m.get('title')} ({m.get('url')})")
+    print(f"[ENRICH] {written}/{len(rows)} menzioni classificate in {time.perf_counter() - t0:.1f}s, "
+          f"{len(batches)} lotti ({failed} falliti), costo stimato ${spent:.4f}"
+          + (" — budget esaurito" if spent >= budget_usd else ""))
+    return {"pending": len(rows), "classified": written, "high_risk": len(high),
+            "failed_batches": failed, "cost_usd": round(spent, 6)}
+
+
+def notify() -> None:
+    """Chiamato dal monitor dopo aver inserito menzioni: sveglia il ciclo senza attendere il tick."""
+    _wake.set()
+
+
+def enrich_loop(stop: threading.Event) -> None:
+    """Ciclo del leader: un giro a ogni notify() e comunque ogni TICK_SECONDS, finché `stop` non è impostato."""
+    print(f"[ENRICH] avviato ({MODEL}, lotti da {BATCH_SIZE}, budget ${BUDGET_USD}/giro)")
+    while not stop.is_set():
+        _wake.clear()
+        try:
+            scheduler.record_tick("enrichment", run, idle=lambda r: not r.get("pending"))
+        except Exception as e:
+            print(f"[ENRICH] giro fallito: {e}")
+        for _ in range(TICK_SECONDS):
+            if stop.is_set() or _wake.wait(1):
+                break
+    print("[ENRICH] fermato")
+
+
+if __name__ == "__main__":
+    legacy = "--legacy" in sys.argv
+    total  = 0
+    while True:
+        res = run(legacy=legacy)
+        total += res["classified"]
+        if not res["classified"]:
+            break
+    print(f"[ENRICH] completato: {total} menzioni")
@@ -0,0 +1,76 @@
+"""
+services/entry_index.py — Indice delle voci già elaborate dal monitor
+Per ogni sorgente, le voci (guid o link) già passate da pulizia HTML e
+matching, nell'archivio SQLite locale. Il monitor salta le voci note
+prima di BeautifulSoup e delle keyword e manda al database solo le righe
+nuove. Ogni voce ricorda la `variant` (firma delle keyword dei clienti)
+con cui è stata analizzata: se le keyword cambiano, le voci si
+rianalizzano una volta. Le voci che non compaiono più nei feed da
+TTL_DAYS giorni vengono eliminate.
+
+L'indice si aggiorna solo dopo il salvataggio delle menzioni: se
+l'upsert fallisce, le voci si rielaborano alla scansione successiva.
+"""
+
+import hashlib
+import os
+import time
+
+from services.local_store import connect, register_schema
+
+TTL_DAYS      = float(os.getenv("SPIZ_SEEN_TTL_DAYS", "30"))
+EVICT_SECONDS = 3600    # al più una pulizia l'ora
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS seen_entries (
+    source_id  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    variant    TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    PRIMARY KEY (source_id, key)
+);
+CREATE INDEX IF NOT EXISTS seen_entries_last_seen ON seen_entries(last_seen);
+""")
+
+_evicted = {"at": 0.0}
+
+
+def entry_key(raw: str) -> str:
+    return hashlib.sha256(str(raw).strip().encode("utf-8")).hexdigest()[:32]
+
+
+def known(source_id: str) -> dict:
+    """{chiave: variant} delle voci già elaborate per la sorgente."""
+    rows = connect().execute("SELECT key, variant FROM seen_entries WHERE source_id = ?", (str(source_id),))
+    return {r["key"]: r["variant"] for r in rows}
+
+
+def record(source_id: str, keys: list, variant: str) -> None:
+    """Segna `keys` come elaborate con `variant` e ne rinnova last_seen."""
+    keys = list(dict.fromkeys(k for k in keys if k))
+    if not keys:
+        return
+    now  = time.time()
+    conn = connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT INTO seen_entries (source_id, key, variant, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(source_id, key) DO UPDATE SET variant = excluded.variant, last_seen = excluded.last_seen",
+            [(str(source_id), k, variant, now, now) for k in keys],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def evict(force: bool = False) -> int:
+    """Elimina le voci non più viste da TTL_DAYS giorni; restituisce quante."""
+    now = time.time()
+    if not force and now - _evicted["at"] < EVICT_SECONDS:
+        return 0
+    _evicted["at"] = now
+    cur = connect().execute("DELETE FROM seen_entries WHERE last_seen < ?", (now - TTL_DAYS * 86400,))
+    return cur.rowcount or 0
@@ -0,0 +1,240 @@
+"""
+services/fake_openai.py — Client OpenAI offline per benchmark e prove di carico
+FakeOpenAI      risposte sintetiche deterministiche, latenza lognormale
+                configurabile, conteggio token, embedding deterministici
+                (hashing bag-of-words: testi simili → vettori vicini).
+RecordingOpenAI inoltra al client reale e registra ogni risposta.
+ReplayOpenAI    restituisce le risposte registrate, con FakeOpenAI come
+                ripiego per le richieste mai viste.
+Si selezionano con SPIZ_OPENAI_BACKEND=fake|record|replay (services/llm.py).
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+EMBED_DIM = int(os.getenv("SPIZ_FAKE_EMBED_DIM", "1536"))
+
+
+def _latency_cfg(name: str, median_ms: float, sigma: float) -> tuple:
+    """SPIZ_FAKE_LLM_<NAME>=mediana_ms:sigma (es. 800:0.5); 0 disattiva l'attesa."""
+    raw = os.getenv(f"SPIZ_FAKE_LLM_{name}", "")
+    if raw:
+        parts = raw.split(":")
+        median_ms = float(parts[0])
+        sigma     = float(parts[1]) if len(parts) > 1 else sigma
+    return median_ms, sigma
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def _ns(obj):
+    """dict/list annidati → oggetti con attributi, come le risposte dell'SDK."""
+    if isinstance(obj, dict):
+        return SimpleNamespace(**{k: _ns(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return [_ns(v) for v in obj]
+    return obj
+
+
+def _to_dict(obj):
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, SimpleNamespace):
+        return {k: _to_dict(v) for k, v in vars(obj).items()}
+    if isinstance(obj, list):
+        return [_to_dict(v) for v in obj]
+    return obj
+
+
+def request_key(kind: str, kwargs: dict) -> str:
+    blob = json.dumps({"kind": kind, **kwargs}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# EMBEDDING DETERMINISTICI
+# ══════════════════════════════════════════════════════════════════════
+
+_WORD = re.compile(r"\w{3,}", re.UNICODE)
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> list:
+    vec = [0.0] * dim
+    for w in _WORD.findall((text or "").lower()):
+        h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "big")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+# ══════════════════════════════════════════════════════════════════════
+# RISPOSTE SINTETICHE
+# ══════════════════════════════════════════════════════════════════════
+
+_FILLER = ("Nel periodo analizzato la copertura mediatica evidenzia una presenza costante "
+           "sulle principali testate nazionali, con un sentiment prevalentemente neutro.").split()
+
+
+def _fake_json(system: str, user: str) -> dict:
+    s = system.lower()
+    if '"articoli"' in s or "lista \"articoli\"" in s:
+        items = []
+        for block in user.split("\n\n"):
+            m = re.search(r"TESTATA: (.*)\nDATA: (.*)\nTITOLO: (.*)", block)
+            if m:
+                items.append({
+                    "testata": m.group(1), "data": m.group(2), "titolo": m.group(3),
+                    "fatti_chiave": ["fatto sintetico"], "angolo": "neutro",
+                    "criticita": None, "rilevanza": 3,
+                })
+        return {"articoli": items}
+    if "tema" in s and "settori" in s:
+        words = _WORD.findall(user.lower())[:10]
+        return {"tema": " ".join(words[:6]), "settori": ["Economia", "Finanza"],
+                "keywords": words, "tono": "economico", "sintesi": user[:160]}
+    if '"mentions"' in s:
+        items = []
+        for m in re.finditer(r"^\[(\d+)\] CLIENTE: .*\nTESTATA: .*\nTITOLO: (.*)\nTESTO: (.*)$", user, re.M):
+            text = f"{m.group(2)} {m.group(3)}".lower()
+            alarm = re.search(r"indagin|inchiest|scandal|crisi|sequestr|accus|incident|multa|sanzion", text)
+            items.append({"n": int(m.group(1)), "tone": "Negativo" if alarm else "Neutro",
+                          "reputational_risk": "Alto" if alarm else "Basso"})
+        return {"mentions": items}
+    if "tone" in s or "tone" in user.lower():
+        return {"tone": "Neutro", "dominant_topic": "Generale", "reputational_risk": "Basso"}
+    return {}
+
+
+class _Completions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model: str, messages: list, max_tokens: int = 1000, response_format: dict = None, **_):
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user   = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+        seed   = int(request_key("chat", {"model": model, "messages": messages})[:8], 16)
+        rnd    = random.Random(seed)
+
+        if response_format and response_format.get("type") == "json_object":
+            content = json.dumps(_fake_json(system, user), ensure_ascii=False)
+        else:
+            n = min(max_tokens, self.owner.completion_tokens) * 3 // 4
+            content = "[FAKE] " + " ".join(rnd.choice(_FILLER) for _ in range(max(1, n)))
+
+        p_tok = sum(_count_tokens(m.get("content", "")) for m in messages)
+        c_tok = _count_tokens(content)
+        self.owner.wait("CHAT", rnd, extra_ms=c_tok * 1000 / self.owner.tokens_per_sec)
+        return _ns({
+            "id": f"fake-{seed:x}", "model": model, "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": p_tok, "completion_tokens": c_tok, "total_tokens": p_tok + c_tok},
+        })
+
+
+class _Embeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model: str, input, **_):
+        inputs = input if isinstance(input, list) else [input]
+        rnd    = random.Random(request_key("embedding", {"model": model, "input": inputs})[:8])
+        self.owner.wait("EMBED", rnd)
+        tokens = sum(_count_tokens(t) for t in inputs)
+        return _ns({
+            "model": model, "object": "list",
+            "data": [{"index": i, "object": "embedding", "embedding": fake_embedding(t)}
+                     for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.chat_latency     = _latency_cfg("CHAT", 800, 0.5)
+        self.embed_latency    = _latency_cfg("EMBED", 80, 0.3)
+        self.tokens_per_sec   = float(os.getenv("SPIZ_FAKE_LLM_TOKENS_PER_SEC", "80"))
+        self.completion_tokens = int(os.getenv("SPIZ_FAKE_LLM_COMPLETION_TOKENS", "300"))
+        self.chat       = SimpleNamespace(completions=_Completions(self))
+        self.embeddings = _Embeddings(self)
+
+    def wait(self, kind: str, rnd: random.Random, extra_ms: float = 0.0) -> None:
+        median_ms, sigma = self.chat_latency if kind == "CHAT" else self.embed_latency
+        if median_ms <= 0:
+            return
+        ms = rnd.lognormvariate(math.log(median_ms), sigma) + extra_ms
+        time.sleep(ms / 1000)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# RECORD / REPLAY
+# ══════════════════════════════════════════════════════════════════════
+
+class _Cassette:
+    def __init__(self, path: str):
+        self.path    = path
+        self.lock    = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        e = json.loads(line)
+                        self.entries[e["key"]] = e["response"]
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def put(self, key: str, kind: str, response: dict) -> None:
+        with self.lock:
+            self.entries[key] = response
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "kind": kind, "response": response}, ensure_ascii=False) + "\n")
+
+
+class _Proxy:
+    def __init__(self, kind: str, create):
+        self.kind, self._create = kind, create
+
+    def create(self, **kwargs):
+        return self._create(self.kind, kwargs)
+
+
+class RecordingOpenAI:
+    def __init__(self, real, path: str):
+        self.real     = real
+        self.cassette = _Cassette(path)
+        self.chat       = SimpleNamespace(completions=_Proxy("chat", self._create))
+        self.embeddings = _Proxy("embedding", self._create)
+
+    def _create(self, kind: str, kwargs: dict):
+        target = self.real.chat.completions if kind == "chat" else self.real.embeddings
+        resp   = target.create(**kwargs)
+        self.cassette.put(request_key(kind, kwargs), kind, _to_dict(resp))
+        return resp
+
+
+class ReplayOpenAI:
+    def __init__(self, path: str, fallback=None):
+        self.cassette = _Cassette(path)
+        self.fallback = fallback or FakeOpenAI()
+        self.misses   = 0
+        self.chat       = SimpleNamespace(completions=_Proxy("chat", self._create))
+        self.embeddings = _Proxy("embedding", self._create)
+
+    def _create(self, kind: str, kwargs: dict):
+        hit = self.cassette.get(request_key(kind, kwargs))
+        if hit is not None:
+            return _ns(hit)
+        self.misses += 1
+        target = self.fallback.chat.completions if kind == "chat" else self.fallback.embeddings
+        return target.create(**kwargs)
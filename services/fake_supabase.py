@@ -0,0 +1,319 @@
+"""
+services/fake_supabase.py — Doppione in-process di Supabase/PostgREST
+Copre le chiamate che il codice usa davvero: table().select/insert/
+upsert/update/delete con i filtri eq/neq/gt/gte/lt/lte/in_/is_/ilike,
+or_ (anche con and(...) annidati), order/limit/range, count="exact" e rpc("match_articles") con
+similarità coseno sugli embedding. Serve per benchmark e prove di carico
+senza toccare il database di produzione.
+Si attiva con SPIZ_DB_BACKEND=memory (vedi services/database.py);
+SPIZ_FAKE_DB_PATH carica/salva uno snapshot JSON delle tabelle.
+"""
+
+import json
+import math
+import os
+import threading
+from types import SimpleNamespace
+
+
+class APIError(Exception):
+    pass
+
+
+def _cmp_value(v):
+    return (v is None, v if v is not None else "")
+
+
+def _coerce(x, v):
+    try:
+        return type(x)(v)
+    except (TypeError, ValueError):
+        return v
+
+
+_OPS = {
+    "eq":  lambda x, v: x is not None and str(x) == str(v),
+    "neq": lambda x, v: x is None or str(x) != str(v),
+    "gt":  lambda x, v: x is not None and x > _coerce(x, v),
+    "gte": lambda x, v: x is not None and x >= _coerce(x, v),
+    "lt":  lambda x, v: x is not None and x < _coerce(x, v),
+    "lte": lambda x, v: x is not None and x <= _coerce(x, v),
+}
+
+
+def _split_top(expr: str) -> list:
+    """Divide sulle virgole di primo livello, rispettando parentesi e virgolette."""
+    parts, depth, quoted, cur = [], 0, False, ""
+    for ch in expr:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(cur)
+            cur = ""
+            continue
+        cur += ch
+    parts.append(cur)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _parse_logic(expr: str):
+    """Filtro logico PostgREST (col.op.val, and(...), or(...)) → predicato sulla riga."""
+    for kind, combine in (("and(", all), ("or(", any)):
+        if expr.startswith(kind) and expr.endswith(")"):
+            subs = [_parse_logic(p) for p in _split_top(expr[len(kind):-1])]
+            return lambda row: combine(f(row) for f in subs)
+    col, op, val = expr.split(".", 2)
+    val = val[1:-1] if val.startswith('"') and val.endswith('"') else val
+    if op == "is":
+        want = None if val == "null" else val.lower() == "true"
+        return lambda row: row.get(col) is want
+    if op == "in":
+        vals = {v.strip('"') for v in _split_top(val.strip("()"))}
+        return lambda row: row.get(col) is not None and str(row.get(col)) in vals
+    if op == "ilike":
+        needle = val.replace("*", "%").strip("%").lower()
+        return lambda row: row.get(col) is not None and needle in str(row.get(col)).lower()
+    fn = _OPS[op]
+    return lambda row: fn(row.get(col), val)
+
+
+class _Query:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db       = db
+        self.table    = table
+        self.op       = "select"
+        self.columns  = None
+        self.count    = None
+        self.filters  = []
+        self.orders   = []
+        self.limit_n  = None
+        self.offset   = 0
+        self.payload  = None
+        self.conflict = None
+        self.ignore_dup = False
+
+    # ── operazioni ────────────────────────────────────────────────────
+    def select(self, columns: str = "*", count: str = None):
+        self.columns = [c.strip() for c in columns.split(",") if c.strip()]
+        self.count   = count
+        return self
+
+    def insert(self, rows, **_):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = None, ignore_duplicates: bool = False, **_):
+        self.op, self.payload = "upsert", rows
+        self.conflict   = on_conflict or "id"
+        self.ignore_dup = ignore_duplicates
+        return self
+
+    def update(self, data: dict, **_):
+        self.op, self.payload = "update", data
+        return self
+
+    def delete(self, **_):
+        self.op = "delete"
+        return self
+
+    # ── filtri ────────────────────────────────────────────────────────
+    def _f(self, col, fn):
+        self.filters.append((col, fn))
+        return self
+
+    def eq(self, col, v):   return self._f(col, lambda x: _OPS["eq"](x, v))
+    def neq(self, col, v):  return self._f(col, lambda x: _OPS["neq"](x, v))
+    def gt(self, col, v):   return self._f(col, lambda x: _OPS["gt"](x, v))
+    def gte(self, col, v):  return self._f(col, lambda x: _OPS["gte"](x, v))
+    def lt(self, col, v):   return self._f(col, lambda x: _OPS["lt"](x, v))
+    def lte(self, col, v):  return self._f(col, lambda x: _OPS["lte"](x, v))
+
+    def in_(self, col, values):
+        vals = {str(v) for v in values}
+        return self._f(col, lambda x: x is not None and str(x) in vals)
+
+    def is_(self, col, v):
+        if v in (None, "null"):
+            return self._f(col, lambda x: x is None)
+        want = str(v).lower() == "true"
+        return self._f(col, lambda x: x is want)
+
+    def ilike(self, col, pattern):
+        needle = pattern.strip("%").lower()
+        return self._f(col, lambda x: x is not None and needle in str(x).lower())
+
+    def or_(self, filters: str, **_):
+        pred = _parse_logic(f"or({filters})")
+        self.filters.append((None, pred))
+        return self
+
+    def order(self, col, desc: bool = False, **_):
+        self.orders.append((col, desc))
+        return self
+
+    def limit(self, n: int, **_):
+        self.limit_n = n
+        return self
+
+    def range(self, start: int, end: int, **_):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    # ── esecuzione ────────────────────────────────────────────────────
+    def _match(self, row: dict) -> bool:
+        return all(fn(row) if col is None else fn(row.get(col)) for col, fn in self.filters)
+
+    def _project(self, row: dict) -> dict:
+        if not self.columns or "*" in self.columns:
+            return dict(row)
+        return {c: row.get(c) for c in self.columns}
+
+    def execute(self):
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op == "select":
+                return self._select(rows)
+            if self.op in ("insert", "upsert"):
+                return self._write(rows)
+            if self.op == "update":
+                changed = []
+                for r in rows:
+                    if self._match(r):
+                        r.update(self.payload)
+                        changed.append(dict(r))
+                return SimpleNamespace(data=changed, count=None)
+            if self.op == "delete":
+                gone = [r for r in rows if self._match(r)]
+                self.db.tables[self.table] = [r for r in rows if not self._match(r)]
+                return SimpleNamespace(data=gone, count=None)
+        raise APIError(f"operazione non supportata: {self.op}")
+
+    def _select(self, rows):
+        hits = [r for r in rows if self._match(r)]
+        for col, desc in reversed(self.orders):
+            hits.sort(key=lambda r: _cmp_value(r.get(col)), reverse=desc)
+        total = len(hits)
+        end   = None if self.limit_n is None else self.offset + self.limit_n
+        # come PostgREST: max-rows limita le risposte senza limit esplicito
+        if end is None and self.db.max_rows:
+            end = self.offset + self.db.max_rows
+        hits = hits[self.offset:end]
+        return SimpleNamespace(data=[self._project(r) for r in hits], count=total if self.count else None)
+
+    def _write(self, rows):
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys    = [k.strip() for k in (self.conflict or "id").split(",")]
+        index   = {tuple(str(r.get(k)) for k in keys): r for r in rows} if self.op == "upsert" else {}
+        out = []
+        for item in payload:
+            item = dict(item)
+            existing = index.get(tuple(str(item.get(k)) for k in keys))
+            if existing is not None:
+                if self.ignore_dup:
+                    continue
+                existing.update({k: v for k, v in item.items() if k != "id"})
+                out.append(dict(existing))
+                continue
+            item.setdefault("id", self.db.next_id(self.table))
+            rows.append(item)
+            if self.op == "upsert":
+                index[tuple(str(item.get(k)) for k in keys)] = item
+            out.append(dict(item))
+        return SimpleNamespace(data=out, count=None)
+
+
+class _Rpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict):
+        self.db, self.name, self.params = db, name, params or {}
+
+    def execute(self):
+        fn = self.db.functions.get(self.name)
+        if not fn:
+            raise APIError(f"funzione {self.name} non trovata")
+        with self.db.lock:
+            return SimpleNamespace(data=fn(self.db, **self.params), count=None)
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na  = math.sqrt(sum(x * x for x in a)) or 1.0
+    nb  = math.sqrt(sum(y * y for y in b)) or 1.0
+    return dot / (na * nb)
+
+
+def _match_articles(db, query_embedding, match_count=200, match_from=None, match_to=None,
+                    filter_from=None, filter_to=None, **_):
+    lo = match_from or filter_from
+    hi = match_to or filter_to
+    scored = []
+    for r in db.tables.get("articles", []):
+        emb = r.get("embedding")
+        if not emb:
+            continue
+        if isinstance(emb, str):
+            emb = json.loads(emb)
+        d = r.get("data") or ""
+        if (lo and d < lo) or (hi and d > hi):
+            continue
+        scored.append((_cosine(query_embedding, emb), r))
+    scored.sort(key=lambda x: -x[0])
+    out = []
+    for sim, r in scored[:match_count]:
+        row = {k: v for k, v in r.items() if k != "embedding"}
+        row["similarity"] = sim
+        out.append(row)
+    return out
+
+
+class FakeSupabase:
+    def __init__(self, path: str = None, max_rows: int = 1000):
+        self.tables: dict    = {}
+        self.functions: dict = {"match_articles": _match_articles}
+        self.lock     = threading.RLock()
+        self.path     = path
+        self.max_rows = max_rows
+        self._seq: dict = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.tables = json.load(f)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def from_(self, name: str) -> _Query:
+        return self.table(name)
+
+    def rpc(self, name: str, params: dict = None) -> _Rpc:
+        return _Rpc(self, name, params)
+
+    def next_id(self, table: str) -> int:
+        """Id progressivo come una colonna bigserial."""
+        with self.lock:
+            if table not in self._seq:
+                ids = [r["id"] for r in self.tables.get(table, []) if isinstance(r.get("id"), int)]
+                self._seq[table] = max(ids, default=0)
+            self._seq[table] += 1
+            return self._seq[table]
+
+    def seed(self, table: str, rows: list) -> None:
+        with self.lock:
+            dest = self.tables.setdefault(table, [])
+            for r in rows:
+                r = dict(r)
+                if "id" not in r:
+                    r["id"] = self.next_id(table)
+                dest.append(r)
+            self._seq.pop(table, None)
+
+    def save(self, path: str = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            data = json.dumps(self.tables, ensure_ascii=False)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
@@ -0,0 +1,256 @@
+"""
+services/fetcher.py — Download HTTP concorrenti per il monitoraggio
+Un client httpx condiviso (keep-alive, HTTP/2 se c'è il pacchetto h2)
+serve un pool di thread di I/O limitato (GLOBAL_CONCURRENCY), con al più
+PER_HOST richieste contemporanee verso lo stesso host. Ogni download ha
+una durata massima complessiva (non solo fra un byte e l'altro) e un
+tetto di dimensione; run() ha in più una scadenza per l'intero giro.
+Il parsing gira in un pool separato, così i thread di I/O restano liberi:
+una scansione completa dura quanto la fonte più lenta, non la somma.
+
+Con conditional=True run() rimanda ETag e Last-Modified dell'ultima
+risposta (If-None-Match / If-Modified-Since, tabella fetch_validators
+nell'archivio locale): un 304, o un corpo con lo stesso hash, salta
+parsing e matching. I validatori valgono per una `variant` (per il
+monitor, l'insieme delle keyword dei clienti): se cambia, tutto si
+riscarica e si rianalizza. Il chiamante li salva con save_validators()
+solo dopo aver reso persistente quanto estratto.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+from services import metrics
+from services.local_store import connect, register_schema
+
+GLOBAL_CONCURRENCY = int(os.getenv("SPIZ_FETCH_CONCURRENCY", "32"))
+PER_HOST           = int(os.getenv("SPIZ_FETCH_PER_HOST", "2"))
+TIMEOUT            = float(os.getenv("SPIZ_FETCH_TIMEOUT", "10"))     # secondi per download, in totale
+CONNECT_TIMEOUT    = float(os.getenv("SPIZ_FETCH_CONNECT_TIMEOUT", "5"))
+DEADLINE           = float(os.getenv("SPIZ_FETCH_DEADLINE", "120"))   # secondi per un giro di run()
+PARSE_WORKERS      = int(os.getenv("SPIZ_FETCH_PARSE_WORKERS", "4"))
+MAX_BYTES          = 10 * 1024 * 1024
+USER_AGENT         = "Mozilla/5.0 (compatible; SPIZ-Monitor/1.0)"
+
+metrics.describe("spiz_fetch_seconds", "Durata dei download del monitoraggio per esito")
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS fetch_validators (
+    url           TEXT PRIMARY KEY,
+    etag          TEXT,
+    last_modified TEXT,
+    body_hash     TEXT,
+    variant       TEXT NOT NULL DEFAULT '',
+    checked_at    REAL NOT NULL,
+    changed_at    REAL
+);
+""")
+
+_lock       = threading.Lock()
+_client     = None
+_host_slots = defaultdict(lambda: threading.BoundedSemaphore(PER_HOST))
+
+
+def client():
+    """Client httpx condiviso fra i thread: le connessioni keep-alive si riusano fra un giro e l'altro."""
+    global _client
+    with _lock:
+        if _client is None:
+            import httpx
+            try:
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+            _client = httpx.Client(
+                headers={"User-Agent": USER_AGENT},
+                timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=GLOBAL_CONCURRENCY, max_keepalive_connections=GLOBAL_CONCURRENCY),
+                follow_redirects=True,
+                http2=http2,
+            )
+        return _client
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = (urlsplit(url).hostname or "").lower()
+    with _lock:
+        return _host_slots[host]
+
+
+def get(url: str, headers: dict = None, timeout: float = TIMEOUT) -> dict:
+    """
+    GET con limite per host: {url, status, body, headers, error, wait_s, fetch_s}.
+    Gli errori di rete finiscono in "error" (status None), mai in eccezioni.
+    """
+    t0 = time.perf_counter()
+    with _host_slot(url):
+        t1 = time.perf_counter()
+        out = {"status": None, "body": b"", "headers": {}, "error": None}
+        try:
+            with client().stream("GET", url, headers=headers) as r:
+                chunks, size = [], 0
+                for chunk in r.iter_bytes():
+                    size += len(chunk)
+                    if size > MAX_BYTES:
+                        raise ValueError(f"risposta oltre {MAX_BYTES // (1024 * 1024)} MB")
+                    if time.perf_counter() - t1 > timeout:
+                        raise TimeoutError(f"download oltre {timeout:.0f}s")
+                    chunks.append(chunk)
+                out.update(status=r.status_code, body=b"".join(chunks), headers=dict(r.headers))
+        except Exception as e:
+            out["error"] = f"{type(e).__name__}: {e}"
+        t2 = time.perf_counter()
+    out.update(url=url, wait_s=t1 - t0, fetch_s=t2 - t1)
+    outcome = "error" if out["error"] else str(out["status"])
+    metrics.observe("spiz_fetch_seconds", out["fetch_s"], {"outcome": outcome})
+    return out
+
+
+# ══════════════════════════════════════════════════════════════════════
+# VALIDATORI (GET CONDIZIONALI)
+# ══════════════════════════════════════════════════════════════════════
+
+def _load_validators(urls: list, variant: str) -> dict:
+    """{url: riga di fetch_validators} per gli url con la stessa variant."""
+    conn, out = connect(), {}
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        rows = conn.execute(
+            f"SELECT * FROM fetch_validators WHERE url IN ({','.join('?' * len(chunk))}) AND variant = ?",
+            (*chunk, variant),
+        ).fetchall()
+        out.update({r["url"]: dict(r) for r in rows})
+    return out
+
+
+def _conditional_headers(known: dict | None) -> dict | None:
+    if not known:
+        return None
+    headers = {}
+    if known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+    return headers or None
+
+
+def save_validators(results: list) -> None:
+    """Salva i validatori dei risultati di run() (dopo che il chiamante ha salvato i dati estratti)."""
+    rows = [r["validators"] for r in results if r.get("validators")]
+    if not rows:
+        return
+    conn = connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT INTO fetch_validators (url, etag, last_modified, body_hash, variant, checked_at, changed_at) "
+            "VALUES (:url, :etag, :last_modified, :body_hash, :variant, :checked_at, :changed_at) "
+            "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+            "body_hash = excluded.body_hash, variant = excluded.variant, checked_at = excluded.checked_at, "
+            "changed_at = coalesce(excluded.changed_at, fetch_validators.changed_at)",
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _header(headers: dict, name: str):
+    return next((v for k, v in headers.items() if k.lower() == name), None)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# GIRO DI DOWNLOAD
+# ══════════════════════════════════════════════════════════════════════
+
+def run(items: list, url_of, process, deadline: float = DEADLINE,
+        conditional: bool = False, variant: str = "", fetch=None) -> list:
+    """
+    Scarica url_of(item) per ogni item e passa (item, risposta) a
+    process() nel pool di parsing. Restituisce, nell'ordine di `items`,
+    {item, result, error, status, unchanged, bytes, validators, wait_s,
+    fetch_s, parse_s}; chi non finisce entro `deadline` ha error "deadline".
+    Con conditional=True le risorse invariate hanno unchanged=True e
+    result None: process() non viene chiamato. I validatori (presenti
+    solo dopo un parsing riuscito o una risposta invariata) si salvano
+    poi con save_validators(). `fetch` sostituisce get() (stessa firma
+    e stessa risposta), per esempio per aggiungere controlli di cortesia.
+    """
+    out = [{"item": it, "result": None, "error": None, "status": None, "unchanged": False,
+            "bytes": 0, "validators": None, "wait_s": 0.0, "fetch_s": 0.0, "parse_s": 0.0} for it in items]
+    if not items:
+        return out
+    fetch = fetch or get
+    urls  = [url_of(it) for it in items]
+    known = _load_validators(urls, variant) if conditional else {}
+    end = time.monotonic() + deadline
+    io  = ThreadPoolExecutor(max_workers=min(GLOBAL_CONCURRENCY, len(items)), thread_name_prefix="fetch-io")
+    cpu = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="fetch-parse")
+
+    def _validators(i: int, resp: dict, body_hash: str, changed: bool) -> dict:
+        old = known.get(urls[i]) or {}
+        now = time.time()
+        return {
+            "url":           urls[i],
+            "etag":          _header(resp["headers"], "etag") or old.get("etag"),
+            "last_modified": _header(resp["headers"], "last-modified") or old.get("last_modified"),
+            "body_hash":     body_hash,
+            "variant":       variant,
+            "checked_at":    now,
+            "changed_at":    now if changed else None,
+        }
+
+    def _parse(i: int, resp: dict, body_hash: str):
+        t0 = time.perf_counter()
+        try:
+            out[i]["result"] = process(items[i], resp)
+            if conditional:
+                out[i]["validators"] = _validators(i, resp, body_hash, changed=True)
+        except Exception as e:
+            out[i]["error"] = f"{type(e).__name__}: {e}"
+        out[i]["parse_s"] = time.perf_counter() - t0
+
+    try:
+        downloads = {io.submit(fetch, url, _conditional_headers(known.get(url))): i for i, url in enumerate(urls)}
+        parses, pending = set(), set(downloads)
+        while pending and time.monotonic() < end:
+            done, pending = wait(pending, timeout=end - time.monotonic(), return_when=FIRST_COMPLETED)
+            for f in done:
+                i, resp = downloads[f], f.result()
+                out[i].update(status=resp["status"], bytes=len(resp["body"]),
+                              wait_s=resp["wait_s"], fetch_s=resp["fetch_s"])
+                old_hash = (known.get(urls[i]) or {}).get("body_hash")
+                if resp["error"] or resp["status"] >= 400:
+                    out[i]["error"] = resp["error"] or f"HTTP {resp['status']}"
+                elif resp["status"] == 304 and old_hash:
+                    out[i]["unchanged"] = True
+                    out[i]["validators"] = _validators(i, resp, old_hash, changed=False)
+                elif resp["status"] == 304:
+                    out[i]["error"] = "HTTP 304 senza copia analizzata"
+                else:
+                    body_hash = hashlib.sha256(resp["body"]).hexdigest() if conditional else None
+                    if conditional and body_hash == old_hash:
+                        # stesso contenuto senza validatori utili (server che non gestiscono i 304)
+                        out[i]["unchanged"] = True
+                        out[i]["validators"] = _validators(i, resp, body_hash, changed=False)
+                    else:
+                        parses.add(cpu.submit(_parse, i, resp, body_hash))
+        if parses:
+            wait(parses, timeout=max(0.0, end - time.monotonic()))
+        for f, i in downloads.items():
+            if not f.done():
+                out[i]["error"] = "deadline"
+        for i, r in enumerate(out):
+            if r["result"] is None and r["error"] is None and r["status"] is not None and not r["unchanged"]:
+                r["error"], r["validators"] = "deadline", None
+    finally:
+        io.shutdown(wait=False, cancel_futures=True)
+        cpu.shutdown(wait=False, cancel_futures=True)
+    return out
@@ -0,0 +1,389 @@
+"""
+services/fulltext.py — Testo completo degli articoli citati dal monitor
+Per le voci che citano un cliente (e per le candidate, voci nuove senza
+match nel titolo o nel sommario) scarica la pagina dell'articolo ed
+estrae il corpo con un estrattore in stile readability: blocchi di
+paragrafi con punteggio per lunghezza, virgole, densità di link e
+indizi di classe/id, con scorciatoia su articleBody (JSON-LD o
+itemprop) quando la pagina lo dichiara.
+
+I download passano da services/fetcher.py (stesso pool e limite per
+host) con in più robots.txt e una pausa minima fra due richieste allo
+stesso host (HOST_DELAY, o il Crawl-delay del sito se maggiore); il
+poller passa il suo budget di download al minuto, così le pagine
+contano insieme ai feed. Il
+testo estratto si salva compresso (zlib) nell'archivio locale, per URL
+canonico: nuovi matching dopo un cambio di keyword e l'arricchimento
+successivo lo rileggono con text() senza riscaricare la pagina.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+from services import fetcher, metrics
+from services.local_store import connect, register_schema
+
+ENABLED        = os.getenv("SPIZ_FULLTEXT", "1") != "0"
+MAX_CANDIDATES = int(os.getenv("SPIZ_FULLTEXT_CANDIDATES", "100"))    # voci senza match scaricate per scansione
+DEADLINE       = float(os.getenv("SPIZ_FULLTEXT_DEADLINE", "60"))     # secondi per un giro di fetch_texts()
+HOST_DELAY     = float(os.getenv("SPIZ_FULLTEXT_HOST_DELAY", "1"))    # secondi fra due richieste allo stesso host
+TTL_DAYS       = float(os.getenv("SPIZ_FULLTEXT_TTL_DAYS", "30"))
+MAX_HOST_WAIT  = 30         # oltre, la pagina si rimanda alla scansione successiva
+MAX_CRAWL_WAIT = 30         # tetto al Crawl-delay dichiarato
+RETRY_SECONDS  = 6 * 3600   # una pagina in errore (404, robots, non HTML, rete) si ritenta dopo 6 ore
+ROBOTS_TTL     = 86400
+EVICT_SECONDS  = 3600
+MAX_CHARS      = 100_000
+ROBOTS_AGENT   = "SPIZ-Monitor"
+
+# errori per cui la pagina si rimanda alla prossima scansione invece di restare in cache
+HOST_BUSY     = "host occupato"
+ROBOTS_FAILED = "robots.txt non disponibile"
+OVER_BUDGET   = "budget esaurito"
+_RETRY        = ("deadline", HOST_BUSY, ROBOTS_FAILED, OVER_BUDGET)
+
+metrics.describe("spiz_fulltext_pages", "Pagine articolo del monitor per esito")
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS article_texts (
+    canonical  TEXT PRIMARY KEY,
+    url        TEXT NOT NULL,
+    title      TEXT,
+    body       BLOB,      -- testo estratto, zlib
+    chars      INTEGER NOT NULL DEFAULT 0,
+    status     INTEGER,
+    error      TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS article_texts_fetched ON article_texts(fetched_at);
+""")
+
+_TRACKING = re.compile(r"^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ocid|ref|ref_src|cmpid|xtor)$", re.I)
+
+_lock        = threading.Lock()
+_robots      = {}   # origine → (RobotFileParser, scadenza)
+_robots_lock = {}   # origine → Lock: un solo download di robots.txt per origine
+_next_slot   = {}   # host → primo istante utile per la prossima richiesta
+_evicted     = {"at": 0.0}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# URL CANONICI
+# ══════════════════════════════════════════════════════════════════════
+
+def canonical_url(url: str) -> str:
+    """Schema e host in minuscolo, senza frammento, parametri di tracciamento e slash finale."""
+    parts = urlsplit(str(url or "").strip())
+    host  = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _TRACKING.match(k)))
+    path  = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "http", host, path, query, ""))
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ESTRAZIONE
+# ══════════════════════════════════════════════════════════════════════
+
+_UNLIKELY = re.compile(r"comment|share|social|related|sidebar|footer|menu|nav|promo|banner|cookie|"
+                       r"newsletter|advert|sponsor|outbrain|taboola|breadcrumb|tags|subscribe|popup", re.I)
+_LIKELY   = re.compile(r"article|content|body|text|story|post|entry|main|corpo|testo|articolo", re.I)
+_DROP     = ("script", "style", "noscript", "iframe", "form", "nav", "header", "footer", "aside",
+             "svg", "button", "select", "template")
+_BLOCKS   = ("p", "h2", "h3", "li", "blockquote", "pre")
+
+
+def _attrs(tag) -> str:
+    return " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+
+
+def _json_ld_body(soup) -> str:
+    for s in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(s.string or "")
+        except Exception:
+            continue
+        stack = [data]
+        while stack:
+            d = stack.pop()
+            if isinstance(d, list):
+                stack.extend(d)
+            elif isinstance(d, dict):
+                body = d.get("articleBody")
+                if isinstance(body, str) and len(body) > 200:
+                    return body
+                stack.extend(v for k, v in d.items() if k == "@graph")
+    return ""
+
+
+def _blocks_text(node) -> str:
+    parts = [b.get_text(" ", strip=True) for b in node.find_all(_BLOCKS)]
+    parts = [p for p in parts if len(p) >= 25]
+    return "\n\n".join(parts) if parts else node.get_text(" ", strip=True)
+
+
+def _link_density(node, text_len: int) -> float:
+    links = sum(len(a.get_text(strip=True)) for a in node.find_all("a"))
+    return links / text_len if text_len else 1.0
+
+
+def extract(body: bytes) -> dict:
+    """{title, text, canonical} del corpo principale di una pagina HTML."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(body, "html.parser")
+
+    title = ""
+    og = soup.find("meta", property="og:title")
+    if og and og.get("content"):
+        title = og["content"].strip()
+    elif soup.title and soup.title.string:
+        title = soup.title.string.strip()
+    canonical = None
+    link = soup.find("link", rel="canonical")
+    if link and link.get("href", "").startswith("http"):
+        canonical = link["href"]
+
+    text = _json_ld_body(soup)
+    if not text:
+        for tag in soup(_DROP):
+            tag.decompose()
+        for tag in soup.find_all(True):
+            if tag.decomposed or tag.name in ("html", "body", "article", "main"):
+                continue
+            attrs = _attrs(tag)
+            if _UNLIKELY.search(attrs) and not _LIKELY.search(attrs):
+                tag.decompose()
+
+        node = soup.find(attrs={"itemprop": "articleBody"})
+        if node is None:
+            articles = soup.find_all("article")
+            node = articles[0] if len(articles) == 1 else None
+        if node is None:
+            node = _best_node(soup)
+        text = _blocks_text(node) if node is not None else ""
+
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    text = re.sub(r"\n\s*\n\s*", "\n\n", text).strip()
+    return {"title": title, "text": text[:MAX_CHARS], "canonical": canonical}
+
+
+def _best_node(soup):
+    """Il contenitore con il punteggio più alto, come in readability."""
+    scores = {}
+    for p in soup.find_all(("p", "pre", "td")):
+        text = p.get_text(" ", strip=True)
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for parent, share in ((p.parent, 1.0), (p.parent.parent if p.parent else None, 0.5)):
+            if parent is None or parent.name in ("html", "[document]"):
+                continue
+            if id(parent) not in scores:
+                base = {"div": 5, "article": 10, "section": 3, "main": 5, "td": 3, "blockquote": 3}.get(parent.name, 0)
+                attrs = _attrs(parent)
+                base += 25 if _LIKELY.search(attrs) else 0
+                base -= 25 if _UNLIKELY.search(attrs) else 0
+                scores[id(parent)] = [parent, base]
+            scores[id(parent)][1] += score * share
+    best, best_score = None, 0.0
+    for node, score in scores.values():
+        text_len = len(node.get_text(" ", strip=True))
+        score *= 1 - _link_density(node, text_len)
+        if score > best_score:
+            best, best_score = node, score
+    return best
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ROBOTS.TXT E CORTESIA PER HOST
+# ══════════════════════════════════════════════════════════════════════
+
+def _robots_for(url: str) -> RobotFileParser:
+    parts  = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        cached = _robots.get(origin)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        origin_lock = _robots_lock.setdefault(origin, threading.Lock())
+    with origin_lock:
+        with _lock:
+            cached = _robots.get(origin)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        rp, ttl = RobotFileParser(), ROBOTS_TTL
+        resp = fetcher.get(f"{origin}/robots.txt", timeout=min(fetcher.TIMEOUT, 5))
+        if resp["error"] or resp["status"] >= 500:
+            rp.disallow_all, ttl = True, 3600   # irraggiungibile: niente download per un'ora (RFC 9309)
+        elif resp["status"] >= 400:
+            rp.allow_all = True
+        else:
+            rp.parse(resp["body"].decode("utf-8", "replace").splitlines())
+        with _lock:
+            _robots[origin] = (rp, time.time() + ttl)
+        return rp
+
+
+def _wait_turn(host: str, delay: float) -> bool:
+    """Prenota il prossimo turno sull'host e lo attende; False se l'attesa supera MAX_HOST_WAIT."""
+    with _lock:
+        now  = time.monotonic()
+        slot = max(now, _next_slot.get(host, 0.0))
+        if slot - now > MAX_HOST_WAIT:
+            return False
+        _next_slot[host] = slot + delay
+    time.sleep(slot - now)
+    return True
+
+
+def _polite_get(url: str, headers: dict = None) -> dict:
+    """fetcher.get() preceduto dal controllo di robots.txt e dal turno sull'host."""
+    host = (urlsplit(url).hostname or "").lower()
+    skipped = {"status": None, "body": b"", "headers": {}, "url": url, "wait_s": 0.0, "fetch_s": 0.0}
+    try:
+        rp = _robots_for(url)
+    except Exception as e:
+        print(f"[FULLTEXT] robots.txt di {host}: {e}")
+        return dict(skipped, error=ROBOTS_FAILED)
+    if not rp.can_fetch(ROBOTS_AGENT, url):
+        return dict(skipped, error="vietato da robots.txt")
+    delay = max(HOST_DELAY, min(float(rp.crawl_delay(ROBOTS_AGENT) or 0), MAX_CRAWL_WAIT))
+    if not _wait_turn(host, delay):
+        return dict(skipped, error=HOST_BUSY)
+    return fetcher.get(url, headers)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# CACHE E DOWNLOAD
+# ══════════════════════════════════════════════════════════════════════
+
+def _load(canonicals: list) -> dict:
+    """{canonico: riga} per le righe ancora valide (testo entro TTL_DAYS, errori entro RETRY_SECONDS)."""
+    conn, out, now = connect(), {}, time.time()
+    for i in range(0, len(canonicals), 500):
+        chunk = canonicals[i:i + 500]
+        rows = conn.execute(
+            f"SELECT * FROM article_texts WHERE canonical IN ({','.join('?' * len(chunk))})", chunk,
+        ).fetchall()
+        for r in rows:
+            ttl = RETRY_SECONDS if r["error"] else TTL_DAYS * 86400
+            if now - r["fetched_at"] < ttl:
+                out[r["canonical"]] = r
+    return out
+
+
+def _row_out(row) -> dict:
+    body = zlib.decompress(row["body"]).decode("utf-8") if row["body"] else ""
+    return {"text": body, "title": row["title"] or "", "error": row["error"], "retry": False}
+
+
+def _store(rows: list) -> None:
+    if not rows:
+        return
+    conn = connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO article_texts (canonical, url, title, body, chars, status, error, fetched_at) "
+            "VALUES (:canonical, :url, :title, :body, :chars, :status, :error, :fetched_at)",
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def text(url: str) -> str:
+    """Testo già estratto per `url` ('' se non è in cache): per chi rilegge senza riscaricare."""
+    row = _load([canonical_url(url)]).get(canonical_url(url))
+    return _row_out(row)["text"] if row else ""
+
+
+def fetch_texts(urls: list, deadline: float = DEADLINE, budget=None) -> dict:
+    """
+    {url: {text, title, error, retry}} per `urls`: dalla cache quando c'è,
+    altrimenti scaricati ed estratti in parallelo entro `deadline`.
+    budget(n) → quanti degli n download rimasti sono ammessi (nell'ordine
+    di `urls`); gli altri, come scadenza e host occupato, tornano con
+    retry=True: la pagina va ritentata alla prossima scansione. Gli altri
+    errori restano in cache per RETRY_SECONDS.
+    """
+    urls  = list(dict.fromkeys(u for u in urls if u and u.startswith("http")))
+    canon = {u: canonical_url(u) for u in urls}
+    cache = _load(list(set(canon.values())))
+    out   = {u: _row_out(cache[c]) for u, c in canon.items() if c in cache}
+    todo, seen = [], set()
+    for u in urls:
+        if u not in out and canon[u] not in seen:
+            seen.add(canon[u])
+            todo.append(u)
+    cached = len(out)
+    if budget is not None and todo:
+        allowed = budget(len(todo))
+        for url in todo[allowed:]:
+            for u in urls:
+                if canon[u] == canon[url]:
+                    out[u] = {"text": "", "title": "", "error": OVER_BUDGET, "retry": True}
+        todo = todo[:allowed]
+    if not todo:
+        return out
+
+    def process(url, resp):
+        ctype = next((v for k, v in resp["headers"].items() if k.lower() == "content-type"), "text/html")
+        if "html" not in ctype:
+            raise ValueError(f"non HTML ({ctype.split(';')[0]})")
+        return extract(resp["body"])
+
+    t0, rows, now = time.perf_counter(), [], time.time()
+    results = fetcher.run(todo, lambda u: u, process, deadline=deadline, fetch=_polite_get)
+    for url, r in zip(todo, results):
+        retry = r["error"] in _RETRY
+        ex    = r["result"] or {}
+        if r["error"] and not ex:
+            outcome = "retry" if retry else "error"
+        else:
+            outcome = "ok" if ex.get("text") else "empty"
+        metrics.inc("spiz_fulltext_pages", 1, {"outcome": outcome})
+        res = {"text": ex.get("text", ""), "title": ex.get("title", ""), "error": r["error"], "retry": retry}
+        for u in urls:
+            if canon[u] == canon[url]:
+                out[u] = res
+        if retry:
+            continue
+        row = {"canonical": canon[url], "url": url, "title": res["title"],
+               "body": zlib.compress(res["text"].encode("utf-8"), 6) if res["text"] else None,
+               "chars": len(res["text"]), "status": r["status"], "error": r["error"], "fetched_at": now}
+        rows.append(row)
+        declared = ex.get("canonical") and canonical_url(ex["canonical"])
+        if declared and declared != canon[url]:
+            rows.append(dict(row, canonical=declared))
+    try:
+        _store(rows)
+    except Exception as e:
+        print(f"[FULLTEXT] cache non aggiornata: {e}")
+    ok = sum(1 for r in results if r["result"] and r["result"].get("text"))
+    print(f"[FULLTEXT] {len(todo)} pagine scaricate in {time.perf_counter() - t0:.1f}s "
+          f"({ok} con testo, {cached} dalla cache), errori: "
+          f"{sum(1 for r in results if r['error'])}")
+    return out
+
+
+def evict(force: bool = False) -> int:
+    """Elimina i testi più vecchi di TTL_DAYS (al più una volta l'ora); restituisce quanti."""
+    now = time.time()
+    if not force and now - _evicted["at"] < EVICT_SECONDS:
+        return 0
+    _evicted["at"] = now
+    cur = connect().execute("DELETE FROM article_texts WHERE fetched_at < ?", (now - TTL_DAYS * 86400,))
+    return cur.rowcount or 0
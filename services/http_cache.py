@@ -0,0 +1,210 @@
+"""
+services/http_cache.py — Compressione, ETag e GET condizionali
+- Pagine statiche (web/*.html): lette una volta, precompresse in gzip (e
+  brotli se il pacchetto è installato) e servite con ETag forte: una
+  navigazione successiva costa un 304.
+- Endpoint JSON: l'ETag deriva dai watermark dei dati (tabella
+  data_watermarks, sql/data_watermarks.sql) da cui dipende la risposta,
+  più data odierna e query string. Se nessun watermark è cambiato il
+  polling con If-None-Match riceve 304 senza eseguire l'endpoint.
+- Le altre risposte sono compresse in gzip dal middleware, tranne gli
+  stream SSE che devono arrivare subito, evento per evento.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from services.database import supabase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TABLE         = "data_watermarks"
+WATERMARK_TTL = float(os.getenv("SPIZ_WATERMARK_TTL", "2"))   # secondi di cache in processo
+MIN_SIZE      = 1024                                          # sotto questa soglia non si comprime
+
+# mai compressi: download di report (docx già zip, richieste Range → 206)
+UNCOMPRESSED_PREFIXES = ("/api/download-report/",)
+
+# endpoint JSON → watermark da cui dipendono
+WATERMARKED = {
+    "/api/dashboard-stats":    ("articles", "analytics"),
+    "/api/last-upload":        ("articles",),
+    "/api/today-stats":        ("articles", "analytics"),
+    "/api/trends":             ("articles", "mentions"),
+    "/api/analytics/matrix":   ("articles", "mentions", "analytics"),
+    "/api/today-mentions":     ("articles", "clients", "mentions"),
+    "/api/top-giornalisti":    ("articles", "analytics"),
+    "/api/giornalista-articoli": ("articles",),
+    "/api/client-articles":    ("articles", "clients", "mentions"),
+    "/api/articles":           ("articles",),
+    "/api/journalists":        ("articles", "analytics"),
+    "/api/clients":            ("clients",),
+    "/api/monitored-sources":  ("sources",),
+    "/api/monitor-meta":       ("monitor_meta",),
+    "/api/web-mentions":       ("web_mentions",),
+}
+
+# scritture via API → watermark da aggiornare (prefisso del percorso)
+WRITTEN_BY = (
+    ("/api/article/",           ("articles", "mentions")),
+    ("/api/clients",            ("clients", "mentions")),
+    ("/api/monitored-sources",  ("sources",)),
+    ("/api/monitor-meta",       ("monitor_meta",)),
+)
+
+_lock       = threading.Lock()
+_watermarks = {"values": None, "read": 0.0}
+_pages: dict = {}   # path -> (mtime, size, {encoding: bytes}, etag)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# WATERMARK
+# ══════════════════════════════════════════════════════════════════════
+
+def bump(*names: str) -> None:
+    """Da chiamare dopo ogni scrittura: invalida gli ETag degli endpoint che dipendono da `names`."""
+    version = time.time_ns()
+    now     = datetime.now(timezone.utc).isoformat()
+    try:
+        supabase.table(TABLE).upsert(
+            [{"name": n, "version": version, "updated_at": now} for n in names], on_conflict="name",
+        ).execute()
+    except Exception as e:
+        print(f"[HTTP-CACHE] watermark {', '.join(names)} non aggiornato: {e}")
+    with _lock:
+        if _watermarks["values"] is not None:
+            _watermarks["values"].update({n: version for n in names})
+
+
+def watermarks() -> dict | None:
+    """{nome: versione}, con una cache di WATERMARK_TTL secondi; None se la tabella non è disponibile."""
+    with _lock:
+        if _watermarks["values"] is not None and time.time() - _watermarks["read"] < WATERMARK_TTL:
+            return dict(_watermarks["values"])
+    try:
+        rows = supabase.table(TABLE).select("name, version").execute().data or []
+        values = {r["name"]: int(r["version"]) for r in rows}
+    except Exception as e:
+        print(f"[HTTP-CACHE] watermark non disponibili: {e}")
+        values = None
+    with _lock:
+        _watermarks.update(values=values, read=time.time())
+    return dict(values) if values is not None else None
+
+
+def json_etag(path: str, query: str) -> str | None:
+    """ETag debole della risposta di un endpoint in WATERMARKED, o None."""
+    names = WATERMARKED.get(path)
+    if not names:
+        return None
+    values = watermarks()
+    if values is None:
+        return None
+    raw = "|".join([path, query, date.today().isoformat()] + [f"{n}={values.get(n, 0)}" for n in names])
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def written_by(method: str, path: str) -> tuple:
+    if method not in ("POST", "PUT", "PATCH", "DELETE"):
+        return ()
+    return next((names for prefix, names in WRITTEN_BY if path.startswith(prefix)), ())
+
+
+def is_error_body(body: bytes) -> bool:
+    """Gli endpoint segnalano gli errori con {"error": ...} e status 200: niente ETag."""
+    return b'"error":' in body
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = lambda t: t.strip().removeprefix("W/")
+    return bare(etag) in {bare(t) for t in if_none_match.split(",")}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# PAGINE STATICHE
+# ══════════════════════════════════════════════════════════════════════
+
+def _load_page(path: str) -> tuple:
+    st = os.stat(path)
+    with _lock:
+        cached = _pages.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached
+    with open(path, "rb") as f:
+        raw = f.read()
+    bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(raw, quality=11)
+    entry = (st.st_mtime, st.st_size, bodies, hashlib.sha256(raw).hexdigest()[:32])
+    with _lock:
+        _pages[path] = entry
+    return entry
+
+
+def _accepts(accept_encoding: str, encoding: str) -> bool:
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def static_page(path: str, headers) -> tuple:
+    """(status, body, headers) per una pagina statica, già compressa e con ETag forte."""
+    _, _, bodies, digest = _load_page(path)
+    accept   = headers.get("accept-encoding", "")
+    encoding = next((e for e in ("br", "gzip") if e in bodies and _accepts(accept, e)), "identity")
+    # ETag forte per rappresentazione: ogni codifica ha il suo
+    etag = f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+    out  = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(headers.get("if-none-match"), etag):
+        return 304, b"", out
+    if encoding != "identity":
+        out["Content-Encoding"] = encoding
+    return 200, bodies[encoding], out
+
+
+# ══════════════════════════════════════════════════════════════════════
+# MIDDLEWARE
+# ══════════════════════════════════════════════════════════════════════
+
+class CompressionMiddleware:
+    """
+    GZipMiddleware di Starlette per tutte le risposte, tranne gli stream SSE
+    (richieste con Accept: text/event-stream o percorsi .../events) e i
+    download in UNCOMPRESSED_PREFIXES.
+    Le risposte che hanno già Content-Encoding (pagine statiche) passano
+    così come sono.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        from starlette.middleware.gzip import GZipMiddleware
+        self.app  = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and not _is_event_stream(scope)
+                and not scope.get("path", "").startswith(UNCOMPRESSED_PREFIXES)):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def _is_event_stream(scope) -> bool:
+    if scope.get("path", "").endswith("/events"):
+        return True
+    for k, v in scope.get("headers") or []:
+        if k == b"accept" and b"text/event-stream" in v:
+            return True
+    return False
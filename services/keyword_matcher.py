@@ -0,0 +1,198 @@
+"""
+services/keyword_matcher.py — Matching keyword dei clienti in una sola passata
+Una regex compilata (alternanza delle keyword di tutti i clienti,
+fattorizzata per prefissi) costruita una volta: per ogni testo
+restituisce tutti i clienti che lo citano con una sola scansione, fatta
+dal motore di re in C. Con poche keyword (fino a SUBSTRING_MAX, o un
+solo cliente) costano meno i controlli per sottostringa, uno per keyword.
+Testo e keyword sono normalizzati (minuscole, senza accenti, apostrofi
+tipografici → '), i confini di parola sono opzionali.
+Il matcher condiviso (get_matcher) si ricostruisce solo quando cambia la
+tabella clients; le rotte CRUD dei clienti chiamano invalidate().
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+
+# SPIZ_KEYWORD_WORD_BOUNDARY=1: "enel" non trova più "Enelgreen"
+WORD_BOUNDARY   = os.getenv("SPIZ_KEYWORD_WORD_BOUNDARY", "0") == "1"
+REFRESH_SECONDS = 60   # ogni quanto get_matcher() senza argomenti ricontrolla la tabella
+SUBSTRING_MAX   = 200  # fino a quante keyword distinte si cercano una per una
+
+_COMBINING = re.compile("[\u0300-\u036f]")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+_PUNCT     = (("\u2019", "'"), ("\u2018", "'"), ("`", "'"), ("\u00a0", " "))
+_folded: dict = {}   # sequenza non ASCII → senza accenti (in un testo italiano sono poche e ripetute)
+_SEP       = "\n"   # separatore tra i campi: nessuna keyword lo contiene
+
+
+def _fold(m) -> str:
+    run = m.group()
+    out = _folded.get(run)
+    if out is None:
+        out = _COMBINING.sub("", unicodedata.normalize("NFKD", run))
+        if len(_folded) < 50_000:
+            _folded[run] = out
+    return out
+
+
+def normalize(text: str) -> str:
+    # str.replace e NFKD solo sulle sequenze non ASCII: str.translate con un dict costa più della ricerca
+    text = text or ""
+    for old, new in _PUNCT:
+        text = text.replace(old, new)
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return _NON_ASCII.sub(_fold, text)
+
+
+def parse_keywords(raw: str) -> list[str]:
+    if not raw:
+        return []
+    return [k.strip() for k in raw.replace("\n", ",").split(",") if k.strip()]
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _find_all(text: str, sub: str):
+    start = text.find(sub)
+    while start != -1:
+        yield start
+        start = text.find(sub, start + 1)
+
+
+def _trie_pattern(words) -> str:
+    """
+    Alternanza delle keyword fattorizzata per prefissi (a(?:b|c)… invece di
+    ab|ac|…): il motore di re, in C, prova un solo ramo per carattere.
+    """
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def _pattern(node: dict) -> str:
+        alts = [re.escape(ch) + _pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return _pattern(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, clients: list[dict], word_boundary: bool = WORD_BOUNDARY):
+        self.word_boundary = word_boundary
+        self.clients = {c["id"]: c for c in clients}
+        # keyword normalizzata → [(id_cliente, keyword originale)]
+        self._owners: dict = {}
+        for c in clients:
+            for kw in parse_keywords(c.get("keywords") or ""):
+                norm = normalize(kw)
+                if norm and (c["id"], kw) not in self._owners.get(norm, []):
+                    self._owners.setdefault(norm, []).append((c["id"], kw))
+        self.size = sum(len(v) for v in self._owners.values())
+        # poche keyword (o un solo cliente): i controlli per sottostringa in C
+        # costano meno della regex, che conviene solo quando le keyword sono tante
+        self._regex = None
+        if len(self.clients) > 1 and len(self._owners) > SUBSTRING_MAX:
+            self._regex = re.compile(f"(?=({_trie_pattern(self._owners)}))")
+            # a parità di inizio la regex restituisce la keyword più lunga: le più corte sono suoi prefissi
+            self._prefixes = {k: [p for p in self._owners if k.startswith(p)] for k in self._owners}
+
+    def _found(self, text: str) -> set:
+        """Keyword normalizzate presenti in `text` (a confini di parola se richiesto)."""
+        if not self.word_boundary:
+            if self._regex is None:
+                return {norm for norm in self._owners if norm in text}
+            return {p for hit in set(self._regex.findall(text)) for p in self._prefixes[hit]}
+        found = set()
+        if self._regex is None:
+            occurrences = ((start, norm) for norm in self._owners for start in _find_all(text, norm))
+        else:
+            occurrences = ((m.start(), p) for m in self._regex.finditer(text) for p in self._prefixes[m.group(1)])
+        for start, norm in occurrences:
+            end = start + len(norm)
+            if not ((start > 0 and _is_word(text[start - 1])) or (end < len(text) and _is_word(text[end]))):
+                found.add(norm)
+        return found
+
+    def match(self, *texts: str) -> dict:
+        """{id_cliente: [keyword trovate]} per i testi dati, nell'ordine delle keyword del cliente."""
+        if not self.size:
+            return {}
+        found = self._found(normalize(_SEP.join(t for t in texts if t)))
+        if not found:
+            return {}
+        out: dict = {}
+        for norm, owners in self._owners.items():
+            if norm in found:
+                for client_id, keyword in owners:
+                    out.setdefault(client_id, []).append(keyword)
+        return out
+
+    def matching_clients(self, *texts: str) -> set:
+        return set(self.match(*texts))
+
+    def keywords_of(self, client_id) -> str:
+        return (self.clients.get(client_id) or {}).get("keywords") or ""
+
+
+# ══════════════════════════════════════════════════════════════════════
+# MATCHER CONDIVISO
+# ══════════════════════════════════════════════════════════════════════
+
+_lock    = threading.Lock()
+_current = {"matcher": None, "fingerprint": None, "checked": 0.0}
+
+
+def _fingerprint(clients: list[dict]) -> str:
+    h = hashlib.sha1()
+    for c in sorted(clients, key=lambda c: str(c.get("id"))):
+        h.update(f"{c.get('id')}\x1f{c.get('name')}\x1f{c.get('keywords') or ''}\x1e".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _load_clients() -> list[dict]:
+    from services.database import supabase
+    return supabase.table("clients").select("id, name, keywords").execute().data or []
+
+
+def get_matcher(clients: list[dict] = None, require: dict = None) -> KeywordMatcher:
+    """
+    Matcher per la tabella clients. Con `clients` (l'intera tabella) lo
+    ricostruisce solo se è cambiata; senza argomenti usa quello in memoria
+    e ricontrolla la tabella al più ogni REFRESH_SECONDS. `require` è una
+    riga cliente appena letta: se il matcher ha keyword diverse, si ricarica.
+    """
+    with _lock:
+        m = _current["matcher"]
+        if clients is None and m is not None and time.time() - _current["checked"] < REFRESH_SECONDS:
+            if require is None or m.keywords_of(require.get("id")) == (require.get("keywords") or ""):
+                return m
+        if clients is None:
+            clients = _load_clients()
+        fp = _fingerprint(clients)
+        if m is None or fp != _current["fingerprint"]:
+            t0 = time.perf_counter()
+            m  = KeywordMatcher(clients)
+            print(f"[KEYWORDS] matcher ricostruito: {len(clients)} clienti, {m.size} keyword "
+                  f"in {(time.perf_counter() - t0) * 1000:.1f}ms")
+            _current["matcher"], _current["fingerprint"] = m, fp
+        _current["checked"] = time.time()
+        return m
+
+
+def invalidate() -> None:
+    with _lock:
+        _current["matcher"], _current["fingerprint"] = None, None
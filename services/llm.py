@@ -0,0 +1,118 @@
+"""
+services/llm.py — Punto unico per le chiamate OpenAI
+Tutti i moduli passano da chat() ed embed(): ogni chiamata registra
+modello, fase, durata, token di prompt/completion, retry e costo stimato
+negli istogrammi di services/metrics.py e nella traccia della richiesta.
+"""
+
+import os
+import random
+import time
+
+from services import metrics
+
+MAX_RETRIES = int(os.getenv("SPIZ_LLM_RETRIES", "2"))
+
+# USD per milione di token (input, output)
+PRICES = {
+    "gpt-4o":                 (2.50, 10.00),
+    "gpt-4o-mini":            (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+metrics.describe("spiz_llm_latency_seconds", "Durata delle chiamate OpenAI per modello e fase")
+metrics.describe("spiz_llm_tokens", "Token per chiamata OpenAI", buckets=metrics.TOKEN_BUCKETS)
+metrics.describe("spiz_llm_calls_total", "Chiamate OpenAI per esito")
+metrics.describe("spiz_llm_retries_total", "Retry delle chiamate OpenAI")
+metrics.describe("spiz_llm_tokens_total", "Token consumati per modello, fase e tipo")
+metrics.describe("spiz_llm_cost_usd_total", "Costo stimato in USD")
+
+_client = None
+
+
+def get_client():
+    """
+    Client OpenAI condiviso. SPIZ_OPENAI_BACKEND sceglie lo stand-in:
+    real (default) | fake | record | replay — cassette in SPIZ_OPENAI_CASSETTE.
+    """
+    global _client
+    if _client is None:
+        backend  = os.getenv("SPIZ_OPENAI_BACKEND", "real").lower()
+        cassette = os.getenv("SPIZ_OPENAI_CASSETTE", "data/cassettes/openai.jsonl")
+        if backend in ("fake", "replay"):
+            from services.fake_openai import FakeOpenAI, ReplayOpenAI
+            _client = FakeOpenAI() if backend == "fake" else ReplayOpenAI(cassette)
+        else:
+            from openai import OpenAI
+            _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)   # i retry li conta _call
+            if backend == "record":
+                from services.fake_openai import RecordingOpenAI
+                _client = RecordingOpenAI(_client, cassette)
+        print(f"[LLM] backend: {backend}")
+    return _client
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = PRICES.get(model, PRICES.get(model.rsplit("-", 1)[0], (0.0, 0.0)))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+def _retryable(exc: Exception) -> bool:
+    try:
+        import openai
+        return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError,
+                                openai.APIConnectionError, openai.InternalServerError))
+    except Exception:
+        return False
+
+
+def _call(kind: str, stage: str, fn, model: str, **kwargs):
+    retries = 0
+    t0 = time.perf_counter()
+    while True:
+        try:
+            resp = fn(model=model, **kwargs)
+            break
+        except Exception as e:
+            if retries < MAX_RETRIES and _retryable(e):
+                retries += 1
+                metrics.inc("spiz_llm_retries_total", 1, {"model": model, "stage": stage})
+                time.sleep(min(8.0, 0.5 * 2 ** retries) * (0.5 + random.random()))
+                continue
+            elapsed = time.perf_counter() - t0
+            metrics.inc("spiz_llm_calls_total", 1, {"model": model, "stage": stage, "status": "error"})
+            metrics.observe("spiz_llm_latency_seconds", elapsed, {"model": model, "stage": stage, "kind": kind})
+            metrics.trace_append(stage, elapsed, model=model, retries=retries, error=type(e).__name__)
+            raise
+
+    elapsed = time.perf_counter() - t0
+    usage   = getattr(resp, "usage", None)
+    p_tok   = getattr(usage, "prompt_tokens", 0) or 0
+    c_tok   = getattr(usage, "completion_tokens", 0) or 0
+    cost    = estimate_cost(model, p_tok, c_tok)
+
+    labels = {"model": model, "stage": stage}
+    metrics.observe("spiz_llm_latency_seconds", elapsed, {**labels, "kind": kind})
+    metrics.observe("spiz_llm_tokens", p_tok + c_tok, labels)
+    metrics.inc("spiz_llm_calls_total", 1, {**labels, "status": "ok"})
+    metrics.inc("spiz_llm_tokens_total", p_tok, {**labels, "type": "prompt"})
+    metrics.inc("spiz_llm_tokens_total", c_tok, {**labels, "type": "completion"})
+    metrics.inc("spiz_llm_cost_usd_total", cost, labels)
+    metrics.trace_append(
+        stage, elapsed,
+        model=model, prompt_tokens=p_tok, completion_tokens=c_tok,
+        retries=retries, cost_usd=round(cost, 6),
+    )
+    return resp
+
+
+def chat(stage: str, model: str, **kwargs):
+    """client.chat.completions.create strumentato. stage: es. 'map_batch', 'reduce'."""
+    return _call("chat", stage, get_client().chat.completions.create, model, **kwargs)
+
+
+def embed(stage: str, model: str, **kwargs):
+    """client.embeddings.create strumentato."""
+    return _call("embedding", stage, get_client().embeddings.create, model, **kwargs)
@@ -0,0 +1,44 @@
+"""
+services/local_store.py — Archivio SQLite locale
+Stato che deve sopravvivere ai riavvii ma non appartiene a Supabase
+(sessioni chat, code di lavoro, cache). Una connessione per thread,
+journal WAL così più processi sullo stesso host possono condividerlo.
+"""
+
+import os
+import sqlite3
+import threading
+
+DB_PATH = os.getenv("SPIZ_LOCAL_DB", "data/spiz_local.db")
+
+_local   = threading.local()
+_schemas: list[str] = []
+_lock    = threading.Lock()
+
+
+def register_schema(ddl: str) -> None:
+    """Registra DDL (idempotente, CREATE ... IF NOT EXISTS) da applicare a ogni connessione."""
+    with _lock:
+        if ddl not in _schemas:
+            _schemas.append(ddl)
+
+
+def connect() -> sqlite3.Connection:
+    """Connessione del thread corrente, con gli schemi registrati già applicati."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn    = conn
+        _local.applied = 0
+    if _local.applied < len(_schemas):
+        with _lock:
+            pending = _schemas[_local.applied:]
+        for ddl in pending:
+            conn.executescript(ddl)
+        _local.applied += len(pending)
+    return conn
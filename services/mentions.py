@@ -0,0 +1,232 @@
+"""
+services/mentions.py — Indice articolo → cliente (tabella article_client_mentions)
+Le citazioni dei clienti si calcolano una volta sola: all'ingestion per i
+nuovi articoli, con un backfill per cliente quando ne cambiano le keyword.
+Gli endpoint per cliente diventano ricerche sull'indice; finché l'indice
+di un cliente non è allineato alle sue keyword (client_mention_index)
+ripiegano sulla scansione con services/keyword_matcher.py.
+Il backfill parte dalle rotte che creano o modificano un cliente e, per
+gli indici rimasti indietro (backfill fallito, istanza riavviata), dal
+ciclo reconcile_loop sul leader di services/scheduler.py: le letture non
+lo avviano mai.
+Schema: sql/article_client_mentions.sql
+
+Backfill da riga di comando:
+    python -m services.mentions --all
+    python -m services.mentions --client <id>
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from services.database import supabase
+from services import keyword_matcher, pagination, bulk, rollups, http_cache
+
+TABLE       = "article_client_mentions"
+STATE_TABLE = "client_mention_index"
+WRITE_BATCH = 500
+IN_CHUNK    = 200    # id per filtro in_() — la query string ha un limite
+RECONCILE_SECONDS = 300
+
+TEXT_FIELDS = "id, data, titolo, occhiello, testo_completo"
+
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+def _rows_for(article: dict, hits: dict) -> list[dict]:
+    return [{
+        "article_id":       article["id"],
+        "client_id":        client_id,
+        "data":             article.get("data"),
+        "matched_keywords": ", ".join(kws),
+    } for client_id, kws in hits.items()]
+
+
+def _write(rows: list[dict]) -> int:
+    for i in range(0, len(rows), WRITE_BATCH):
+        supabase.table(TABLE).upsert(rows[i:i + WRITE_BATCH], on_conflict="article_id,client_id").execute()
+    return len(rows)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# SCRITTURA
+# ══════════════════════════════════════════════════════════════════════
+
+def index_articles(articles: list[dict], matcher=None) -> list[dict]:
+    """
+    Indicizza articoli appena inseriti (servono id, data, titolo, occhiello,
+    testo_completo) e restituisce le righe scritte, usate anche dai rollup.
+    """
+    matcher = matcher or keyword_matcher.get_matcher()
+    rows = []
+    for a in articles:
+        if a.get("id") is None:
+            continue
+        rows.extend(_rows_for(a, matcher.match(a.get("titolo"), a.get("occhiello"), a.get("testo_completo"))))
+    _write(rows)
+    return rows
+
+
+def reindex_article(article_id) -> list[dict]:
+    """Ricalcola le citazioni di un articolo modificato."""
+    forget_article(article_id)
+    res = supabase.table("articles").select(TEXT_FIELDS).eq("id", article_id).execute()
+    return index_articles(res.data or [])
+
+
+def forget_article(article_id) -> None:
+    supabase.table(TABLE).delete().eq("article_id", article_id).execute()
+
+
+def forget_client(client_id) -> None:
+    supabase.table(TABLE).delete().eq("client_id", client_id).execute()
+    supabase.table(STATE_TABLE).delete().eq("client_id", client_id).execute()
+
+
+def reindex_client(client: dict) -> int:
+    """Backfill dell'indice per un cliente, da rifare quando ne cambiano le keyword."""
+    client_id = client["id"]
+    keywords  = client.get("keywords") or ""
+    matcher   = keyword_matcher.KeywordMatcher([client])
+    supabase.table(TABLE).delete().eq("client_id", client_id).execute()
+
+    total, rows, matched = 0, [], []
+    if matcher.size:
+        for a in bulk.iter_rows("articles", TEXT_FIELDS + ", ave, tone, reputational_risk"):
+            hits = matcher.match(a.get("titolo"), a.get("occhiello"), a.get("testo_completo"))
+            if hits:
+                rows.extend(_rows_for(a, hits))
+                matched.append({k: a.get(k) for k in ("id", "data", "ave", "tone", "reputational_risk")})
+            if len(rows) >= WRITE_BATCH:
+                total += _write(rows)
+                rows = []
+        total += _write(rows)
+    try:
+        rollups.replace_client(client_id, matched)
+    except Exception as e:
+        print(f"[MENTIONS] rollup cliente {client_id} non aggiornati: {e}")
+
+    supabase.table(STATE_TABLE).upsert({
+        "client_id":  client_id,
+        "keywords":   keywords,
+        "articles":   total,
+        "indexed_at": datetime.now(timezone.utc).isoformat(),
+    }, on_conflict="client_id").execute()
+    http_cache.bump("mentions")
+    print(f"[MENTIONS] indice {client.get('name', client_id)}: {total} articoli")
+    return total
+
+
+def reindex_async(client_id) -> None:
+    """Backfill in background dopo una modifica alle keyword; un solo job per cliente."""
+    with _running_lock:
+        if client_id in _running:
+            return
+        _running.add(client_id)
+
+    def _job():
+        try:
+            res = supabase.table("clients").select("id, name, keywords").eq("id", client_id).execute()
+            if res.data:
+                reindex_client(res.data[0])
+        except Exception as e:
+            print(f"[MENTIONS] backfill {client_id} fallito: {e}")
+        finally:
+            with _running_lock:
+                _running.discard(client_id)
+
+    threading.Thread(target=_job, daemon=True, name=f"mentions-{client_id}").start()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# LETTURA
+# ══════════════════════════════════════════════════════════════════════
+
+def _built() -> dict:
+    state = supabase.table(STATE_TABLE).select("client_id, keywords").execute().data or []
+    return {str(s["client_id"]): s.get("keywords") or "" for s in state}
+
+
+def ready_clients(clients: list[dict]) -> set:
+    """Id dei clienti il cui indice è costruito con le keyword attuali (gli altri ripiegano sulla scansione)."""
+    try:
+        built = _built()
+    except Exception as e:
+        print(f"[MENTIONS] stato indice non disponibile: {e}")
+        return set()
+    return {c["id"] for c in clients if built.get(str(c["id"])) == (c.get("keywords") or "")}
+
+
+def reconcile_loop(stop: threading.Event) -> None:
+    """Ciclo del leader: ogni RECONCILE_SECONDS ricostruisce, uno alla volta, gli indici non allineati."""
+    while not stop.wait(RECONCILE_SECONDS):
+        try:
+            built   = _built()
+            clients = supabase.table("clients").select("id, name, keywords").execute().data or []
+            for c in clients:
+                if stop.is_set():
+                    break
+                if built.get(str(c["id"])) != (c.get("keywords") or "") and \
+                        keyword_matcher.parse_keywords(c.get("keywords") or ""):
+                    with _running_lock:
+                        if c["id"] in _running:
+                            continue
+                        _running.add(c["id"])
+                    try:
+                        reindex_client(c)
+                    finally:
+                        with _running_lock:
+                            _running.discard(c["id"])
+        except Exception as e:
+            print(f"[MENTIONS] riallineamento indici fallito: {e}")
+
+
+def counts_for_day(day: str) -> Counter:
+    """Articoli del giorno per cliente."""
+    rows = bulk.iter_rows(TABLE, "client_id", where=lambda q: q.eq("data", day),
+                          order=[("article_id", False), ("client_id", False)])
+    return Counter(str(r["client_id"]) for r in rows)
+
+
+def client_article_page(client_id, from_date: str, to_date: str, limit: int, cursor: str = None) -> tuple:
+    """(id degli articoli del cliente, cursore successivo): una pagina in keyset su (data, article_id)."""
+    q = (supabase.table(TABLE).select("article_id, data")
+         .eq("client_id", client_id).gte("data", from_date).lte("data", to_date))
+    rows = pagination.apply_cursor(q, cursor, id_col="article_id").limit(limit + 1).execute().data or []
+    rows, next_cursor = pagination.page(rows, limit, id_col="article_id")
+    return [r["article_id"] for r in rows], next_cursor
+
+
+def client_article_count(client_id, from_date: str, to_date: str) -> int:
+    res = (supabase.table(TABLE).select("article_id", count="exact")
+           .eq("client_id", client_id).gte("data", from_date).lte("data", to_date)
+           .limit(1).execute())
+    return res.count or 0
+
+
+def fetch_articles(ids: list, columns: str) -> list[dict]:
+    """Articoli per id, nell'ordine dato."""
+    by_id = {}
+    for i in range(0, len(ids), IN_CHUNK):
+        for a in supabase.table("articles").select(columns).in_("id", ids[i:i + IN_CHUNK]).execute().data or []:
+            by_id[str(a["id"])] = a
+    return [by_id[str(i)] for i in ids if str(i) in by_id]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Backfill dell'indice article_client_mentions")
+    ap.add_argument("--client", help="id del cliente da reindicizzare")
+    ap.add_argument("--all", action="store_true", help="tutti i clienti")
+    args = ap.parse_args()
+
+    q = supabase.table("clients").select("id, name, keywords")
+    if args.client:
+        q = q.eq("id", args.client)
+    elif not args.all:
+        ap.error("indica --client <id> oppure --all")
+    for c in q.execute().data or []:
+        reindex_client(c)
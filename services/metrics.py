@@ -0,0 +1,138 @@
+"""
+services/metrics.py — Metriche di processo e breakdown per richiesta
+Istogrammi e contatori in memoria esposti in formato Prometheus su
+/metrics, più una traccia per richiesta (contextvars) che raccoglie le
+fasi eseguite: chiamate LLM, ricerche, rendering. /api/chat la allega
+alla risposta come timing breakdown.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+TOKEN_BUCKETS   = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_lock       = threading.Lock()
+_histograms: dict = {}   # (name, labels) -> [bucket_counts, sum, count]
+_counters:   dict = {}   # (name, labels) -> value
+_help:       dict = {}
+_buckets:    dict = {}
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("spiz_trace", default=None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def describe(name: str, text: str, buckets: tuple = None) -> None:
+    _help[name] = text
+    if buckets:
+        _buckets[name] = buckets
+
+
+def observe(name: str, value: float, labels: dict = None) -> None:
+    buckets = _buckets.get(name, LATENCY_BUCKETS)
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.setdefault(k, [[0] * len(buckets), 0.0, 0])
+        for i, b in enumerate(buckets):
+            if value <= b:
+                h[0][i] += 1
+        h[1] += value
+        h[2] += 1
+
+
+def inc(name: str, value: float = 1, labels: dict = None) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def _fmt_labels(labels: tuple, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        hists = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        ctrs  = dict(_counters)
+
+    for name in sorted({k[0] for k in hists}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        buckets = _buckets.get(name, LATENCY_BUCKETS)
+        for (n, labels), (counts, total, count) in sorted(hists.items()):
+            if n != name:
+                continue
+            for b, c in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_fmt_labels(labels, {'le': b})} {c}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels, {'le': '+Inf'})} {count}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {round(total, 6)}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+
+    for name in sorted({k[0] for k in ctrs}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), v in sorted(ctrs.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {round(v, 6)}")
+    return "\n".join(lines) + "\n"
+
+
+# ══════════════════════════════════════════════════════════════════════
+# TRACCIA PER RICHIESTA
+# ══════════════════════════════════════════════════════════════════════
+
+def start_trace() -> contextvars.Token:
+    return _trace.set({"started": time.perf_counter(), "stages": []})
+
+
+def end_trace(token: contextvars.Token) -> dict:
+    """Chiude la traccia e restituisce il breakdown da allegare alla risposta."""
+    trace = _trace.get()
+    _trace.reset(token)
+    if not trace:
+        return {}
+    stages = trace["stages"]
+    return {
+        "total_ms":          round((time.perf_counter() - trace["started"]) * 1000, 1),
+        "llm_ms":            round(sum(s["ms"] for s in stages if s.get("model")), 1),
+        "prompt_tokens":     sum(s.get("prompt_tokens", 0) for s in stages),
+        "completion_tokens": sum(s.get("completion_tokens", 0) for s in stages),
+        "cost_usd":          round(sum(s.get("cost_usd", 0.0) for s in stages), 6),
+        "stages":            stages,
+    }
+
+
+def trace_append(stage: str, seconds: float, **fields) -> None:
+    """Aggiunge una fase alla traccia della richiesta corrente, se ce n'è una."""
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages"].append({"stage": stage, "ms": round(seconds * 1000, 1), **fields})
+
+
+def record_stage(stage: str, seconds: float, **fields) -> None:
+    observe("spiz_stage_seconds", seconds, {"stage": stage})
+    trace_append(stage, seconds, **fields)
+
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0)
+
+
+describe("spiz_stage_seconds", "Durata delle fasi applicative (retrieval, rendering, ...)")
+describe("spiz_chat_seconds", "Durata end-to-end di /api/chat")
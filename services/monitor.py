@@ -1,9 +1,11 @@
-import feedparser
 import hashlib
 import datetime
-import requests
-from bs4 import BeautifulSoup
+import json
+import time
 from services.database import supabase
+from services import keyword_matcher, http_cache, fetcher, entry_index, fulltext, enrichment
+
+FULL_TEXT_CHARS = 20_000   # testo completo salvato in web_mentions (per intero resta in fulltext)
 
 
 def clean_text(s):
@@ -34,111 +36,253 @@ def load_clients() -> list[dict]:
 
 
 def parse_keywords(raw: str) -> list[str]:
-    if not raw:
-        return []
-    return [k.strip().lower() for k in raw.replace('\n', ',').split(',') if k.strip()]
+    return [k.lower() for k in keyword_matcher.parse_keywords(raw)]
 
 
-def match_clients(text: str, clients: list[dict]) -> tuple[str, str]:
+def match_clients(text: str, clients: list[dict], matcher=None) -> tuple[str, str]:
     """Restituisce (nomi_clienti_matchati, keyword_trovate)"""
-    text_low = text.lower()
-    matched_clients, matched_kws = [], []
-    for client in clients:
-        keywords = parse_keywords(client.get('keywords', ''))
-        hits = [kw for kw in keywords if kw in text_low]
-        if hits:
-            matched_clients.append(client['name'])
-            matched_kws.extend(hits)
-    return ', '.join(matched_clients), ', '.join(set(matched_kws))
-
-
-def fetch_rss(source: dict, clients: list[dict]) -> list[dict]:
-    """Scarica e processa un feed RSS"""
-    records = []
-    try:
-        feed = feedparser.parse(source['url'])
-        for entry in feed.entries:
-            title   = entry.get('title', '')
-            summary = entry.get('summary', '')
-            link    = entry.get('link', '')
-            text    = f"{title} {summary}"
-
-            matched_client, matched_kws = match_clients(text, clients)
-            if not matched_client:
-                continue  # nessun match, salta
-
-            # Data pubblicazione
-            published = datetime.date.today().isoformat()
-            if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                try:
-                    published = datetime.date(*entry.published_parsed[:3]).isoformat()
-                except Exception:
-                    pass
-
-            content_hash = make_hash(title, link)
-
-            records.append({
-                'source_name':       source['name'],
-                'source_url':        source['url'],
-                'title':             title,
-                'url':               link,
-                'published_at':      published,
-                'summary':           BeautifulSoup(summary, 'html.parser').get_text()[:1000],
-                'full_text':         '',
-                'matched_client':    matched_client,
-                'matched_keywords':  matched_kws,
-                'content_hash':      content_hash,
-                'tone':              'Neutral',
-                'reputational_risk': 'None',
-            })
-    except Exception as e:
-        print(f"Errore RSS {source['url']}: {e}")
-    return records
-
-
-def fetch_scrape(source: dict, clients: list[dict]) -> list[dict]:
-    """Scraping base per siti senza RSS"""
-    records = []
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        resp = requests.get(source['url'], headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        links = soup.find_all('a', href=True)
-
-        for a in links:
-            title = a.get_text(strip=True)
-            link  = a['href']
-            if not title or len(title) < 20:
-                continue
-            if not link.startswith('http'):
+    matcher = matcher or keyword_matcher.get_matcher(clients)
+    hits    = matcher.match(text)
+    matched_clients = [c['name'] for c in clients if c['id'] in hits]
+    matched_kws     = {kw.lower() for kws in hits.values() for kw in kws}
+    return ', '.join(matched_clients), ', '.join(matched_kws)
+
+
+def _record(source: dict, title: str, link: str, published: str, summary: str = '', full_text: str = '',
+            matched_client: str = '', matched_kws: str = '') -> dict:
+    return {
+        'source_name':       source['name'],
+        'source_url':        source['url'],
+        'title':             title,
+        'url':               link,
+        'published_at':      published,
+        'summary':           summary,
+        'full_text':         full_text[:FULL_TEXT_CHARS],
+        'matched_client':    matched_client,
+        'matched_keywords':  matched_kws,
+        'content_hash':      make_hash(title, link),
+        'tone':              None,   # classificati a lotti da services/enrichment.py
+        'reputational_risk': None,
+    }
+
+
+def parse_rss(source: dict, body: bytes, clients: list[dict], matcher=None, skip=None) -> dict:
+    """
+    Estrae dal feed RSS/Atom le voci che citano un cliente: {records, keys,
+    candidates}, dove keys sono le chiavi (entry_index) di tutte le voci del
+    feed e candidates le voci senza match e senza testo completo nel feed,
+    da verificare sulla pagina (attach_full_text). Le voci per cui
+    skip(chiave) è vero non passano da pulizia HTML e matching.
+    """
+    import feedparser
+    from bs4 import BeautifulSoup
+    records, keys, candidates = [], [], []
+    matcher = matcher or keyword_matcher.get_matcher(clients)
+    feed = feedparser.parse(body)
+    for entry in feed.entries:
+        link = entry.get('link', '')
+        key  = entry_index.entry_key(entry.get('id') or link) if (entry.get('id') or link) else None
+        keys.append(key)
+        if key and skip and skip(key):
+            continue  # già elaborata
+
+        title   = entry.get('title', '')
+        summary = entry.get('summary', '')
+        # content:encoded: il feed porta già il testo completo
+        content = ' '.join(c.get('value', '') for c in entry.get('content') or [])
+        full    = BeautifulSoup(content, 'html.parser').get_text(' ', strip=True) if content else ''
+        text    = f"{title} {summary} {full}"
+
+        # Data pubblicazione
+        published = datetime.date.today().isoformat()
+        if hasattr(entry, 'published_parsed') and entry.published_parsed:
+            try:
+                published = datetime.date(*entry.published_parsed[:3]).isoformat()
+            except Exception:
+                pass
+
+        matched_client, matched_kws = match_clients(text, clients, matcher)
+        if not matched_client:
+            if key and not full and link.startswith('http'):
+                candidates.append({'key': key, 'record': _record(
+                    source, title, link, published, BeautifulSoup(summary, 'html.parser').get_text()[:1000])})
+            continue  # nessun match, salta
+
+        records.append(_record(
+            source, title, link, published, BeautifulSoup(summary, 'html.parser').get_text()[:1000],
+            full, matched_client, matched_kws,
+        ))
+    return {'records': records, 'keys': keys, 'candidates': candidates}
+
+
+def parse_scrape(source: dict, body: bytes, clients: list[dict], matcher=None, skip=None) -> dict:
+    """Scraping base per siti senza RSS: i link della pagina che citano un cliente ({records, keys, candidates})"""
+    from bs4 import BeautifulSoup
+    records, keys, candidates = [], [], []
+    matcher = matcher or keyword_matcher.get_matcher(clients)
+    soup  = BeautifulSoup(body, 'html.parser')
+    links = soup.find_all('a', href=True)
+    today = datetime.date.today().isoformat()
+
+    for a in links:
+        title = a.get_text(strip=True)
+        link  = a['href']
+        if not title or len(title) < 20:
+            continue
+        if not link.startswith('http'):
+            continue
+        key = entry_index.entry_key(link)
+        keys.append(key)
+        if skip and skip(key):
+            continue  # già elaborato
+
+        matched_client, matched_kws = match_clients(title, clients, matcher)
+        if not matched_client:
+            candidates.append({'key': key, 'record': _record(source, title, link, today)})
+            continue
+
+        records.append(_record(source, title, link, today, matched_client=matched_client, matched_kws=matched_kws))
+    return {'records': records, 'keys': keys, 'candidates': candidates}
+
+
+def client_signature(clients: list[dict]) -> str:
+    """Firma di nomi e keyword dei clienti: se cambia, voci e sorgenti note si rianalizzano."""
+    return hashlib.sha256(json.dumps(
+        sorted([str(c['id']), c.get('name') or '', c.get('keywords') or ''] for c in clients)
+    ).encode('utf-8')).hexdigest()[:16]
+
+
+def fetch_sources(sources: list[dict], clients: list[dict]) -> list[dict]:
+    """
+    Scarica tutte le sorgenti in parallelo (services/fetcher.py) e le
+    analizza fuori dai thread di I/O. Le sorgenti invariate dall'ultima
+    scansione (304 o stesso contenuto, a parità di keyword dei clienti)
+    non vengono rianalizzate, e nelle altre le voci già elaborate
+    (services/entry_index.py) si saltano. Per sorgente: records, keys
+    (voci presenti), candidates (voci nuove senza match), new (voci mai
+    viste, None alla prima scansione), unchanged, errore, validatori e
+    tempi (attesa host, download, parsing).
+    """
+    matcher = keyword_matcher.get_matcher(clients)
+    variant = client_signature(clients)
+
+    def process(source, resp):
+        parse = parse_scrape if source.get('type') == 'scrape' else parse_rss
+        index = entry_index.known(_source_key(source))
+        parsed = parse(source, resp['body'], clients, matcher, skip=lambda k: index.get(k) == variant)
+        parsed['new_keys'] = {k for k in parsed['keys'] if k and k not in index} if index else None
+        return parsed
+
+    out = []
+    for r in fetcher.run(sources, lambda s: s['url'], process, conditional=True, variant=variant):
+        source = r['item']
+        if r['error']:
+            kind = 'scraping' if source.get('type') == 'scrape' else 'RSS'
+            print(f"Errore {kind} {source['url']}: {r['error']}")
+        parsed = r['result'] or {}
+        out.append({
+            'source':     source,
+            'records':    parsed.get('records', []),
+            'keys':       parsed.get('keys', []),
+            'candidates': parsed.get('candidates', []),
+            'new':        0 if r['unchanged'] else _count(parsed.get('new_keys')),
+            'new_keys':   set() if r['unchanged'] else parsed.get('new_keys'),
+            'variant':    variant,
+            'unchanged':  r['unchanged'],
+            'bytes':      r['bytes'],
+            'error':      r['error'],
+            'validators': r['validators'],
+            'wait_s':     round(r['wait_s'], 3),
+            'fetch_s':    round(r['fetch_s'], 3),
+            'parse_s':    round(r['parse_s'], 3),
+        })
+    return out
+
+
+def _count(keys) -> int | None:
+    return len(keys) if keys is not None else None
+
+
+def attach_full_text(results: list[dict], clients: list[dict], matcher=None, budget=None) -> None:
+    """
+    Testo completo (services/fulltext.py) delle voci che citano un cliente
+    e di al più fulltext.MAX_CANDIDATES candidate per scansione, entro
+    `budget` (download al minuto del poller) se indicato: le voci si
+    rianalizzano sul testo intero, e le candidate che citano un cliente
+    diventano menzioni. Le candidate rimandate (oltre il tetto o il
+    budget, scadenza, host occupato) escono da keys e dal conteggio delle
+    voci nuove, e la sorgente perde i validatori, così la prossima
+    scansione la riscarica e le riprova. Con SPIZ_FULLTEXT_CANDIDATES=0 le
+    candidate restano valutate solo su titolo e sommario.
+    """
+    if not fulltext.ENABLED or fulltext.MAX_CANDIDATES <= 0:
+        return
+    matcher = matcher or keyword_matcher.get_matcher(clients)
+    # a turno fra le sorgenti, perché una homepage con cento link non prenda tutto il tetto
+    queues, picked = [list(r['candidates']) for r in results], []
+    while len(picked) < fulltext.MAX_CANDIDATES and any(queues):
+        for q in queues:
+            if q and len(picked) < fulltext.MAX_CANDIDATES:
+                picked.append(id(q.pop(0)))
+    picked = set(picked)
+    urls = [rec['url'] for r in results for rec in r['records'] if not rec['full_text']]
+    urls += [c['record']['url'] for r in results for c in r['candidates'] if id(c) in picked]
+    texts = fulltext.fetch_texts(urls, budget=budget) if urls else {}
+
+    promoted = 0
+    for r in results:
+        for rec in r['records']:
+            t = texts.get(rec['url'])
+            if t and t['text'] and not rec['full_text']:
+                rec['full_text'] = t['text'][:FULL_TEXT_CHARS]
+                rec['matched_client'], rec['matched_keywords'] = match_clients(
+                    f"{rec['title']} {rec['summary']} {t['text']}", clients, matcher)
+        deferred = set()
+        for c in r['candidates']:
+            t = texts.get(c['record']['url']) if id(c) in picked else None
+            if not t or t['retry']:
+                deferred.add(c['key'])
                 continue
-
-            matched_client, matched_kws = match_clients(title, clients)
-            if not matched_client:
-                continue
-
-            content_hash = make_hash(title, link)
-            records.append({
-                'source_name':       source['name'],
-                'source_url':        source['url'],
-                'title':             title,
-                'url':               link,
-                'published_at':      datetime.date.today().isoformat(),
-                'summary':           '',
-                'full_text':         '',
-                'matched_client':    matched_client,
-                'matched_keywords':  matched_kws,
-                'content_hash':      content_hash,
-                'tone':              'Neutral',
-                'reputational_risk': 'None',
-            })
+            rec = c['record']
+            matched_client, matched_kws = match_clients(
+                f"{rec['title']} {rec['summary']} {t['text']}", clients, matcher) if t['text'] else ('', '')
+            if matched_client:
+                rec.update(full_text=t['text'][:FULL_TEXT_CHARS],
+                           matched_client=matched_client, matched_keywords=matched_kws)
+                r['records'].append(rec)
+                promoted += 1
+        if deferred:
+            r['keys'] = [k for k in r['keys'] if k not in deferred]
+            r['validators'] = None   # un 304 alla prossima scansione le salterebbe
+            if r['new_keys'] is not None:
+                r['new'] = _count(r['new_keys'] - deferred)   # le ritroverà come nuove: contate allora
+    skipped   = sum(len(r['candidates']) for r in results) - len(picked)
+    no_budget = sum(1 for t in texts.values() if t['error'] == fulltext.OVER_BUDGET)
+    if urls or skipped:
+        print(f"[MONITOR] testo completo: {len(urls)} pagine, {promoted} menzioni trovate solo nel testo"
+              + (f", {skipped} candidate rimandate (oltre il tetto)" if skipped > 0 else "")
+              + (f", {no_budget} pagine oltre il budget al minuto" if no_budget else ""))
+
+
+def _source_key(source: dict) -> str:
+    return str(source.get('id') or source['url'])
+
+
+def _remember(results: list[dict]) -> None:
+    """Dopo il salvataggio delle menzioni: indice delle voci e validatori HTTP."""
+    try:
+        for r in results:
+            if not r['error'] and not r['unchanged']:
+                entry_index.record(_source_key(r['source']), r['keys'], r['variant'])
+        fetcher.save_validators(results)
+        entry_index.evict()
+        fulltext.evict()
     except Exception as e:
-        print(f"Errore scraping {source['url']}: {e}")
-    return records
+        print(f"[MONITOR] indice voci non aggiornato: {e}")
 
 
 def run_monitoring() -> dict:
-    """Funzione principale — chiamata dallo scheduler"""
+    """Scansione completa di tutte le sorgenti attive (il polling continuo è in services/poller.py)"""
     print(f"[MONITOR] Avvio scansione: {datetime.datetime.now().isoformat()}")
 
     sources = load_sources()
@@ -152,18 +296,38 @@ def run_monitoring() -> dict:
         print("[MONITOR] Nessun cliente con keyword.")
         return {'status': 'ok', 'found': 0}
 
+    return scan(sources, clients)[0]
+
+
+def scan(sources: list[dict], clients: list[dict], budget=None) -> tuple[dict, list[dict]]:
+    """
+    Scarica e analizza `sources`, salva le nuove menzioni: (esito, risultati per sorgente).
+    budget(n) → download di pagine ammessi (token bucket del poller); None = solo il tetto per scansione.
+    """
+    t0 = time.perf_counter()
     all_records = []
-    for source in sources:
-        if source.get('type') == 'scrape':
-            records = fetch_scrape(source, clients)
-        else:
-            records = fetch_rss(source, clients)
-        print(f"[MONITOR] {source['name']}: {len(records)} match trovati")
-        all_records.extend(records)
+    results = fetch_sources(sources, clients)
+    attach_full_text(results, clients, budget=budget)
+    for r in results:
+        if r['unchanged']:
+            print(f"[MONITOR] {r['source']['name']}: invariata (download {r['fetch_s']:.2f}s)")
+            continue
+        print(f"[MONITOR] {r['source']['name']}: {len(r['records'])} match trovati, "
+              f"{r['new'] if r['new'] is not None else len(r['keys'])} voci nuove "
+              f"(download {r['fetch_s']:.2f}s, attesa host {r['wait_s']:.2f}s, parsing {r['parse_s']:.2f}s)")
+        all_records.extend(r['records'])
+    elapsed = time.perf_counter() - t0
+    slowest = sorted(results, key=lambda r: r['wait_s'] + r['fetch_s'] + r['parse_s'], reverse=True)[:5]
+    slowest = ', '.join(f"{r['source']['name']} {r['fetch_s']:.1f}s" for r in slowest)
+    print(f"[MONITOR] {len(sources)} sorgenti in {elapsed:.1f}s "
+          f"({sum(1 for r in results if r['unchanged'])} invariate, "
+          f"{sum(r['bytes'] for r in results) / 1024:.0f} KB scaricati), errori: "
+          f"{sum(1 for r in results if r['error'])}; più lente: {slowest}")
 
     if not all_records:
         print("[MONITOR] Nessun nuovo articolo trovato.")
-        return {'status': 'ok', 'found': 0}
+        _remember(results)
+        return {'status': 'ok', 'found': 0}, results
 
     # Deduplicazione interna
     seen, deduped = set(), []
@@ -172,14 +336,18 @@ def run_monitoring() -> dict:
             seen.add(r['content_hash'])
             deduped.append(r)
 
-    # Upsert su Supabase
+    # Solo righe nuove: le menzioni già presenti (e la loro analisi) restano intatte
     try:
         result = supabase.table("web_mentions").upsert(
-            deduped, on_conflict="content_hash"
+            deduped, on_conflict="content_hash", ignore_duplicates=True
         ).execute()
         inserted = len(result.data) if result.data else 0
+        if inserted:
+            http_cache.bump("web_mentions")
+            enrichment.notify()
         print(f"[MONITOR] Inseriti: {inserted} | Già presenti ignorati: {len(deduped)-inserted}")
-        return {'status': 'ok', 'found': inserted}
+        _remember(results)
+        return {'status': 'ok', 'found': inserted}, results
     except Exception as e:
         print(f"[MONITOR] Errore upsert: {e}")
-        return {'status': 'error', 'message': str(e)}
\ No newline at end of file
+        return {'status': 'error', 'message': str(e)}, results
@@ -0,0 +1,67 @@
+"""
+services/pagination.py — Paginazione keyset per gli endpoint a lista
+Il cursore è la coppia (data, id) dell'ultima riga restituita, codificata
+in base64 url-safe: la pagina successiva chiede le righe strettamente
+precedenti nell'ordine (data desc, id desc). Costo e dimensione della
+risposta dipendono dalla pagina, non da quanto è grande l'archivio.
+"""
+
+import base64
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT     = 500
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+
+
+def encode_cursor(date_value, id_value) -> str:
+    raw = json.dumps([date_value, id_value], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(data, id) dal cursore; None se assente o non valido."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date_value, id_value = json.loads(raw)
+        return date_value, id_value
+    except Exception:
+        return None
+
+
+def apply_cursor(query, cursor: str, date_col: str = "data", id_col: str = "id"):
+    """Ordina per (date_col, id_col) desc e, se c'è un cursore, riparte da lì."""
+    pos = decode_cursor(cursor)
+    if pos:
+        d, i = pos
+        query = query.or_(f'{date_col}.lt."{d}",and({date_col}.eq."{d}",{id_col}.lt."{i}")')
+    return query.order(date_col, desc=True).order(id_col, desc=True)
+
+
+def page(rows: list, limit: int, date_col: str = "data", id_col: str = "id") -> tuple:
+    """Le righe vanno chieste con limit + 1: restituisce (pagina, cursore successivo o None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.get(date_col), last.get(id_col))
+
+
+def page_in_memory(rows: list, limit: int, cursor: str = None, date_col: str = "data", id_col: str = "id") -> tuple:
+    """Come page(), per liste già in memoria (es. filtrate in Python)."""
+    key  = lambda r: (str(r.get(date_col) or ""), _id_key(r.get(id_col)))
+    rows = sorted(rows, key=key, reverse=True)
+    pos  = decode_cursor(cursor)
+    if pos:
+        mark = (str(pos[0] or ""), _id_key(pos[1]))
+        rows = [r for r in rows if key(r) < mark]
+    return page(rows[:limit + 1], limit, date_col, id_col)
+
+
+def _id_key(v):
+    return (0, int(v), "") if isinstance(v, int) or str(v).isdigit() else (1, 0, str(v))
@@ -0,0 +1,196 @@
+"""
+services/poller.py — Polling adattivo delle sorgenti monitorate
+Al posto della scansione delle 06:00 ogni sorgente ha il suo intervallo
+(tabella source_polls, sql/source_polls.sql), adattato a quante voci
+nuove pubblica davvero (contate con services/entry_index.py): una media
+mobile delle voci all'ora porta le agenzie verso MIN_INTERVAL e i
+settimanali verso MAX_INTERVAL, con un po' di jitter perché le sorgenti
+non si allineino. Ogni TICK_SECONDS il
+ciclo prende le sorgenti scadute (prima quelle con boost manuale, poi le
+più in ritardo) entro un budget globale di download al minuto e le passa
+a monitor.scan(): download concorrenti e GET condizionali, quindi il
+volume resta quello di prima mentre la latenza scende a pochi minuti.
+Le pagine degli articoli scaricate per il testo completo prendono i
+token rimasti nello stesso budget.
+
+Il ciclo gira solo sul leader di services/scheduler.py.
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from services.database import supabase
+from services import monitor, scheduler
+
+TABLE            = "source_polls"
+TICK_SECONDS     = 15
+MIN_INTERVAL     = float(os.getenv("SPIZ_POLL_MIN", "120"))       # secondi
+MAX_INTERVAL     = float(os.getenv("SPIZ_POLL_MAX", "21600"))     # 6 ore
+DEFAULT_INTERVAL = float(os.getenv("SPIZ_POLL_DEFAULT", "900"))   # sorgenti nuove
+BUDGET_PER_MIN   = float(os.getenv("SPIZ_POLL_BUDGET", "30"))     # download al minuto: feed e pagine degli articoli
+BOOST_MINUTES    = 60
+TARGET_NEW       = 1.0    # voci nuove attese per controllo
+ALPHA            = 0.3    # peso dell'ultima osservazione nella media mobile
+JITTER           = 0.1
+
+_lock   = threading.Lock()
+_bucket = {"tokens": BUDGET_PER_MIN, "at": time.monotonic()}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# STATO
+# ══════════════════════════════════════════════════════════════════════
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _ts(value) -> datetime | None:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def load_states() -> dict:
+    rows = supabase.table(TABLE).select("*").execute().data or []
+    return {str(r["source_id"]): r for r in rows}
+
+
+def next_interval(state: dict, new: int | None, elapsed_s: float, error: bool) -> tuple:
+    """(intervallo, voci/ora stimate) dopo un controllo."""
+    interval = float(state.get("interval_s") or DEFAULT_INTERVAL)
+    rate     = float(state.get("rate_per_hour") or 0.0)
+    if error:
+        return min(MAX_INTERVAL, interval * 2), rate
+    if new is None:
+        return interval, rate   # prima osservazione: niente da confrontare
+    if new is not None and elapsed_s > 0:
+        rate = ALPHA * (new * 3600 / elapsed_s) + (1 - ALPHA) * rate
+    target = 3600 * TARGET_NEW / rate if rate > 0 else interval * 1.5
+    # al più raddoppia per controllo: una pausa di pubblicazione non manda subito la sorgente a MAX_INTERVAL
+    target = min(target, interval * 2)
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, target)), rate
+
+
+def _boosted(state: dict, now: datetime) -> bool:
+    until = _ts(state.get("boost_until"))
+    return bool(until and until > now)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# BUDGET
+# ══════════════════════════════════════════════════════════════════════
+
+def _take(n: int) -> int:
+    """Token bucket: quanti dei `n` download richiesti rientrano nel budget al minuto."""
+    with _lock:
+        now = time.monotonic()
+        _bucket["tokens"] = min(BUDGET_PER_MIN, _bucket["tokens"] + (now - _bucket["at"]) * BUDGET_PER_MIN / 60)
+        _bucket["at"] = now
+        k = min(n, int(_bucket["tokens"]))
+        _bucket["tokens"] -= k
+        return k
+
+
+# ══════════════════════════════════════════════════════════════════════
+# CICLO
+# ══════════════════════════════════════════════════════════════════════
+
+def due_sources(sources: list, states: dict, now: datetime) -> list:
+    """Sorgenti da controllare, in ordine di priorità: boost, poi ritardo maggiore."""
+    due = []
+    for s in sources:
+        state   = states.get(str(s["id"])) or {}
+        next_at = _ts(state.get("next_at"))
+        if next_at is None or next_at <= now:
+            late = (now - next_at).total_seconds() if next_at else float("inf")
+            due.append((not _boosted(state, now), -late, s))
+    due.sort(key=lambda d: (d[0], d[1]))
+    return [s for _, _, s in due]
+
+
+def tick() -> dict:
+    """Un giro: controlla le sorgenti scadute entro il budget e ricalcola i loro intervalli."""
+    sources = monitor.load_sources()
+    clients = monitor.load_clients()
+    if not sources or not clients:
+        return {"due": 0, "polled": 0}
+    now    = _now()
+    states = load_states()
+    due    = due_sources(sources, states, now)
+    batch  = due[:_take(len(due))]
+    if not batch:
+        return {"due": len(due), "polled": 0}
+
+    # le pagine degli articoli (testo completo) prendono i token rimasti dopo i feed
+    outcome, results = monitor.scan(batch, clients, budget=_take)
+    now, rows = _now(), []
+    for r in results:
+        sid     = str(r["source"]["id"])
+        state   = states.get(sid) or {}
+        last    = _ts(state.get("last_polled_at"))
+        elapsed = (now - last).total_seconds() if last else 0.0
+        new     = None if r["error"] else r["new"]
+        interval, rate = next_interval(state, new, elapsed, bool(r["error"]))
+        if _boosted(state, now):
+            interval = MIN_INTERVAL
+        wait = interval * random.uniform(1 - JITTER, 1 + JITTER)
+        rows.append({
+            "source_id":      sid,
+            "interval_s":     round(interval, 1),
+            "next_at":        (now + timedelta(seconds=wait)).isoformat(),
+            "last_polled_at": now.isoformat(),
+            "last_new_at":    now.isoformat() if new else state.get("last_new_at"),
+            "rate_per_hour":  round(rate, 4),
+            "polls":          int(state.get("polls") or 0) + 1,
+            "new_items":      int(state.get("new_items") or 0) + (new or 0),
+            "last_error":     r["error"],
+        })
+    supabase.table(TABLE).upsert(rows, on_conflict="source_id").execute()
+    print(f"[POLLER] {len(batch)}/{len(due)} sorgenti scadute controllate, "
+          f"{sum(1 for r in results if r['unchanged'])} invariate, menzioni nuove: {outcome.get('found', 0)}")
+    return {"due": len(due), "polled": len(batch), "found": outcome.get("found", 0)}
+
+
+def poll_loop(stop: threading.Event) -> None:
+    """Ciclo del leader: un tick ogni TICK_SECONDS finché `stop` non è impostato."""
+    print(f"[POLLER] avviato (intervalli {MIN_INTERVAL:.0f}s–{MAX_INTERVAL:.0f}s, budget {BUDGET_PER_MIN:.0f}/min)")
+    while not stop.is_set():
+        try:
+            scheduler.record_tick("poller", tick, idle=lambda r: not r.get("polled"))
+        except Exception as e:
+            print(f"[POLLER] tick fallito: {e}")
+        stop.wait(TICK_SECONDS)
+    print("[POLLER] fermato")
+
+
+# ══════════════════════════════════════════════════════════════════════
+# BOOST E STATO
+# ══════════════════════════════════════════════════════════════════════
+
+def boost(source_id, minutes: int = BOOST_MINUTES) -> dict:
+    """Priorità manuale: la sorgente si controlla subito e poi ogni MIN_INTERVAL per `minutes` minuti."""
+    now    = _now()
+    values = {"boost_until": (now + timedelta(minutes=minutes)).isoformat(), "next_at": now.isoformat()}
+    res = supabase.table(TABLE).update(values).eq("source_id", str(source_id)).execute()
+    if not res.data:
+        res = supabase.table(TABLE).upsert(
+            dict(values, source_id=str(source_id), interval_s=MIN_INTERVAL), on_conflict="source_id",
+        ).execute()
+    return (res.data or [values])[0]
+
+
+def status() -> list:
+    """Sorgenti attive con il loro stato di polling, dalla prossima in scadenza."""
+    states = load_states()
+    out = []
+    for s in monitor.load_sources():
+        state = states.get(str(s["id"])) or {}
+        out.append({"id": s["id"], "name": s.get("name"), "url": s.get("url"),
+                    **{k: v for k, v in state.items() if k != "source_id"}})
+    return sorted(out, key=lambda r: str(r.get("next_at") or ""))
@@ -0,0 +1,197 @@
+"""
+services/repository.py — Funzioni di accesso tipizzate per gli endpoint
+Articoli, clienti, fonti monitorate, web mention e monitor_meta sopra il
+client asincrono di services/db.py. Le funzioni sono async: gli endpoint
+le attendono senza bloccare il loop di FastAPI, e le query indipendenti
+partono insieme (conteggi della dashboard, cliente + pagina di articoli).
+"""
+
+import asyncio
+from datetime import date, timedelta
+from typing import Optional, TypedDict
+
+from services import db, pagination
+
+IN_CHUNK = 200
+
+
+class Article(TypedDict, total=False):
+    id:                 int
+    data:               str
+    testata:            str
+    giornalista:        str
+    titolo:             str
+    occhiello:          str
+    sottotitolo:        str
+    testo_completo:     str
+    tone:               str
+    dominant_topic:     str
+    reputational_risk:  str
+    political_risk:     str
+    macrosettori:       str
+    tipologia_articolo: str
+    tipo_fonte:         str
+    ave:                float
+    content_hash:       str
+
+
+class Client(TypedDict, total=False):
+    id:             str     # uuid
+    name:           str
+    keywords:       str
+    web_keywords:   str
+    sector:         str
+    description:    str
+    website:        str
+    contact:        str
+    semantic_topic: str
+
+
+class Source(TypedDict, total=False):
+    id:     int
+    name:   str
+    url:    str
+    active: bool
+
+
+class WebMention(TypedDict, total=False):
+    id:                int
+    client_id:         str     # uuid
+    source_name:       str
+    source_url:        str
+    title:             str
+    url:               str
+    published_at:      str
+    summary:           str
+    matched_client:    str
+    matched_keywords:  str
+    tone:              str
+    reputational_risk: str
+    content_hash:      str
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ARTICOLI
+# ══════════════════════════════════════════════════════════════════════
+
+async def get_article(article_id, columns: str = "*") -> Optional[Article]:
+    res = await db.table("articles").select(columns).eq("id", article_id).limit(1).run()
+    return res.data[0] if res.data else None
+
+
+async def count_articles(on: str = None, since: str = None, until: str = None) -> int:
+    q = db.table("articles").select("id", count="exact")
+    if on:    q = q.eq("data", on)
+    if since: q = q.gte("data", since)
+    if until: q = q.lte("data", until)
+    return (await q.limit(1).run()).count or 0
+
+
+async def article_counts(today: date) -> dict:
+    """Totale, oggi, ultimi 7 e 30 giorni: quattro conteggi in parallelo."""
+    totale, oggi, settimana, mese = await asyncio.gather(
+        count_articles(),
+        count_articles(on=today.isoformat()),
+        count_articles(since=(today - timedelta(days=7)).isoformat()),
+        count_articles(since=(today - timedelta(days=30)).isoformat()),
+    )
+    return {"totale": totale, "oggi": oggi, "settimana": settimana, "mese": mese}
+
+
+async def articles_by_ids(ids: list, columns: str) -> list[Article]:
+    """Articoli per id nell'ordine dato; i blocchi del filtro in_() partono insieme."""
+    chunks = [ids[i:i + IN_CHUNK] for i in range(0, len(ids), IN_CHUNK)]
+    results = await asyncio.gather(*(db.table("articles").select(columns).in_("id", c).run() for c in chunks))
+    by_id = {str(a["id"]): a for res in results for a in res.data or []}
+    return [by_id[str(i)] for i in ids if str(i) in by_id]
+
+
+async def articles_page(columns: str, limit: int, cursor: str = None, from_date: str = None,
+                        to_date: str = None, testata: str = None, count: bool = False) -> tuple:
+    """(articoli, cursore successivo, totale o None): una pagina keyset su (data, id)."""
+    q = db.table("articles").select(columns, count="exact" if count else None)
+    if from_date: q = q.gte("data", from_date)
+    if to_date:   q = q.lte("data", to_date)
+    if testata:   q = q.eq("testata", testata)
+    res = await pagination.apply_cursor(q, cursor).limit(limit + 1).run()
+    rows, next_cursor = pagination.page(res.data or [], limit)
+    return rows, next_cursor, res.count
+
+
+async def update_article(article_id, values: dict) -> list[Article]:
+    return (await db.table("articles").update(values).eq("id", article_id).run()).data or []
+
+
+async def delete_article(article_id) -> None:
+    await db.table("articles").delete().eq("id", article_id).run()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# CLIENTI
+# ══════════════════════════════════════════════════════════════════════
+
+async def list_clients(columns: str = "*") -> list[Client]:
+    return (await db.table("clients").select(columns).run()).data or []
+
+
+async def get_client(client_id, columns: str = "*") -> Optional[Client]:
+    res = await db.table("clients").select(columns).eq("id", client_id).limit(1).run()
+    return res.data[0] if res.data else None
+
+
+async def create_client(values: dict) -> list[Client]:
+    return (await db.table("clients").insert(values).run()).data or []
+
+
+async def update_client(client_id, values: dict) -> list[Client]:
+    return (await db.table("clients").update(values).eq("id", client_id).run()).data or []
+
+
+async def delete_client(client_id) -> None:
+    await db.table("clients").delete().eq("id", client_id).run()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# FONTI MONITORATE
+# ══════════════════════════════════════════════════════════════════════
+
+async def list_sources(active_only: bool = False) -> list[Source]:
+    q = db.table("monitored_sources").select("*")
+    if active_only:
+        q = q.eq("active", True)
+    return (await q.order("name").run()).data or []
+
+
+async def create_source(values: dict) -> list[Source]:
+    return (await db.table("monitored_sources").insert(values).run()).data or []
+
+
+async def set_source_active(source_id, active: bool) -> list[Source]:
+    return (await db.table("monitored_sources").update({"active": active}).eq("id", source_id).run()).data or []
+
+
+async def delete_source(source_id) -> None:
+    await db.table("monitored_sources").delete().eq("id", source_id).run()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# WEB MENTIONS + MONITOR META
+# ══════════════════════════════════════════════════════════════════════
+
+async def web_mentions_page(columns: str, limit: int, cursor: str = None, client_id=None, risk: str = None) -> tuple:
+    """(menzioni, cursore successivo): keyset su (published_at, id)."""
+    q = db.table("web_mentions").select(columns)
+    if client_id:
+        q = q.eq("client_id", client_id)
+    if risk:
+        q = q.eq("reputational_risk", risk)
+    res = await pagination.apply_cursor(q, cursor, date_col="published_at").limit(limit + 1).run()
+    return pagination.page(res.data or [], limit, date_col="published_at")
+
+
+async def get_monitor_meta() -> list[dict]:
+    return (await db.table("monitor_meta").select("*").run()).data or []
+
+
+async def upsert_monitor_meta(values: dict) -> list[dict]:
+    return (await db.table("monitor_meta").upsert(values).run()).data or []
@@ -0,0 +1,261 @@
+"""
+services/rollups.py — Rollup giornalieri (tabella daily_rollup)
+Per ogni giorno e dimensione (testata, giornalista, tone, rischio
+reputazionale, topic, macrosettore, cliente e alcune coppie) il numero di
+articoli e la somma AVE. Si aggiornano in modo incrementale a ogni inserimento, modifica o
+cancellazione di articoli; le viste di periodo leggono i rollup invece di
+scansionare gli articoli. Schema: sql/daily_rollup.sql
+
+Ricostruzione completa (necessaria anche quando si aggiungono dimensioni):
+    python -m services.rollups --rebuild
+"""
+
+import time
+from collections import defaultdict
+
+from services.database import supabase
+from services import bulk
+
+TABLE        = "daily_rollup"
+MENTIONS     = "article_client_mentions"
+WRITE_BATCH  = 500
+IN_CHUNK     = 200
+READY_TTL    = 60
+BUILT_KIND   = "_built"
+CLIENT_KINDS = ["client", "client.tone", "client.risk"]
+
+# colonne dell'articolo che entrano nei rollup
+ROLLUP_COLS = "id, data, testata, giornalista, tone, reputational_risk, dominant_topic, macrosettori, ave"
+
+_ready = {"value": False, "checked": 0.0}
+
+
+def _macros(article: dict) -> list:
+    return sorted({m.strip() for m in (article.get("macrosettori") or "").split(",") if m.strip()})
+
+
+def keys_for(article: dict, client_ids=()) -> list:
+    """Chiavi (kind, key, key2) a cui contribuisce un articolo."""
+    t, g     = article.get("testata") or "", article.get("giornalista") or ""
+    tone     = article.get("tone") or ""
+    risk     = article.get("reputational_risk") or ""
+    topic    = article.get("dominant_topic") or ""
+    macros   = _macros(article)
+    keys = [("all", "", "")]
+    if t:     keys.append(("testata", t, ""))
+    if g:     keys.append(("giornalista", g, ""))
+    if tone:  keys.append(("tone", tone, ""))
+    if risk:  keys.append(("risk", risk, ""))
+    if topic: keys.append(("topic", topic, ""))
+    keys += [("macrosettore", m, "") for m in macros]
+    if g and t:
+        keys.append(("giornalista.testata", g, t))
+    if g:
+        keys += [("giornalista.macrosettore", g, m) for m in macros]
+    keys += [("client", str(c), "") for c in client_ids]
+
+    # tone e rischio per cliente, testata e topic (serie di /api/trends)
+    for dim, values in (("client", [str(c) for c in client_ids]), ("testata", [t] if t else []),
+                        ("topic", [topic] if topic else [])):
+        for v in values:
+            if tone: keys.append((dim + ".tone", v, tone))
+            if risk: keys.append((dim + ".risk", v, risk))
+    return keys
+
+
+def _ave(article: dict) -> float:
+    try:
+        return float(article.get("ave") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _deltas(articles: list, sign: int, keys_fn=keys_for) -> dict:
+    out = defaultdict(lambda: [0, 0.0])
+    for a in articles:
+        if not a.get("data"):
+            continue
+        ave = _ave(a)
+        for kind, key, key2 in keys_fn(a, a.get("_clients") or ()):
+            d = out[(str(a["data"])[:10], kind, key, key2)]
+            d[0] += sign
+            d[1] += sign * ave
+    return {k: v for k, v in out.items() if v[0] or v[1]}
+
+
+def _rows(deltas: dict) -> list:
+    return [{"day": day, "kind": kind, "key": key, "key2": key2, "n": n, "ave_sum": round(ave, 2)}
+            for (day, kind, key, key2), (n, ave) in deltas.items()]
+
+
+# ══════════════════════════════════════════════════════════════════════
+# SCRITTURA
+# ══════════════════════════════════════════════════════════════════════
+
+def _apply_python(rows: list) -> None:
+    """Ripiego senza la funzione SQL (stand-in locali): lettura, somma, riscrittura."""
+    days  = sorted({r["day"] for r in rows})
+    kinds = sorted({r["kind"] for r in rows})
+    current = {
+        (r["day"], r["kind"], r["key"], r["key2"]): r
+        for r in bulk.iter_rows(TABLE, "day, kind, key, key2, n, ave_sum",
+                                where=lambda q: q.in_("kind", kinds).gte("day", days[0]).lte("day", days[-1]),
+                                order=[("kind", False), ("key", False), ("key2", False), ("day", False)])
+    }
+    upserts, zero = [], []
+    for r in rows:
+        k   = (r["day"], r["kind"], r["key"], r["key2"])
+        old = current.get(k) or {"n": 0, "ave_sum": 0}
+        new = dict(r, n=int(old["n"]) + r["n"], ave_sum=round(float(old["ave_sum"]) + r["ave_sum"], 2))
+        (upserts if new["n"] > 0 else zero).append(new)
+    for i in range(0, len(upserts), WRITE_BATCH):
+        supabase.table(TABLE).upsert(upserts[i:i + WRITE_BATCH], on_conflict="kind,key,key2,day").execute()
+    for r in zero:
+        (supabase.table(TABLE).delete().eq("kind", r["kind"]).eq("key", r["key"])
+         .eq("key2", r["key2"]).eq("day", r["day"]).execute())
+
+
+def apply(articles: list, sign: int) -> int:
+    """Somma (sign=+1) o sottrae (sign=-1) gli articoli dai rollup. Servono ROLLUP_COLS e `_clients`."""
+    rows = _rows(_deltas(articles, sign))
+    if not rows:
+        return 0
+    try:
+        for i in range(0, len(rows), WRITE_BATCH):
+            supabase.rpc("spiz_rollup_apply", {"p_rows": rows[i:i + WRITE_BATCH]}, idempotent=False).execute()
+    except Exception as e:
+        if "spiz_rollup_apply" not in str(e):
+            raise
+        _apply_python(rows)
+    return len(rows)
+
+
+def client_map(article_ids: list) -> dict:
+    """{article_id: [client_id, ...]} dall'indice delle citazioni."""
+    out = defaultdict(list)
+    for i in range(0, len(article_ids), IN_CHUNK):
+        res = (supabase.table(MENTIONS).select("article_id, client_id")
+               .in_("article_id", article_ids[i:i + IN_CHUNK]).execute())
+        for r in res.data or []:
+            out[str(r["article_id"])].append(r["client_id"])
+    return out
+
+
+def snapshot(article_ids: list = None, content_hashes: list = None) -> list:
+    """Stato attuale degli articoli (ROLLUP_COLS + `_clients`), da togliere prima di una modifica."""
+    col, values = ("id", article_ids) if article_ids is not None else ("content_hash", content_hashes)
+    rows = []
+    for i in range(0, len(values or []), IN_CHUNK):
+        rows += supabase.table("articles").select(ROLLUP_COLS).in_(col, values[i:i + IN_CHUNK]).execute().data or []
+    clients = client_map([r["id"] for r in rows])
+    for r in rows:
+        r["_clients"] = clients.get(str(r["id"]), [])
+    return rows
+
+
+def with_clients(articles: list, mention_rows: list) -> list:
+    by_article = defaultdict(list)
+    for m in mention_rows:
+        by_article[str(m["article_id"])].append(m["client_id"])
+    return [dict(a, _clients=by_article.get(str(a.get("id")), [])) for a in articles]
+
+
+def replace_client(client_id, articles: list) -> None:
+    """Riscrive i rollup di un cliente dopo il backfill delle sue citazioni."""
+    cid = str(client_id)
+    supabase.table(TABLE).delete().in_("kind", CLIENT_KINDS).eq("key", cid).execute()
+    client_keys = lambda a, _c: [k for k in keys_for(a, [cid]) if k[0] in CLIENT_KINDS]
+    rows = _rows(_deltas(articles, +1, keys_fn=client_keys))
+    for i in range(0, len(rows), WRITE_BATCH):
+        supabase.table(TABLE).upsert(rows[i:i + WRITE_BATCH], on_conflict="kind,key,key2,day").execute()
+
+
+def rebuild() -> int:
+    """Ricostruisce tutti i rollup da articoli e indice delle citazioni."""
+    t0 = time.perf_counter()
+    clients = defaultdict(list)
+    for m in bulk.iter_rows(MENTIONS, "article_id, client_id",
+                            order=[("article_id", False), ("client_id", False)]):
+        clients[str(m["article_id"])].append(m["client_id"])
+
+    totals = defaultdict(lambda: [0, 0.0])
+    n_articles = 0
+    for a in bulk.iter_rows("articles", ROLLUP_COLS):
+        a["_clients"] = clients.get(str(a["id"]), [])
+        for k, (n, ave) in _deltas([a], +1).items():
+            totals[k][0] += n
+            totals[k][1] += ave
+        n_articles += 1
+
+    supabase.table(TABLE).delete().neq("kind", "").execute()
+    rows = _rows(totals)
+    rows.append({"day": "1970-01-01", "kind": BUILT_KIND, "key": "", "key2": "", "n": n_articles, "ave_sum": 0})
+    for i in range(0, len(rows), WRITE_BATCH):
+        supabase.table(TABLE).upsert(rows[i:i + WRITE_BATCH], on_conflict="kind,key,key2,day").execute()
+    _ready.update(value=True, checked=time.time())
+    print(f"[ROLLUP] ricostruiti {len(rows)} rollup da {n_articles} articoli "
+          f"in {time.perf_counter() - t0:.1f}s")
+    return len(rows)
+
+
+# ══════════════════════════════════════════════════════════════════════
+# LETTURA
+# ══════════════════════════════════════════════════════════════════════
+
+def is_ready() -> bool:
+    """True se i rollup sono stati costruiti almeno una volta (riga _built)."""
+    if time.time() - _ready["checked"] < READY_TTL:
+        return _ready["value"]
+    try:
+        res = supabase.table(TABLE).select("n").eq("kind", BUILT_KIND).limit(1).execute()
+        value = bool(res.data)
+    except Exception:
+        value = False
+    _ready.update(value=value, checked=time.time())
+    return value
+
+
+def totals(kind: str, from_date: str, to_date: str, limit: int = None, key: str = None) -> list:
+    """[(key, key2, n, ave_sum), ...] sommati sul periodo, dal più frequente."""
+    if key is None:
+        try:
+            data = supabase.rpc("spiz_rollup_totals", {
+                "p_kind": kind, "p_from": from_date, "p_to": to_date, "p_limit": limit,
+            }).execute().data
+            if isinstance(data, list):
+                return [(k, k2, int(n), float(ave)) for k, k2, n, ave in data]
+        except Exception as e:
+            if "spiz_rollup_totals" not in str(e):
+                raise
+    acc = defaultdict(lambda: [0, 0.0])
+    for r in series(kind, from_date, to_date, key=key):
+        a = acc[(r["key"], r["key2"])]
+        a[0] += int(r["n"])
+        a[1] += float(r["ave_sum"])
+    out = sorted(((k, k2, n, ave) for (k, k2), (n, ave) in acc.items()), key=lambda x: (-x[2], x[0], x[1]))
+    return out[:limit] if limit else out
+
+
+def series(kind: str, from_date: str, to_date: str, key: str = None, keys: list = None):
+    """Righe giornaliere (day, key, key2, n, ave_sum) di una dimensione nel periodo."""
+    def where(q):
+        q = q.eq("kind", kind).gte("day", from_date).lte("day", to_date)
+        if key is not None:
+            q = q.eq("key", key)
+        if keys:
+            q = q.in_("key", keys)
+        return q
+    return bulk.iter_rows(TABLE, "day, key, key2, n, ave_sum", where=where,
+                          order=[("day", False), ("key", False), ("key2", False)])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Rollup giornalieri SPIZ")
+    ap.add_argument("--rebuild", action="store_true", help="ricostruisce tutta la tabella daily_rollup")
+    args = ap.parse_args()
+    if args.rebuild:
+        rebuild()
+    else:
+        ap.print_help()
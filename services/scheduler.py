@@ -0,0 +1,306 @@
+"""
+services/scheduler.py — Job pianificati con un solo leader
+Ogni processo (istanze autoscale, worker uvicorn, runner dedicato) prova
+a tenere il lease "scheduler" nella tabella scheduler_leases
+(sql/scheduler.sql): un UPDATE condizionale lo rinnova se è suo o lo
+prende se è scaduto. Solo il leader avvia APScheduler per i job a orario
+fisso (JOBS) e i cicli continui (LOOPS: polling delle sorgenti,
+classificazione delle menzioni, riallineamento dell'indice clienti);
+chi perde il lease li ferma. Prima di eseguire, ogni job prenota la riga
+(job, slot) in scheduler_runs: anche durante un cambio di leader lo
+stesso slot gira una volta sola, e la riga registra run id, durata ed
+esito. Anche i giri dei cicli che fanno lavoro (record_tick) finiscono in
+scheduler_runs, con l'istante di avvio come slot. Un leader che riprende
+il lease riavvia un ciclo solo quando il thread della leadership
+precedente è terminato.
+
+Così il monitoraggio e il traffico verso le fonti restano costanti con
+qualunque numero di istanze web. SPIZ_SCHEDULER=0 esclude un processo
+dall'elezione (per esempio i web quando gira il runner dedicato):
+
+    python -m services.scheduler
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from services.database import supabase
+from services import metrics
+
+LEASES_TABLE   = "scheduler_leases"
+RUNS_TABLE     = "scheduler_runs"
+LEASE_NAME     = "scheduler"
+ENABLED        = os.getenv("SPIZ_SCHEDULER", "1") != "0"
+LEASE_SECONDS  = int(os.getenv("SPIZ_SCHEDULER_LEASE", "60"))
+RENEW_SECONDS  = max(1, LEASE_SECONDS // 3)
+CATCHUP_HOURS  = float(os.getenv("SPIZ_SCHEDULER_CATCHUP_HOURS", "6"))   # slot persi recuperati dal nuovo leader
+HOLDER         = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# job → orario giornaliero (ora locale) e funzione "modulo:nome", importata solo all'esecuzione
+JOBS: dict = {}
+
+# cicli continui del leader → funzione "modulo:nome" che riceve un threading.Event di stop
+LOOPS = {
+    "poller":     "services.poller:poll_loop",
+    "enrichment": "services.enrichment:enrich_loop",
+    "mentions":   "services.mentions:reconcile_loop",
+}
+
+metrics.describe("spiz_scheduler_job_seconds", "Durata dei job pianificati per job ed esito")
+
+_lock  = threading.Lock()
+_state = {"started": False, "leader": False, "until": 0.0, "apscheduler": None, "stop": None, "threads": {}}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# LEASE
+# ══════════════════════════════════════════════════════════════════════
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def try_lease() -> bool:
+    """Rinnova o prende il lease; True se questo processo è il leader fino a LEASE_SECONDS da ora."""
+    now     = _now()
+    expires = (now + timedelta(seconds=LEASE_SECONDS)).isoformat()
+    values  = {"holder": HOLDER, "expires_at": expires, "updated_at": now.isoformat()}
+    # un solo UPDATE condizionale: atomico anche con più istanze in gara
+    res = (supabase.table(LEASES_TABLE).update(values).eq("name", LEASE_NAME)
+           .or_(f'holder.eq."{HOLDER}",expires_at.lt."{now.isoformat()}"').execute())
+    if not res.data:
+        # prima esecuzione: la riga non esiste ancora (se esiste, ignore_duplicates non la tocca)
+        res = supabase.table(LEASES_TABLE).upsert(
+            dict(values, name=LEASE_NAME), on_conflict="name", ignore_duplicates=True,
+        ).execute()
+    if res.data:
+        with _lock:
+            _state["until"] = time.time() + LEASE_SECONDS
+        return True
+    return False
+
+
+def release() -> None:
+    """Cede il lease (allo shutdown): un'altra istanza subentra al suo prossimo rinnovo."""
+    if not _state["leader"]:
+        return
+    try:
+        supabase.table(LEASES_TABLE).update({"expires_at": _now().isoformat()}) \
+            .eq("name", LEASE_NAME).eq("holder", HOLDER).execute()
+    except Exception as e:
+        print(f"[SCHEDULER] lease non rilasciato: {e}")
+    _set_leader(False)
+
+
+def is_leader() -> bool:
+    return _state["leader"] and time.time() < _state["until"]
+
+
+def _start_loops() -> list:
+    """Avvia i cicli senza un thread vivo; restituisce quelli che aspettano la fine del thread precedente."""
+    waiting = []
+    for name, ref in LOOPS.items():
+        thread = _state["threads"].get(name)
+        if thread is not None and thread.is_alive():
+            if thread.stop is not _state["stop"]:
+                waiting.append(name)
+            continue
+        thread = threading.Thread(target=_import(ref), args=(_state["stop"],), daemon=True, name=f"scheduler-{name}")
+        thread.stop = _state["stop"]
+        thread.start()
+        _state["threads"][name] = thread
+    return waiting
+
+
+def _set_leader(leader: bool) -> None:
+    with _lock:
+        if leader == _state["leader"]:
+            if leader:
+                _start_loops()
+            return
+        if leader:
+            if JOBS:
+                from apscheduler.schedulers.background import BackgroundScheduler
+                sched = BackgroundScheduler()
+                for name, job in JOBS.items():
+                    sched.add_job(run_job, "cron", args=[name], hour=job["hour"], minute=job["minute"], id=name)
+                sched.start()
+                _state["apscheduler"] = sched
+            _state["stop"] = threading.Event()
+            waiting = _start_loops()
+            if waiting:
+                print(f"[SCHEDULER] cicli ancora in chiusura, ripartono al prossimo rinnovo: {', '.join(waiting)}")
+        else:
+            if _state["apscheduler"] is not None:
+                _state["apscheduler"].shutdown(wait=False)
+                _state["apscheduler"] = None
+            if _state["stop"] is not None:
+                _state["stop"].set()
+                _state["stop"] = None
+        _state["leader"] = leader
+    print(f"[SCHEDULER] {HOLDER}: {'leader' if leader else 'non più leader'}")
+
+
+# ══════════════════════════════════════════════════════════════════════
+# ESECUZIONI
+# ══════════════════════════════════════════════════════════════════════
+
+def last_slot(name: str, now: datetime = None) -> datetime:
+    """L'ultimo orario previsto (ora locale) non successivo a `now`."""
+    job  = JOBS[name]
+    now  = now or datetime.now()
+    slot = now.replace(hour=job["hour"], minute=job["minute"], second=0, microsecond=0)
+    return slot if slot <= now else slot - timedelta(days=1)
+
+
+def _claim(name: str, slot: str) -> str | None:
+    """Prenota (job, slot): run id se questo processo lo esegue, None se è già stato preso."""
+    run_id = str(uuid.uuid4())
+    res = supabase.table(RUNS_TABLE).upsert({
+        "id": run_id, "job": name, "slot": slot, "holder": HOLDER,
+        "status": "running", "started_at": _now().isoformat(),
+    }, on_conflict="job,slot", ignore_duplicates=True).execute()
+    return run_id if res.data else None
+
+
+def _jsonable(result):
+    return json.loads(json.dumps(result, default=str)) if result is not None else None
+
+
+def _import(ref: str):
+    module, _, attr = ref.partition(":")
+    return getattr(__import__(module, fromlist=[attr]), attr)
+
+
+def run_job(name: str, slot: datetime = None) -> dict:
+    """Esegue il job per il suo slot se questo processo è leader e lo slot è libero."""
+    if not is_leader():
+        return {"status": "skipped", "reason": "not_leader"}
+    slot_key = (slot or last_slot(name)).strftime("%Y-%m-%dT%H:%M")
+    run_id   = _claim(name, slot_key)
+    if not run_id:
+        print(f"[SCHEDULER] {name} {slot_key}: già eseguito")
+        return {"status": "skipped", "reason": "already_run"}
+
+    print(f"[SCHEDULER] {name} {slot_key} avviato (run {run_id})")
+    t0 = time.perf_counter()
+    status, result, error = "ok", None, None
+    try:
+        result = _import(JOBS[name]["func"])()
+    except Exception as e:
+        status, error = "error", str(e)
+        print(f"[SCHEDULER] {name} fallito: {e}")
+    duration = time.perf_counter() - t0
+    metrics.observe("spiz_scheduler_job_seconds", duration, {"job": name, "status": status})
+    try:
+        supabase.table(RUNS_TABLE).update({
+            "status": status, "finished_at": _now().isoformat(), "duration_s": round(duration, 3),
+            "result": _jsonable(result), "error": error,
+        }).eq("id", run_id).execute()
+    except Exception as e:
+        print(f"[SCHEDULER] esito di {run_id} non registrato: {e}")
+    print(f"[SCHEDULER] {name} {slot_key}: {status} in {duration:.1f}s")
+    return {"status": status, "run_id": run_id, "duration_s": round(duration, 3)}
+
+
+def record_tick(name: str, func, idle=None):
+    """
+    Esegue un giro di un ciclo del leader e lo registra in scheduler_runs
+    (run id, durata, esito). I giri riusciti per cui idle(risultato) è vero
+    non lasciano righe; un'eccezione viene registrata e rilanciata.
+    """
+    run_id, started = str(uuid.uuid4()), _now()
+    t0 = time.perf_counter()
+    status, result, error = "ok", None, None
+    try:
+        result = func()
+    except Exception as e:
+        status, error = "error", str(e)
+        raise
+    finally:
+        duration = time.perf_counter() - t0
+        if status == "error" or not (idle and idle(result)):
+            metrics.observe("spiz_scheduler_job_seconds", duration, {"job": name, "status": status})
+            try:
+                supabase.table(RUNS_TABLE).insert({
+                    "id": run_id, "job": name, "slot": started.isoformat(timespec="milliseconds"),
+                    "holder": HOLDER, "status": status, "started_at": started.isoformat(),
+                    "finished_at": _now().isoformat(), "duration_s": round(duration, 3),
+                    "result": _jsonable(result), "error": error,
+                }).execute()
+            except Exception as e:
+                print(f"[SCHEDULER] giro {name} {run_id} non registrato: {e}")
+    return result
+
+
+def _catch_up() -> None:
+    """Il nuovo leader recupera gli slot recenti rimasti senza esecuzione (istanze spente all'orario)."""
+    now = datetime.now()
+    for name in JOBS:
+        slot = last_slot(name, now)
+        if now - slot <= timedelta(hours=CATCHUP_HOURS):
+            threading.Thread(target=run_job, args=(name, slot), daemon=True, name=f"scheduler-{name}").start()
+
+
+def recent_runs(limit: int = 20) -> list:
+    return supabase.table(RUNS_TABLE).select("*").order("started_at", desc=True).limit(limit).execute().data or []
+
+
+def status() -> dict:
+    return {"enabled": ENABLED, "holder": HOLDER, "leader": is_leader(),
+            "jobs": {n: f"{j['hour']:02d}:{j['minute']:02d}" for n, j in JOBS.items()},
+            "loops": list(LOOPS)}
+
+
+# ══════════════════════════════════════════════════════════════════════
+# CICLO DI ELEZIONE
+# ══════════════════════════════════════════════════════════════════════
+
+def _tick() -> None:
+    try:
+        leader = try_lease()
+    except Exception as e:
+        print(f"[SCHEDULER] lease non disponibile: {e}")
+        leader = False
+    was_leader = _state["leader"]
+    try:
+        _set_leader(leader)
+    except Exception as e:
+        print(f"[SCHEDULER] scheduler non avviato: {e}")
+        return
+    if leader and not was_leader:
+        _catch_up()
+
+
+def start() -> None:
+    """Thread di elezione: rinnova il lease ogni RENEW_SECONDS."""
+    if not ENABLED:
+        print("[SCHEDULER] disattivato in questo processo (SPIZ_SCHEDULER=0)")
+        return
+    with _lock:
+        if _state["started"]:
+            return
+        _state["started"] = True
+
+    def _loop():
+        while True:
+            _tick()
+            time.sleep(RENEW_SECONDS)
+
+    threading.Thread(target=_loop, daemon=True, name="scheduler-lease").start()
+    print(f"[SCHEDULER] candidato leader {HOLDER} (lease {LEASE_SECONDS}s)")
+
+
+if __name__ == "__main__":
+    print(f"[SCHEDULER] runner dedicato {HOLDER}")
+    try:
+        while True:
+            _tick()
+            time.sleep(RENEW_SECONDS)
+    except KeyboardInterrupt:
+        release()
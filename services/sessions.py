@@ -0,0 +1,242 @@
+"""
+services/sessions.py — Memoria conversazionale lato server
+Le sessioni chat vivono nell'archivio locale, indicizzate per session_id.
+I turni più vecchi vengono compattati in un riassunto progressivo entro
+un budget di token; gli articoli già citati restano come riferimenti
+(id) invece di essere rispediti come testo al modello.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from services.local_store import connect, register_schema
+
+SUMMARY_TOKENS  = int(os.getenv("SPIZ_SESSION_SUMMARY_TOKENS", "600"))
+RECENT_TOKENS   = int(os.getenv("SPIZ_SESSION_RECENT_TOKENS", "3000"))
+TURN_MAX_TOKENS = int(os.getenv("SPIZ_SESSION_TURN_TOKENS", "500"))
+MAX_REFS        = 200
+SESSION_TTL     = 30 * 86400
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id         TEXT PRIMARY KEY,
+    summary    TEXT NOT NULL DEFAULT '',
+    refs       TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_turns (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    role        TEXT NOT NULL,
+    content     TEXT NOT NULL,
+    tokens      INTEGER NOT NULL,
+    article_ids TEXT NOT NULL DEFAULT '[]',
+    compacted   INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns(session_id, compacted, id);
+""")
+
+_compacting: set = set()
+_compact_lock = threading.Lock()
+
+
+# ══════════════════════════════════════════════════════════════════════
+# TOKEN
+# ══════════════════════════════════════════════════════════════════════
+
+_encoder = None
+
+def count_tokens(text: str) -> int:
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = False
+    if not _encoder:
+        return len(text or "") // 4 + 1
+    return len(_encoder.encode(text or "", disallowed_special=()))
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(" ", 1)[0] + " […]"
+
+
+# ══════════════════════════════════════════════════════════════════════
+# LETTURA / SCRITTURA
+# ══════════════════════════════════════════════════════════════════════
+
+def valid_id(session_id: str) -> bool:
+    """True se session_id è un UUID in forma canonica (generato dal browser con crypto.randomUUID)."""
+    try:
+        return str(uuid.UUID(session_id)) == session_id.lower()
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+def _ensure(conn, session_id: str) -> None:
+    now = time.time()
+    conn.execute(
+        "INSERT OR IGNORE INTO chat_sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+        (session_id, now, now),
+    )
+
+
+def has_turns(session_id: str) -> bool:
+    row = connect().execute(
+        "SELECT 1 FROM chat_turns WHERE session_id = ? LIMIT 1", (session_id,)
+    ).fetchone()
+    return row is not None
+
+
+def append_turn(session_id: str, role: str, content: str, article_ids: list = None) -> None:
+    conn = connect()
+    _ensure(conn, session_id)
+    conn.execute(
+        "INSERT INTO chat_turns (session_id, role, content, tokens, article_ids, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (session_id, role, content, count_tokens(content),
+         json.dumps([str(i) for i in (article_ids or [])]), time.time()),
+    )
+    conn.execute("UPDATE chat_sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+
+
+def import_history(session_id: str, history: list) -> None:
+    """Importa la history inviata dal client per sessioni nate prima della memoria server."""
+    for msg in history or []:
+        if msg.get("role") in ("user", "assistant") and msg.get("content"):
+            append_turn(session_id, msg["role"], msg["content"])
+
+
+def cited_articles(session_id: str) -> list:
+    row = connect().execute("SELECT refs FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+    return json.loads(row["refs"]) if row else []
+
+
+def build_history(session_id: str) -> list:
+    """
+    Messaggi da anteporre alla domanda: riassunto + riferimenti come messaggio
+    di sistema, poi i turni recenti non compattati (quelli lunghi troncati).
+    """
+    conn = connect()
+    sess = conn.execute("SELECT summary, refs FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+    if not sess:
+        return []
+
+    messages = []
+    refs = json.loads(sess["refs"])
+    if sess["summary"] or refs:
+        memo = "MEMORIA DELLA CONVERSAZIONE\n"
+        if sess["summary"]:
+            memo += f"Riassunto dei turni precedenti:\n{sess['summary']}\n"
+        if refs:
+            memo += f"Articoli già citati (id): {', '.join(refs[-50:])}\n"
+        messages.append({"role": "system", "content": memo})
+
+    for t in conn.execute(
+        "SELECT role, content, article_ids FROM chat_turns "
+        "WHERE session_id = ? AND compacted = 0 ORDER BY id", (session_id,)
+    ):
+        content = _clip(t["content"], TURN_MAX_TOKENS)
+        ids = json.loads(t["article_ids"])
+        if content != t["content"] and ids:
+            content += f"\n[Risposta completa già consegnata; articoli usati: {len(ids)}]"
+        messages.append({"role": t["role"], "content": content})
+    return messages
+
+
+# ══════════════════════════════════════════════════════════════════════
+# COMPATTAZIONE
+# ══════════════════════════════════════════════════════════════════════
+
+def compact(session_id: str, summarize) -> bool:
+    """
+    Se i turni attivi superano RECENT_TOKENS, riassume i più vecchi con
+    summarize(riassunto_precedente, turni, max_tokens) -> str e li marca
+    come compattati. Gli id articolo citati confluiscono nei riferimenti.
+    """
+    conn  = connect()
+    turns = conn.execute(
+        "SELECT id, role, content, tokens, article_ids FROM chat_turns "
+        "WHERE session_id = ? AND compacted = 0 ORDER BY id", (session_id,)
+    ).fetchall()
+    total = sum(min(t["tokens"], TURN_MAX_TOKENS) for t in turns)
+    if total <= RECENT_TOKENS:
+        return False
+
+    # Compatta fino a scendere a metà budget, lasciando sempre l'ultimo scambio
+    old, kept = [], total
+    for t in turns[:-2]:
+        if kept <= RECENT_TOKENS // 2:
+            break
+        old.append(t)
+        kept -= min(t["tokens"], TURN_MAX_TOKENS)
+    if not old:
+        return False
+
+    sess = conn.execute("SELECT summary, refs FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+    summary = summarize(
+        sess["summary"],
+        [{"role": t["role"], "content": _clip(t["content"], TURN_MAX_TOKENS * 2)} for t in old],
+        SUMMARY_TOKENS,
+    )
+    summary = _clip(summary or sess["summary"], SUMMARY_TOKENS)
+
+    refs = json.loads(sess["refs"])
+    for t in old:
+        for aid in json.loads(t["article_ids"]):
+            if aid in refs:
+                refs.remove(aid)
+            refs.append(aid)
+    refs = refs[-MAX_REFS:]
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE chat_sessions SET summary = ?, refs = ?, updated_at = ? WHERE id = ?",
+            (summary, json.dumps(refs), time.time(), session_id),
+        )
+        conn.executemany("UPDATE chat_turns SET compacted = 1 WHERE id = ?", [(t["id"],) for t in old])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
+
+def compact_async(session_id: str, summarize) -> None:
+    """Compattazione in background: la risposta all'utente non la aspetta."""
+    with _compact_lock:
+        if session_id in _compacting:
+            return
+        _compacting.add(session_id)
+
+    def _run():
+        try:
+            compact(session_id, summarize)
+            purge_expired()
+        except Exception as e:
+            print(f"[SESSION] compattazione {session_id} fallita: {e}")
+        finally:
+            with _compact_lock:
+                _compacting.discard(session_id)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def purge_expired() -> None:
+    conn   = connect()
+    cutoff = time.time() - SESSION_TTL
+    conn.execute(
+        "DELETE FROM chat_turns WHERE session_id IN (SELECT id FROM chat_sessions WHERE updated_at < ?)",
+        (cutoff,),
+    )
+    conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,))
@@ -0,0 +1,109 @@
+"""
+services/stats.py — Statistiche della dashboard
+Conteggi e raggruppamenti (testata, giornalista, tone, macrosettore,
+giorno) letti dallo snapshot DuckDB (services/analytics.py) se attivo,
+poi dai rollup giornalieri (services/rollups.py) quando sono
+costruiti, altrimenti calcolati dal database con una sola chiamata alle
+funzioni SQL di sql/dashboard_stats.sql. Se anche queste mancano
+(stand-in locali, database non ancora migrato) si ripiega sul calcolo in
+Python sulle righe lette con services/bulk.py.
+"""
+
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from services.database import supabase
+from services import bulk, rollups, db, repository, analytics
+
+DIMENSIONS  = ("testata", "giornalista", "tone", "macrosettore", "day")
+RPC_RETRY_S = 300    # dopo un errore, riprova la funzione SQL tra 5 minuti
+
+_rpc_down: dict = {}
+
+
+def _rpc(name: str, params: dict):
+    """Risultato della funzione SQL, o None se non disponibile."""
+    if time.time() < _rpc_down.get(name, 0):
+        return None
+    try:
+        data = supabase.rpc(name, params).execute().data
+        _rpc_down.pop(name, None)
+        return data
+    except Exception as e:
+        print(f"[STATS] {name} non disponibile, uso il calcolo in Python: {e}")
+        _rpc_down[name] = time.time() + RPC_RETRY_S
+        return None
+
+
+def dashboard_counts(today: date = None) -> dict:
+    """Articoli totali, di oggi, degli ultimi 7 e 30 giorni."""
+    today = today or date.today()
+    if analytics.ready():
+        try:
+            return analytics.dashboard_counts(today)
+        except Exception as e:
+            print(f"[STATS] snapshot analitico non disponibile: {e}")
+    if rollups.is_ready():
+        days = {r["day"]: int(r["n"]) for r in rollups.series("all", "1900-01-01", today.isoformat())}
+        since = lambda n: sum(v for d, v in days.items() if str(d) >= (today - timedelta(days=n)).isoformat())
+        return {"totale": sum(days.values()), "oggi": since(0), "settimana": since(7), "mese": since(30)}
+
+    data  = _rpc("spiz_dashboard_counts", {"p_today": today.isoformat()})
+    if isinstance(data, dict):
+        return {k: int(data.get(k) or 0) for k in ("totale", "oggi", "settimana", "mese")}
+
+    return db.run_sync(repository.article_counts(today))
+
+
+def grouped_counts(from_date: str, to_date: str, dims=DIMENSIONS, limit: int = 100) -> dict:
+    """
+    {"total": n, <dimensione>: [(chiave, n), ...]} per gli articoli nel periodo,
+    dal più frequente (per "day" in ordine di data), al più `limit` voci.
+    """
+    dims = [d for d in dims if d in DIMENSIONS]
+    if analytics.ready():
+        try:
+            return analytics.grouped_counts(from_date, to_date, dims, limit)
+        except Exception as e:
+            print(f"[STATS] snapshot analitico non disponibile: {e}")
+    if rollups.is_ready():
+        return _grouped_rollups(from_date, to_date, dims, limit)
+
+    data = _rpc("spiz_grouped_counts", {"p_from": from_date, "p_to": to_date, "p_dims": dims, "p_limit": limit})
+    if isinstance(data, dict):
+        out = {"total": int(data.get("total") or 0)}
+        for d in dims:
+            out[d] = [(k, int(n)) for k, n in (data.get(d) or [])]
+        return out
+    return _grouped_python(from_date, to_date, dims, limit)
+
+
+def _grouped_rollups(from_date: str, to_date: str, dims: list, limit: int) -> dict:
+    days = [(str(r["day"]), int(r["n"])) for r in rollups.series("all", from_date, to_date)]
+    out  = {"total": sum(n for _, n in days)}
+    for d in dims:
+        if d == "day":
+            out[d] = days
+        else:
+            out[d] = [(k, n) for k, _, n, _ in rollups.totals(d, from_date, to_date, limit=limit)]
+    return out
+
+
+def _grouped_python(from_date: str, to_date: str, dims: list, limit: int) -> dict:
+    counters = {d: Counter() for d in dims}
+    total = 0
+    for a in bulk.iter_rows("articles", "id, testata, giornalista, tone, macrosettori, data",
+                            where=lambda q: q.gte("data", from_date).lte("data", to_date)):
+        total += 1
+        for d, c in counters.items():
+            if d == "macrosettore":
+                c.update(m.strip() for m in (a.get("macrosettori") or "").split(",") if m.strip())
+            elif d == "day":
+                c[a.get("data")] += 1
+            elif a.get(d):
+                c[a[d]] += 1
+    out = {"total": total}
+    for d, c in counters.items():
+        out[d] = sorted(c.items()) if d == "day" else c.most_common(limit)
+    return out
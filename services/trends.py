@@ -0,0 +1,157 @@
+"""
+services/trends.py — Serie temporali per /api/trends
+Volume di articoli, AVE, distribuzione del tone e del rischio
+reputazionale per giorno, settimana o mese, di un cliente, una testata,
+un topic o dell'intero archivio. Le serie si leggono dai rollup
+giornalieri (services/rollups.py): un anno di dati sono poche centinaia
+di righe per dimensione invece di una scansione degli articoli. Finché i
+rollup non sono costruiti si ricalcolano dagli articoli del periodo.
+
+Il formato è colonnare: un array di bucket e, per ogni misura, un array
+parallelo di valori, pronto per le librerie di grafici.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from services import bulk, rollups
+
+DIMENSIONS = ("all", "client", "testata", "topic")
+BUCKETS    = ("day", "week", "month")
+MAX_DAYS   = 3 * 366
+
+
+def bucket_of(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_range(from_date: date, to_date: date, bucket: str) -> list:
+    """Tutti i bucket del periodo, anche quelli senza articoli."""
+    out, cur = [], bucket_of(from_date, bucket)
+    while cur <= to_date:
+        out.append(cur)
+        if bucket == "month":
+            cur = (cur.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            cur += timedelta(days=7 if bucket == "week" else 1)
+    return out
+
+
+def _kinds(dimension: str) -> tuple:
+    """(kind del volume, kind del tone, kind del rischio) nei rollup."""
+    if dimension == "all":
+        return "all", "tone", "risk"
+    return dimension, dimension + ".tone", dimension + ".risk"
+
+
+def _daily_rollups(dimension: str, key: str, from_date: str, to_date: str) -> dict:
+    """{kind: [(day, valore, n, ave_sum), ...]} letti dai rollup, in una sola lettura a pagine."""
+    kinds = _kinds(dimension)
+    value = "key" if dimension == "all" else "key2"
+
+    def where(q):
+        q = q.in_("kind", list(kinds)).gte("day", from_date).lte("day", to_date)
+        return q if dimension == "all" else q.eq("key", key)
+
+    out = {kind: [] for kind in kinds}
+    for r in bulk.iter_rows(rollups.TABLE, "day, kind, key, key2, n, ave_sum", where=where,
+                            order=[("kind", False), ("day", False), ("key", False), ("key2", False)]):
+        out[r["kind"]].append((str(r["day"])[:10], r[value], int(r["n"]), float(r["ave_sum"])))
+    return out
+
+
+def _daily_articles(dimension: str, key: str, from_date: str, to_date: str) -> dict:
+    """Come _daily_rollups, ma calcolato dagli articoli (rollup non ancora costruiti)."""
+    where = lambda q: q.gte("data", from_date).lte("data", to_date)
+    if dimension == "client":
+        ids = [r["article_id"] for r in bulk.iter_rows(
+            rollups.MENTIONS, "article_id", order=[("article_id", False)],
+            where=lambda q: where(q).eq("client_id", key))]
+        articles = [dict(a, _clients=[key]) for i in range(0, len(ids), rollups.IN_CHUNK)
+                    for a in bulk.iter_rows("articles", rollups.ROLLUP_COLS,
+                                            where=lambda q, c=ids[i:i + rollups.IN_CHUNK]: q.in_("id", c))]
+    elif dimension == "all":
+        articles = bulk.iter_rows("articles", rollups.ROLLUP_COLS, where=where)
+    else:
+        field = "dominant_topic" if dimension == "topic" else dimension
+        articles = bulk.iter_rows("articles", rollups.ROLLUP_COLS, where=lambda q: where(q).eq(field, key))
+
+    kinds = _kinds(dimension)
+    out   = {kind: [] for kind in kinds}
+    for (day, kind, k, k2), (n, ave) in rollups._deltas(list(articles), +1).items():
+        if kind not in out or not from_date <= day <= to_date:
+            continue
+        if dimension == "all":
+            out[kind].append((day, k, n, ave))
+        elif k == key:
+            out[kind].append((day, k2, n, ave))
+    return out
+
+
+def trends(dimension: str, key: str, from_date: str, to_date: str, bucket: str = "day") -> dict:
+    """
+    Serie colonnari del periodo:
+        {"buckets": [...], "volume": [...], "ave": [...],
+         "tone": {valore: [...]}, "risk": {valore: [...]}}
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimensione non valida: {dimension} (ammesse: {', '.join(DIMENSIONS)})")
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket non valido: {bucket} (ammessi: {', '.join(BUCKETS)})")
+    if dimension != "all" and not key:
+        raise ValueError(f"serve la chiave per la dimensione {dimension}")
+    start, end = date.fromisoformat(from_date), date.fromisoformat(to_date)
+    if end < start or (end - start).days > MAX_DAYS:
+        raise ValueError(f"periodo non valido (al più {MAX_DAYS} giorni)")
+
+    source = "rollup" if rollups.is_ready() else "articles"
+    daily  = (_daily_rollups if source == "rollup" else _daily_articles)(dimension, key, from_date, to_date)
+
+    buckets = bucket_range(start, end, bucket)
+    index   = {b.isoformat(): i for i, b in enumerate(buckets)}
+    slot    = lambda day: index[bucket_of(date.fromisoformat(day), bucket).isoformat()]
+
+    volume_kind, tone_kind, risk_kind = _kinds(dimension)
+    volume, ave = [0] * len(buckets), [0.0] * len(buckets)
+    for day, _, n, s in daily[volume_kind]:
+        i = slot(day)
+        volume[i] += n
+        ave[i]    += s
+
+    def split(rows):
+        out = defaultdict(lambda: [0] * len(buckets))
+        for day, value, n, _ in rows:
+            out[value][slot(day)] += n
+        return dict(sorted(out.items()))
+
+    return {
+        "dimension": dimension,
+        "key":       key if dimension != "all" else None,
+        "bucket":    bucket,
+        "from":      from_date,
+        "to":        to_date,
+        "source":    source,
+        "buckets":   list(index),
+        "volume":    volume,
+        "ave":       [round(v, 2) for v in ave],
+        "tone":      split(daily[tone_kind]),
+        "risk":      split(daily[risk_kind]),
+    }
+
+
+def to_rows(series: dict) -> list:
+    """Da colonnare a una riga per bucket (format=rows)."""
+    rows = []
+    for i, b in enumerate(series["buckets"]):
+        rows.append({
+            "bucket": b,
+            "volume": series["volume"][i],
+            "ave":    series["ave"][i],
+            "tone":   {k: v[i] for k, v in series["tone"].items() if v[i]},
+            "risk":   {k: v[i] for k, v in series["risk"].items() if v[i]},
+        })
+    return rows
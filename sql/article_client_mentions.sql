@@ -0,0 +1,29 @@
+-- Indice articolo → cliente mantenuto da services/mentions.py.
+-- Da eseguire una volta nello SQL editor di Supabase, poi:
+--     python -m services.mentions --all
+-- per il backfill iniziale. I tipi delle chiavi seguono articles.id e clients.id.
+
+create table if not exists article_client_mentions (
+    article_id       bigint not null references articles(id) on delete cascade,
+    client_id        uuid   not null references clients(id)  on delete cascade,
+    data             date   not null,                 -- copia di articles.data
+    matched_keywords text   not null default '',
+    created_at       timestamptz not null default now(),
+    primary key (article_id, client_id)
+);
+
+create index if not exists article_client_mentions_client_data
+    on article_client_mentions (client_id, data desc, article_id desc);
+
+create index if not exists article_client_mentions_data
+    on article_client_mentions (data);
+
+-- Keyword con cui è stato costruito l'indice di ogni cliente: se non
+-- coincidono con clients.keywords l'indice non è pronto e gli endpoint
+-- ripiegano sulla scansione.
+create table if not exists client_mention_index (
+    client_id  uuid primary key references clients(id) on delete cascade,
+    keywords   text not null default '',
+    articles   integer not null default 0,
+    indexed_at timestamptz not null default now()
+);
@@ -0,0 +1,57 @@
+-- Rollup giornalieri mantenuti da services/rollups.py.
+-- Da eseguire nello SQL editor di Supabase, poi:
+--     python -m services.rollups --rebuild
+-- Ogni riga è (giorno, dimensione, chiave[, chiave secondaria]) → numero
+-- di articoli e somma AVE. Dimensioni (kind): all, testata, giornalista,
+-- tone, topic, macrosettore, client, giornalista.testata,
+-- giornalista.macrosettore. La riga kind = '_built' segna l'ultimo rebuild.
+
+create table if not exists daily_rollup (
+    day     date    not null,
+    kind    text    not null,
+    key     text    not null,
+    key2    text    not null default '',
+    n       integer not null default 0,
+    ave_sum numeric not null default 0,
+    primary key (kind, key, key2, day)
+);
+
+create index if not exists daily_rollup_kind_day on daily_rollup (kind, day);
+
+-- Applica variazioni (+/-) in modo atomico: p_rows = [{day, kind, key, key2, n, ave_sum}, ...]
+create or replace function spiz_rollup_apply(p_rows json)
+returns void
+language sql as $$
+    insert into daily_rollup as d (day, kind, key, key2, n, ave_sum)
+    select (r->>'day')::date, r->>'kind', r->>'key', coalesce(r->>'key2', ''),
+           (r->>'n')::integer, (r->>'ave_sum')::numeric
+    from json_array_elements(p_rows) r
+    on conflict (kind, key, key2, day) do update
+        set n       = d.n + excluded.n,
+            ave_sum = d.ave_sum + excluded.ave_sum;
+
+    delete from daily_rollup d
+    using json_array_elements(p_rows) r
+    where d.kind = r->>'kind' and d.key = r->>'key' and d.key2 = coalesce(r->>'key2', '')
+      and d.day = (r->>'day')::date and d.n <= 0;
+$$;
+
+-- Totali per chiave nel periodo: [[key, key2, n, ave_sum], ...] dal più frequente
+create or replace function spiz_rollup_totals(
+    p_kind  text,
+    p_from  date,
+    p_to    date,
+    p_limit integer default null
+)
+returns json
+language sql stable as $$
+    select coalesce(json_agg(json_build_array(key, key2, n, ave_sum) order by n desc, key, key2), '[]'::json)
+    from (
+        select key, key2, sum(n)::integer n, sum(ave_sum) ave_sum
+        from daily_rollup
+        where kind = p_kind and day between p_from and p_to
+        group by key, key2
+        order by 3 desc, 1, 2
+        limit p_limit
+    ) t;
+$$;
@@ -0,0 +1,59 @@
+-- Aggregati per la dashboard, chiamati da services/stats.py via rpc().
+-- Da eseguire nello SQL editor di Supabase. Senza queste funzioni (o con
+-- SPIZ_DB_BACKEND=memory) stats.py ripiega sul calcolo in Python.
+
+create index if not exists articles_data_idx on articles (data);
+
+-- Totale, oggi, ultimi 7 e 30 giorni in una sola scansione
+create or replace function spiz_dashboard_counts(p_today date default current_date)
+returns json
+language sql stable as $$
+    select json_build_object(
+        'totale',    count(*),
+        'oggi',      count(*) filter (where data = p_today),
+        'settimana', count(*) filter (where data >= p_today - 7),
+        'mese',      count(*) filter (where data >= p_today - 30)
+    )
+    from articles;
+$$;
+
+-- Conteggi raggruppati nel periodo: ogni dimensione è una lista [chiave, n]
+-- in ordine decrescente (per "day" in ordine di data), al più p_limit voci.
+create or replace function spiz_grouped_counts(
+    p_from  date,
+    p_to    date,
+    p_dims  text[]  default array['testata', 'giornalista', 'tone', 'macrosettore', 'day'],
+    p_limit integer default 100
+)
+returns json
+language sql stable as $$
+    with a as (
+        select testata, giornalista, tone, macrosettori, data
+        from articles
+        where data between p_from and p_to
+    )
+    select json_build_object(
+        'total', (select count(*) from a),
+        'testata', case when 'testata' = any(p_dims) then (
+            select coalesce(json_agg(json_build_array(k, n) order by n desc, k), '[]'::json)
+            from (select testata k, count(*) n from a where coalesce(testata, '') <> ''
+                  group by 1 order by 2 desc limit p_limit) t) end,
+        'giornalista', case when 'giornalista' = any(p_dims) then (
+            select coalesce(json_agg(json_build_array(k, n) order by n desc, k), '[]'::json)
+            from (select giornalista k, count(*) n from a where coalesce(giornalista, '') <> ''
+                  group by 1 order by 2 desc limit p_limit) t) end,
+        'tone', case when 'tone' = any(p_dims) then (
+            select coalesce(json_agg(json_build_array(k, n) order by n desc, k), '[]'::json)
+            from (select tone k, count(*) n from a where coalesce(tone, '') <> ''
+                  group by 1 order by 2 desc limit p_limit) t) end,
+        'macrosettore', case when 'macrosettore' = any(p_dims) then (
+            select coalesce(json_agg(json_build_array(k, n) order by n desc, k), '[]'::json)
+            from (select trim(m) k, count(*) n
+                  from a, unnest(string_to_array(a.macrosettori, ',')) m
+                  where trim(m) <> ''
+                  group by 1 order by 2 desc limit p_limit) t) end,
+        'day', case when 'day' = any(p_dims) then (
+            select coalesce(json_agg(json_build_array(k, n) order by k), '[]'::json)
+            from (select data k, count(*) n from a group by 1) t) end
+    );
+$$;
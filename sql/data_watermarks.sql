@@ -0,0 +1,12 @@
+-- Watermark dei dati, letti da services/http_cache.py per gli ETag degli
+-- endpoint JSON. Ogni scrittura (ingestion, modifiche, clienti, monitor)
+-- aggiorna la versione della sua tabella, e ogni refresh dello snapshot
+-- DuckDB quella di "analytics": finché non cambia, un polling con
+-- If-None-Match riceve 304. Senza questa tabella gli endpoint rispondono
+-- sempre per intero.
+
+create table if not exists data_watermarks (
+    name       text primary key,
+    version    bigint not null,
+    updated_at timestamptz not null default now()
+);
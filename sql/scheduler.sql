@@ -0,0 +1,31 @@
+-- Scheduler con un solo leader (services/scheduler.py).
+-- Ogni istanza web (o il runner dedicato `python -m services.scheduler`)
+-- prova a tenere il lease: solo chi lo tiene esegue i job. Ogni
+-- esecuzione prenota la riga (job, slot) in scheduler_runs prima di
+-- partire, quindi anche in un cambio di leader lo stesso slot gira una
+-- volta sola. Anche i giri dei cicli continui (poller, enrichment) che
+-- fanno lavoro hanno una riga, con l'istante di avvio come slot. Senza
+-- queste tabelle lo scheduler non parte.
+
+create table if not exists scheduler_leases (
+    name       text primary key,
+    holder     text not null,
+    expires_at timestamptz not null,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists scheduler_runs (
+    id          uuid primary key,
+    job         text not null,
+    slot        text not null,                 -- orario previsto (es. 2026-10-19T06:00) o avvio del giro
+    holder      text not null,
+    status      text not null,                 -- running | ok | error
+    started_at  timestamptz not null,
+    finished_at timestamptz,
+    duration_s  double precision,
+    result      jsonb,
+    error       text,
+    unique (job, slot)
+);
+
+create index if not exists scheduler_runs_started on scheduler_runs (started_at desc);
@@ -0,0 +1,20 @@
+-- Stato del polling adattivo per sorgente (services/poller.py).
+-- Una riga per monitored_sources.id: intervallo corrente, prossimo
+-- controllo, stima di voci nuove all'ora e boost manuale. Sta nel
+-- database (non nell'archivio locale) perché il boost arriva da
+-- qualunque istanza web e lo stato deve sopravvivere ai cambi di leader.
+
+create table if not exists source_polls (
+    source_id      text primary key,
+    interval_s     double precision not null,
+    next_at        timestamptz not null,
+    last_polled_at timestamptz,
+    last_new_at    timestamptz,
+    rate_per_hour  double precision not null default 0,   -- media mobile delle voci nuove
+    boost_until    timestamptz,
+    polls          integer not null default 0,
+    new_items      integer not null default 0,
+    last_error     text
+);
+
+create index if not exists source_polls_next on source_polls (next_at);